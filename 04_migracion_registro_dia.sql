@@ -0,0 +1,80 @@
+-- ============================================
+-- MIGRACIÓN REGISTRO: columna `dia` + índices compuestos
+-- TiempoCheck v3.2.x
+-- Compatible con MySQL 8.0
+-- ============================================
+-- Objetivo: que los filtros por día sean sargables.
+-- Antes: WHERE DATE(r.fecha) = :hoy  → no usa índices (full scan por usuario)
+-- Ahora: WHERE r.dia = :hoy          → rango sobre ix_registro_usuario_dia_dominio
+-- Consultas de todos los usuarios de un día (reconciliación de uso_intradia,
+-- huecos del boot catchup) → ix_registro_dia_usuario
+--
+-- `dia` es una columna generada STORED: MySQL la calcula en cada INSERT/UPDATE,
+-- los INSERT existentes no cambian (no deben listar `dia`).
+
+SELECT '🔍 INICIANDO MIGRACIÓN registro.dia ...' as '';
+
+-- Verificación previa
+SHOW CREATE TABLE registro\G
+SELECT COUNT(*) AS 'Filas en registro' FROM registro;
+
+-- ============================================
+-- PASO 1: columna generada `dia`
+-- ============================================
+-- Nota: ADD COLUMN ... STORED reconstruye la tabla (ALGORITHM=COPY).
+-- Ejecutar en ventana de mantenimiento si `registro` es grande.
+
+ALTER TABLE registro
+  ADD COLUMN dia DATE
+  GENERATED ALWAYS AS (DATE(COALESCE(fecha_hora, fecha))) STORED;
+
+-- ============================================
+-- PASO 2: índices compuestos
+-- ============================================
+
+ALTER TABLE registro
+  ADD INDEX ix_registro_usuario_dia_dominio (usuario_id, dia, dominio),
+  ADD INDEX ix_registro_usuario_fecha_hora (usuario_id, fecha_hora),
+  ADD INDEX ix_registro_dia_usuario (dia, usuario_id),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- El índice simple `usuario_id` queda cubierto por el prefijo de los nuevos
+-- índices, pero lo usa la FK fk_registro_usuario; se conserva.
+
+ANALYZE TABLE registro;
+
+-- ============================================
+-- VERIFICACIÓN
+-- ============================================
+
+SELECT '✅ registro migrada' as '';
+SHOW CREATE TABLE registro\G
+
+-- Debe mostrar key = ix_registro_usuario_dia_dominio, type = ref/range
+EXPLAIN
+SELECT SUM(r.tiempo)
+FROM registro r
+WHERE r.usuario_id = 1 AND r.dia = CURDATE();
+
+-- Sin usuario (reconciliación global): debe mostrar key = ix_registro_dia_usuario
+EXPLAIN
+SELECT r.usuario_id, SUM(r.tiempo)
+FROM registro r
+WHERE r.dia = CURDATE()
+GROUP BY r.usuario_id;
+
+-- Consistencia: ninguna fila con fecha y sin dia
+SELECT COUNT(*) AS 'Filas sin dia (debe ser 0)'
+FROM registro
+WHERE dia IS NULL AND (fecha IS NOT NULL OR fecha_hora IS NOT NULL);
+
+SELECT '🎉 ¡MIGRACIÓN COMPLETADA!' as '';
+
+-- ============================================
+-- ROLLBACK (manual)
+-- ============================================
+-- ALTER TABLE registro
+--   DROP INDEX ix_registro_usuario_dia_dominio,
+--   DROP INDEX ix_registro_usuario_fecha_hora,
+--   DROP INDEX ix_registro_dia_usuario,
+--   DROP COLUMN dia;
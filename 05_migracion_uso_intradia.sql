@@ -0,0 +1,56 @@
+-- ============================================
+-- MIGRACIÓN: tabla uso_intradia (totales del día en curso)
+-- TiempoCheck v3.2.x
+-- Compatible con MySQL 8.0
+-- ============================================
+-- La ingesta (app/services/ingesta_service.py) suma cada lote en esta tabla
+-- dentro de la misma transacción que el INSERT en `registro`.
+-- Los chequeos de límite leen <= 24 filas por la PK en vez de re-sumar `registro`.
+-- job_reconciliar_uso_intradia corrige cualquier desviación contra `registro`.
+
+SELECT '🔍 INICIANDO MIGRACIÓN uso_intradia ...' as '';
+
+CREATE TABLE IF NOT EXISTS uso_intradia (
+  usuario_id   INT NOT NULL,
+  dia          DATE NOT NULL,
+  categoria_id INT NOT NULL DEFAULT 0,      -- 0 = dominio sin categoría
+  hora         TINYINT UNSIGNED NOT NULL,   -- 0..23
+  segundos     BIGINT NOT NULL DEFAULT 0,
+  updated_at   DATETIME NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (usuario_id, dia, categoria_id, hora),
+  KEY ix_uso_intradia_dia (dia)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- Carga inicial del día en curso (requiere 04_migracion_registro_dia.sql)
+-- ============================================
+
+INSERT INTO uso_intradia (usuario_id, dia, categoria_id, hora, segundos)
+SELECT r.usuario_id, r.dia, COALESCE(dc.categoria_id, 0),
+       HOUR(COALESCE(r.fecha_hora, r.fecha)), SUM(r.tiempo)
+FROM registro r
+LEFT JOIN dominio_categoria dc
+  ON dc.usuario_id = r.usuario_id AND dc.dominio = r.dominio
+WHERE r.dia = CURDATE()
+GROUP BY r.usuario_id, r.dia, COALESCE(dc.categoria_id, 0), HOUR(COALESCE(r.fecha_hora, r.fecha))
+ON DUPLICATE KEY UPDATE segundos = VALUES(segundos);
+
+-- ============================================
+-- VERIFICACIÓN
+-- ============================================
+
+SELECT '✅ uso_intradia creada' as '';
+SHOW CREATE TABLE uso_intradia\G
+
+-- Debe mostrar key = PRIMARY, type = ref/range
+EXPLAIN
+SELECT SUM(segundos)
+FROM uso_intradia
+WHERE usuario_id = 1 AND dia = CURDATE() AND categoria_id = 1;
+
+SELECT '🎉 ¡MIGRACIÓN COMPLETADA!' as '';
+
+-- ============================================
+-- ROLLBACK (manual)
+-- ============================================
+-- DROP TABLE uso_intradia;
@@ -0,0 +1,34 @@
+-- ============================================
+-- MIGRACIÓN: tabla sched_etapa_completada (marcas del DAG nocturno)
+-- TiempoCheck v3.2.x
+-- Compatible con MySQL 8.0
+-- ============================================
+-- app/schedule/nocturno.py escribe una fila por (fecha, etapa, usuario) al
+-- terminar cada etapa. Al reanudar una noche interrumpida se omiten las etapas
+-- ya marcadas; duracion_ms alimenta el reporte de latencia por etapa.
+
+SELECT '🔍 INICIANDO MIGRACIÓN sched_etapa_completada ...' as '';
+
+CREATE TABLE IF NOT EXISTS sched_etapa_completada (
+  fecha         DATE NOT NULL,              -- día cerrado que procesa la noche
+  etapa         VARCHAR(40) NOT NULL,
+  usuario_id    INT NOT NULL,
+  completado_en DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  duracion_ms   INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (fecha, etapa, usuario_id),
+  KEY ix_sched_etapa_usuario (fecha, usuario_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- VERIFICACIÓN
+-- ============================================
+
+SELECT '✅ sched_etapa_completada creada' as '';
+SHOW CREATE TABLE sched_etapa_completada\G
+
+SELECT '🎉 ¡MIGRACIÓN COMPLETADA!' as '';
+
+-- ============================================
+-- ROLLBACK (manual)
+-- ============================================
+-- DROP TABLE sched_etapa_completada;
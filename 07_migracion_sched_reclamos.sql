@@ -0,0 +1,37 @@
+-- ============================================
+-- MIGRACIÓN: tabla sched_job_reclamo (un worker por disparo de job)
+-- TiempoCheck v3.2.x
+-- Compatible con MySQL 8.0
+-- ============================================
+-- Con varios workers de gunicorn cada uno tiene su BackgroundScheduler y todos
+-- disparan los mismos jobs. app/schedule/candados.py reclama cada disparo con
+-- INSERT IGNORE sobre (job_id, slot): solo el worker que inserta la fila lo ejecuta.
+-- Las filas de más de SCHED_RECLAMOS_DIAS días se purgan solas.
+
+SELECT '🔍 INICIANDO MIGRACIÓN sched_job_reclamo ...' as '';
+
+CREATE TABLE IF NOT EXISTS sched_job_reclamo (
+  job_id       VARCHAR(80) NOT NULL,
+  slot         DATETIME NOT NULL,            -- disparo truncado (minuto o intervalo)
+  worker       VARCHAR(120) NOT NULL,        -- host:pid
+  reclamado_en DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  terminado_en DATETIME NULL,
+  duracion_ms  INT NULL,
+  error        VARCHAR(255) NULL,
+  PRIMARY KEY (job_id, slot),
+  KEY ix_sched_job_reclamo_slot (slot)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- VERIFICACIÓN
+-- ============================================
+
+SELECT '✅ sched_job_reclamo creada' as '';
+SHOW CREATE TABLE sched_job_reclamo\G
+
+SELECT '🎉 ¡MIGRACIÓN COMPLETADA!' as '';
+
+-- ============================================
+-- ROLLBACK (manual)
+-- ============================================
+-- DROP TABLE sched_job_reclamo;
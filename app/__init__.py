@@ -84,6 +84,9 @@ def create_app(config_object=None):
         """Cierra y limpia la sesión SQLAlchemy después de cada request."""
         db.session.remove()
 
+    from app.mysql_conn import close_mysql
+    app.teardown_appcontext(close_mysql)
+
     # ========================================================================
     # BLUEPRINTS (RUTAS)
     # ========================================================================
@@ -144,6 +147,14 @@ def create_app(config_object=None):
     print(f" Database: {db_url_safe}")
     print(f" Debug: {app.debug}")
     
+    # Esquema de metas/límites: se prueba una vez aquí, no en cada consulta
+    with app.app_context():
+        try:
+            from app.services.agregados_engine import probar_esquema_metas_limites
+            probar_esquema_metas_limites()
+        except Exception as e:
+            print(f" No se pudo probar esquema metas/límites: {e}")
+
     # ========================================================================
     # BOOT CATCHUP (OPCIONAL)
     # ========================================================================
@@ -157,16 +168,13 @@ def create_app(config_object=None):
     print(f" Is Main Process: {'YES' if is_main else 'NO (reloader child)'}")
     
     if should_catchup and not is_ml_mode and is_main:
-        print(" Ejecutando boot catchup...")
-        with app.app_context():
-            try:
-                from app.schedule.boot_catchup import boot_catchup
-                usuario_id = int(app.config.get("SCHED_USUARIO_ID", 1))
-                boot_catchup(app, usuario_id)
-                print(" Boot catchup completado")
-            except Exception as e:
-                print(f" Error en boot catchup: {e}")
-                print("   El servidor continuará sin catchup")
+        # En segundo plano: el arranque no espera a la puesta al día (app/schedule/boot_catchup.py)
+        try:
+            from app.schedule.boot_catchup import iniciar
+            iniciar(app)
+        except Exception as e:
+            print(f" Error al programar boot catchup: {e}")
+            print("   El servidor continuará sin catchup")
     else:
         if not should_catchup:
             print("ℹ  Boot catchup deshabilitado (para arranque rápido)")
@@ -184,7 +192,7 @@ def create_app(config_object=None):
     
     print(f"🔧 Scheduler: {'ENABLED' if should_start_scheduler else 'DISABLED'}")
     
-    if should_start_scheduler and is_main:
+    if should_start_scheduler and is_main and not is_ml_mode:
         print(" Iniciando scheduler...")
         try:
             from app.schedule.scheduler import start_scheduler
@@ -197,6 +205,8 @@ def create_app(config_object=None):
         if not should_start_scheduler:
             print("ℹ  Scheduler deshabilitado")
             print("  Para ejecutar jobs: python scripts/run_jobs_manually.py")
+        elif is_ml_mode:
+            print("ℹ  Scheduler omitido (modo ML)")
         elif not is_main:
             print("ℹ  Scheduler omitido (proceso secundario)")
 
@@ -223,6 +233,7 @@ ANTES:
 
 AHORA:
 - boot_catchup es OPCIONAL (config: ENABLE_BOOT_CATCHUP)
+- boot_catchup corre en segundo plano para todos los usuarios (no bloquea el arranque)
 - Scheduler es OPCIONAL (config: ENABLE_SCHEDULER)
 - Logging detallado de cada paso
 - Try-except en boot_catchup y scheduler
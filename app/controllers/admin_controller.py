@@ -9,7 +9,7 @@ from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
 from sqlalchemy import text
 from werkzeug.security import check_password_hash, generate_password_hash
-from app.mysql_conn import get_mysql, close_mysql
+from app.mysql_conn import get_mysql, close_mysql, pool_metricas
 from app.models.models import Registro, Categoria,Usuario, MetaCategoria, LimiteCategoria, UsuarioLogro, DominioCategoria, ContextoDia, PatronCategoria, RachaUsuario, ConfiguracionLogro, AggEstadoDia, AggVentanaCategoria, AggKpiRango, SesionFocus, IntentoBloqeuoFocus
 from app.models.ml import MLModelo, MLPrediccionFuture, MlMetric
 from app.models.features import FeatureDiaria, FeatureHoraria
@@ -17,11 +17,15 @@ from app.models.models_coach import CoachAlerta, CoachSugerencia, CoachAccionLog
 from collections import defaultdict
 from datetime import datetime
 from app.utils import desbloquear_logro, verificar_logros_dinamicos, obtener_promedio_categoria, calcular_nivel_confianza, obtener_dias_uso, calcular_sugerencias_por_categoria, _qa_invariantes_dia
-from ml.utils_ml import clasificar_dominio_automatico
+from ml import model_cache
 from app.services.rachas_service import actualizar_rachas
 from app.extensions import db 
 from app.services.features_engine import calcular_persistir_features
+from app.services.ingesta_service import guardar_lote, parse_fecha_hora, resolver_categorias, insertar_registros, MAX_EVENTOS_LOTE
+from app.services import categoria_cache, uso_intradia, cubo_features
+from app.services.ingest_buffer import encolar_registro, get_buffer_ingesta
 from app.schedule.scheduler import get_scheduler
+from app.schedule import nocturno, candados, boot_catchup
 from app.schedule.coach_jobs import job_coach_alertas
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, flash, current_app, send_file
 
@@ -71,6 +75,7 @@ def _inicializar_categorias_usuario(usuario_id):
         copiados += 1
     
     db.session.commit()
+    categoria_cache.invalidar_usuario(usuario_id)
     print(f" Categorías duplicadas: {len(mapeo_categorias)} | Patrones duplicados: {copiados}")
 
 
@@ -265,6 +270,7 @@ def agregar_categoria():
     
     db.session.add(nueva)
     db.session.commit()
+    categoria_cache.invalidar_usuario(usuario_id)
     
     print(f" [CATEGORÍA] Creada '{nombre}' para usuario {usuario_id}")
     flash(f'Categoría "{nombre}" agregada correctamente', 'success')
@@ -279,6 +285,8 @@ def agregar_dominio():
         nuevo = DominioCategoria(dominio=dominio, categoria_id=int(categoria_id))
         db.session.add(nuevo)
         db.session.commit()
+        if 'usuario_id' in session:
+            categoria_cache.invalidar_dominio(session['usuario_id'], dominio)
         flash('Dominio agregado correctamente')
     return redirect(url_for('admin_controller.vista_categorias'))
 
@@ -303,6 +311,7 @@ def eliminar_categoria(id):
     nombre_eliminado = categoria.nombre
     db.session.delete(categoria)
     db.session.commit()
+    categoria_cache.invalidar_usuario(usuario_id)
     
     flash(f'Categoría "{nombre_eliminado}" eliminada correctamente', 'success')
     return redirect(url_for('admin_controller.vista_categorias'))
@@ -324,6 +333,7 @@ def eliminar_dominio(id):
         return redirect(url_for('admin_controller.vista_categorias'))
     db.session.delete(dominio)
     db.session.commit()
+    categoria_cache.invalidar_dominio(usuario_id, dominio.dominio)
     flash('Dominio eliminado')
     return redirect(url_for('admin_controller.vista_categorias'))
 
@@ -348,6 +358,7 @@ def editar_categoria(id):
     if nuevo_nombre:
         categoria.nombre = nuevo_nombre
         db.session.commit()
+        categoria_cache.invalidar_usuario(usuario_id)
         flash(f'Categoría actualizada a "{nuevo_nombre}"', 'success')
     else:
         flash('Debes proporcionar un nuevo nombre', 'warning')
@@ -372,9 +383,12 @@ def editar_dominio(id):
     nuevo_dominio = request.form.get('nuevo_dominio')
     nueva_categoria_id = request.form.get('nueva_categoria_id')
     if nuevo_dominio and nueva_categoria_id:
+        dominio_anterior = dominio.dominio
         dominio.dominio = nuevo_dominio
         dominio.categoria_id = int(nueva_categoria_id)
         db.session.commit()
+        categoria_cache.invalidar_dominio(usuario_id, dominio_anterior)
+        categoria_cache.invalidar_dominio(usuario_id, nuevo_dominio)
         flash('Dominio actualizado')
     return redirect(url_for('admin_controller.vista_categorias'))
 
@@ -394,7 +408,7 @@ def vista_metas():
         SELECT dc.categoria_id, SUM(r.tiempo) as total
         FROM registro r
         JOIN dominio_categoria dc ON r.dominio = dc.dominio AND dc.usuario_id = :usuario_id
-        WHERE r.usuario_id = :usuario_id AND DATE(r.fecha) = :hoy
+        WHERE r.usuario_id = :usuario_id AND r.dia = :hoy
         GROUP BY dc.categoria_id
     """), {"usuario_id": usuario_id, "hoy": hoy}).fetchall()
 
@@ -549,7 +563,7 @@ def vista_limites():
         SELECT dc.categoria_id, SUM(r.tiempo) as total
         FROM registro r
         JOIN dominio_categoria dc ON r.dominio = dc.dominio
-        WHERE r.usuario_id = :usuario_id AND DATE(r.fecha) = :hoy
+        WHERE r.usuario_id = :usuario_id AND r.dia = :hoy
         GROUP BY dc.categoria_id
     """), {"usuario_id": usuario_id, "hoy": hoy}).fetchall()
 
@@ -731,18 +745,7 @@ def verificar_alerta_categoria():
     usuario_id = session['usuario_id']
     hoy = date.today()
 
-    resultado = db.session.execute(text("""
-        SELECT SUM(r.tiempo)
-        FROM registro r
-        JOIN dominio_categoria dc ON r.dominio = dc.dominio
-        WHERE r.usuario_id = :usuario_id
-        AND dc.categoria_id = :categoria_id
-        AND DATE(r.fecha) = :hoy
-    """), {
-        "usuario_id": usuario_id,
-        "categoria_id": categoria_id,
-        "hoy": hoy
-    }).scalar() or 0
+    resultado = uso_intradia.segundos_categoria(usuario_id, categoria_id, hoy)
 
     minutos_usados = resultado / 60
 
@@ -806,24 +809,19 @@ def alerta_por_dominio():
     resultado = db.session.execute(text("""
         SELECT 
             c.nombre AS categoria_nombre,
-            SUM(r.tiempo) AS total, 
             lc.limite_minutos
-        FROM registro r
-        JOIN dominio_categoria dc ON r.dominio = dc.dominio AND dc.usuario_id = :usuario_id
-        JOIN categorias c ON dc.categoria_id = c.Id
+        FROM categorias c
         LEFT JOIN limite_categoria lc 
             ON lc.categoria_id = c.Id AND lc.usuario_id = :usuario_id
-        WHERE r.usuario_id = :usuario_id 
-          AND dc.categoria_id = :categoria_id
-          AND DATE(r.fecha) = CURDATE()
-        GROUP BY c.Id, lc.limite_minutos
+        WHERE c.Id = :categoria_id
     """), {
         "usuario_id": usuario_id,
         "categoria_id": categoria_id
     }).fetchone()
+    total = uso_intradia.segundos_categoria(usuario_id, categoria_id)
 
-    if resultado and resultado.total and resultado.limite_minutos is not None:
-        minutos_usados = resultado.total / 60
+    if resultado and total and resultado.limite_minutos is not None:
+        minutos_usados = total / 60
         limite = resultado.limite_minutos
         categoria_nombre = resultado.categoria_nombre
 
@@ -1080,40 +1078,21 @@ def guardar_dominio():
         if not dominio or not tiempo or not usuario_id:
             return jsonify({"error": "Faltan datos"}), 400
 
-        fh_raw = request.form.get('fecha_hora')  
-        fh = None
-        if fh_raw:
-            try:
-                fh = datetime.fromisoformat(fh_raw.replace('Z', '+00:00'))
-                if fh.tzinfo:
-                    fh = fh.astimezone().replace(tzinfo=None)
-            except Exception:
-                fh = None
-        if fh is None:
-            fh = datetime.now()
-
-        from app.models.models import DominioCategoria
-        dominio_existente = DominioCategoria.query.filter_by(
-            dominio=dominio,
-            usuario_id=usuario_id
-        ).first()
-        
-        if dominio_existente:
-            categoria_id = dominio_existente.categoria_id
-            print(f"[✓] Dominio ya clasificado: {dominio} → categoría {categoria_id} (usuario {usuario_id})")
-        else:
-            print(f"[→] Clasificando dominio nuevo: {dominio} (usuario {usuario_id})")
-            categoria_id = clasificar_dominio_automatico(dominio, usuario_id)  
+        fh = parse_fecha_hora(request.form.get('fecha_hora'))
+
+        encolado = encolar_registro(usuario_id, dominio, tiempo, fh)
+        if encolado is not None:
+            if not encolado:
+                return jsonify({"error": "Ingesta saturada, reintentar"}), 503
+            return jsonify({"ok": True, "encolado": True})
 
-        # Guardar registro
-        from app.utils import get_mysql
+        categoria_id = resolver_categorias(usuario_id, [dominio]).get(dominio)
+        print(f"[✓] Dominio: {dominio} → categoría {categoria_id} (usuario {usuario_id})")
+
+        # Guardar registro (+ uso_intradia en la misma transacción)
         conexion = get_mysql()
-        with conexion.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO registro (usuario_id, dominio, tiempo, fecha, fecha_hora)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (usuario_id, dominio, tiempo, fh.date(), fh))
-            conexion.commit()
+        insertar_registros(conexion, usuario_id, [(dominio, tiempo, fh)],
+                           categorias={dominio: categoria_id})
 
         print(f"[✔] /guardar dominio={dominio} tiempo={tiempo}s usuario={usuario_id} fecha_hora={fh}")
         return jsonify({"ok": True})
@@ -1136,6 +1115,37 @@ def guardar_dominio():
         print("Error en /guardar:", e)
         return jsonify({"error": "Error al guardar"}), 500
 
+@bp.route('/guardar_lote', methods=['POST'])
+@cross_origin(origins='*', methods=['POST'])
+def guardar_lote_dominios():
+    """
+    Ingesta en lote para la extensión: recibe {eventos: [{dominio, tiempo, fecha_hora}]},
+    clasifica una vez por dominio distinto e inserta todo en una sola transacción.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        usuario_id = data.get('usuario_id') or session.get('usuario_id')
+        eventos = data.get('eventos')
+
+        if not usuario_id or not isinstance(eventos, list):
+            return jsonify({"error": "Faltan datos"}), 400
+        if len(eventos) > MAX_EVENTOS_LOTE:
+            return jsonify({"error": f"Máximo {MAX_EVENTOS_LOTE} eventos por lote"}), 413
+
+        resultado = guardar_lote(usuario_id, eventos)
+
+        print(f"[✔] /guardar_lote usuario={usuario_id} insertados={resultado['insertados']} "
+              f"encolados={resultado.get('encolados', 0)} descartados={resultado['descartados']}")
+        if resultado.get('rechazados'):
+            # Backpressure: no se encoló nada del lote, la extensión lo reintenta completo
+            return jsonify({"error": "Ingesta saturada, reintentar", **resultado}), 503
+        return jsonify({"ok": True, **resultado})
+
+    except Exception as e:
+        print("Error en /guardar_lote:", e)
+        traceback.print_exc()
+        return jsonify({"error": "Error al guardar"}), 500
+
 import traceback
 
 @bp.route('/dashboard_ml')
@@ -1369,11 +1379,47 @@ def features_health():
                 "trigger": str(j.trigger)
             })
         tz = current_app.config.get("TZ", "America/Mexico_City")
-        return jsonify({"jobs": jobs, "tz": tz})
+        return jsonify({"jobs": jobs, "tz": tz, "candados": candados.metricas()})
     except Exception as e:
         return jsonify({"jobs": [], "tz": current_app.config.get("TZ", "America/Mexico_City"),
+                        "candados": candados.metricas(),
                         "warning": f"scheduler no disponible: {type(e).__name__}"}), 200
 
+@bp.route('/api/ingesta_metricas', methods=['GET'])
+def ingesta_metricas():
+    """Profundidad de cola y latencia de flush del buffer de ingesta de este worker (y cachés en memoria)."""
+    buf = get_buffer_ingesta()
+    m = buf.metricas() if buf is not None else {"activo": False}
+    m["cache_categorias"] = categoria_cache.metricas()
+    m["pool_mysql"] = pool_metricas()
+    m["cubo_features"] = cubo_features.metricas()
+    m["cache_modelos"] = model_cache.metricas()
+    return jsonify(m)
+
+@bp.route('/api/sched_reclamos', methods=['GET'])
+def sched_reclamos():
+    """Qué worker ejecutó cada disparo de job (?limite=50) + contadores de este worker."""
+    try:
+        recientes = candados.reclamos_recientes(current_app._get_current_object(),
+                                                int(request.args.get("limite", 50)))
+    except Exception as e:
+        recientes = {"error": f"{type(e).__name__}: {e}"}
+    return jsonify({"reclamos": recientes, "worker": candados.metricas()})
+
+@bp.route('/api/boot_catchup', methods=['GET'])
+def boot_catchup_progreso():
+    """Avance de la puesta al día de arranque en este worker."""
+    return jsonify(boot_catchup.progreso())
+
+@bp.route('/api/noche', methods=['GET'])
+def noche_reporte():
+    """Marcas del DAG nocturno por etapa (?fecha=YYYY-MM-DD, por defecto ayer)."""
+    f = request.args.get("fecha")
+    try:
+        return jsonify(nocturno.reporte(current_app._get_current_object(), date.fromisoformat(f) if f else None))
+    except Exception as e:
+        return jsonify({"error": f"{type(e).__name__}: {e}"}), 500
+
 @bp.route('/api/features_qa', methods=['GET'])
 def features_qa():
     usuario_id = int(request.args.get("usuario_id", 1))
@@ -1,8 +1,8 @@
 from flask import Blueprint, request, jsonify
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 from app.extensions import db
 from app.models import AggVentanaCategoria, AggEstadoDia, AggKpiRango
-from app.services.features_engine import recalcular_rango
+from app.services.features_engine import recalcular_rango_multi
 from app.services.agregados_engine import AgregadosEngine
 
 bp = Blueprint("agg", __name__)
@@ -90,25 +90,27 @@ def features_rebuild_ping():
 @bp.post("/features_rebuild")
 def features_rebuild():
     p = request.get_json() or {}
-    usuario_id = int(p.get("usuario_id", 1))
+    usuarios = [int(u) for u in (p.get("usuarios") or [p.get("usuario_id", 1)])]
     d1 = date.fromisoformat(p.get("desde", "2025-07-25"))
     d2 = date.fromisoformat(p.get("hasta", date.today().isoformat()))
     if d2 < d1:
         d1, d2 = d2, d1
 
-    fe_stats = recalcular_rango(usuario_id=usuario_id, desde=d1, hasta=d2)
+    # Una sola pasada sobre registro para todos los usuarios y días
+    fe_stats = recalcular_rango_multi(usuarios, desde=d1, hasta=d2)
+    fe_stats.pop("dias", None)
 
     agg = AgregadosEngine()
-    f = d1
-    while f <= d2:
-        agg.calcular_estado_dia_usuario(usuario_id=usuario_id, f=f)
-        agg.calcular_ventanas_usuario(usuario_id=usuario_id, fecha_fin=f)
-        f += timedelta(days=1)
-    agg.calcular_kpis_usuario(usuario_id=usuario_id, fecha_ref=d2)
+    for usuario_id in usuarios:
+        agg.calcular_estado_rango(usuario_id=usuario_id, desde=d1, hasta=d2)
+        agg.calcular_ventanas_rango(usuario_id=usuario_id, desde=d1, hasta=d2)
+        # El rebuild reescribe historial: KPIs completos, no incrementales
+        agg.calcular_kpis_usuario(usuario_id=usuario_id, fecha_ref=d2, verificar=True)
 
     return jsonify({
         "ok": True,
-        "usuario_id": usuario_id,
+        "usuario_id": usuarios[0] if len(usuarios) == 1 else None,
+        "usuarios": usuarios,
         "desde": d1.isoformat(),
         "hasta": d2.isoformat(),
         "features_stats": fe_stats
@@ -1,6 +1,6 @@
 from datetime import date, timedelta, datetime
 from flask import Blueprint, request, jsonify, session, current_app
-from sqlalchemy import func, text
+from sqlalchemy import text
 from pathlib import Path
 import pandas as pd
 import json
@@ -8,7 +8,8 @@ from app.extensions import db
 from flask_login import login_required, current_user
 from flask_cors import cross_origin
 from app.models.ml import MLPrediccionFuture
-from app.models.models import LimiteCategoria, FeaturesCategoriaDiaria, SesionFocus, IntentoBloqeuoFocus, Categoria, DominioCategoria
+from app.services import uso_intradia
+from app.models.models import LimiteCategoria, SesionFocus, IntentoBloqeuoFocus, Categoria, DominioCategoria
 from ml.pipeline import predict as ml_predict_fn
 from ml.pipeline import predict
 
@@ -49,18 +50,7 @@ def verificar_alerta_categoria():
     usuario_id = session['usuario_id']
     hoy = date.today()
 
-    resultado = db.session.execute(text("""
-        SELECT SUM(r.tiempo)
-        FROM registro r
-        JOIN dominio_categoria dc ON r.dominio = dc.dominio
-        WHERE r.usuario_id = :usuario_id
-        AND dc.categoria_id = :categoria_id
-        AND DATE(r.fecha) = :hoy
-    """), {
-        "usuario_id": usuario_id,
-        "categoria_id": categoria_id,
-        "hoy": hoy
-    }).scalar() or 0
+    resultado = uso_intradia.segundos_categoria(usuario_id, categoria_id, hoy)
 
     minutos_usados = resultado / 60
 
@@ -118,24 +108,19 @@ def alerta_por_dominio():
     resultado = db.session.execute(text("""
         SELECT 
             c.nombre AS categoria_nombre,
-            SUM(r.tiempo) AS total, 
             lc.limite_minutos
-        FROM registro r
-        JOIN dominio_categoria dc ON r.dominio = dc.dominio
-        JOIN categorias c ON dc.categoria_id = c.id
+        FROM categorias c
         LEFT JOIN limite_categoria lc 
             ON lc.categoria_id = c.id AND lc.usuario_id = :usuario_id
-        WHERE r.usuario_id = :usuario_id 
-          AND dc.categoria_id = :categoria_id
-          AND DATE(r.fecha) = CURDATE()
-        GROUP BY c.id, lc.limite_minutos
+        WHERE c.id = :categoria_id
     """), {
         "usuario_id": usuario_id,
         "categoria_id": categoria_id
     }).fetchone()
+    total = uso_intradia.segundos_categoria(usuario_id, categoria_id)
 
-    if resultado and resultado.total and resultado.limite_minutos is not None:
-        minutos_usados = resultado.total / 60
+    if resultado and total and resultado.limite_minutos is not None:
+        minutos_usados = total / 60
         limite = resultado.limite_minutos
         categoria_nombre = resultado.categoria_nombre
 
@@ -169,20 +154,14 @@ def sugerencias_detalle():
     hoy = date.today()
     desde = hoy - timedelta(days=14) 
 
-    rows = (
-        db.session.query(
-            FeaturesCategoriaDiaria.categoria.label("categoria"),
-            func.count(FeaturesCategoriaDiaria.minutos).label("dias"),
-            func.avg(FeaturesCategoriaDiaria.minutos).label("promedio_14d"),
-        )
-        .filter(
-            FeaturesCategoriaDiaria.usuario_id == usuario_id,
-            FeaturesCategoriaDiaria.fecha >= desde,
-            FeaturesCategoriaDiaria.fecha < hoy,
-        )
-        .group_by(FeaturesCategoriaDiaria.categoria)
-        .all()
-    )
+    # Conteo y promedio por categoría desde el cubo en memoria (rango [desde, hoy)).
+    # El cubo sale de features_diarias: features_engine escribe las mismas filas en
+    # features_diarias y features_categoria_diaria, así que el resultado no cambia.
+    from app.services.cubo_features import obtener_cubo
+    cubo = obtener_cubo(usuario_id)
+    ayer = hoy - timedelta(days=1)
+    sumas = cubo.suma_por_categoria(desde, ayer)
+    dias_por_cat = cubo.dias_con_filas(desde, ayer)
 
 
     def _multiplicador(categoria):
@@ -191,15 +170,14 @@ def sugerencias_detalle():
         return 1.10 if not any(x in nombre for x in no_productivas) else 1.20
 
     out = []
-    for r in rows:
-        dias = int(r.dias or 0)
+    for categoria, dias in dias_por_cat.items():
         if dias < 3:
             continue
-        prom = float(r.promedio_14d or 0.0)
-        mult = _multiplicador(r.categoria)
+        prom = float(sumas.get(categoria, 0)) / dias
+        mult = _multiplicador(categoria)
         sugerido = round(prom * mult, 2)
         out.append({
-            "categoria": r.categoria,
+            "categoria": categoria,
             "dias_respaldo": dias,
             "promedio_14d": prom,
             "multiplicador": mult,
@@ -669,7 +647,7 @@ def predicciones_vs_realidad():
             # ========================================================================
             real_segundos = db.session.query(func.sum(Registro.tiempo)).filter(
                 Registro.usuario_id == usuario_id,
-                func.date(Registro.fecha_hora) == fecha
+                Registro.dia == fecha
             ).scalar()
             
             # Convertir Decimal a float, luego a minutos
@@ -80,10 +80,18 @@ def guardar_tiempo(request, usuario_id):
 
     ahora = datetime.now()
 
+    # Write-behind: si el buffer está activo, se encola y se responde sin commit
+    from app.services.ingest_buffer import encolar_registro
+    encolado = encolar_registro(usuario_id, dominio_limpio, tiempo, ahora)
+    if encolado is not None:
+        if not encolado:
+            return jsonify({'error': 'Ingesta saturada, reintentar'}), 503
+        return jsonify({'mensaje': 'Tiempo encolado'}), 200
+
     registro = Registro.query.filter(
         Registro.dominio == dominio_limpio,
         Registro.usuario_id == usuario_id,
-        func.date(Registro.fecha) == ahora.date()
+        Registro.dia == ahora.date()
     ).first()
 
     if registro:
@@ -97,6 +105,11 @@ def guardar_tiempo(request, usuario_id):
         )
         db.session.add(registro)
 
+    from app.services.ingesta_service import resolver_categorias
+    from app.services import uso_intradia
+    categorias = resolver_categorias(usuario_id, [dominio_limpio])
+    uso_intradia.acumular_sesion(usuario_id, [(dominio_limpio, tiempo, ahora)], categorias)
+
     db.session.commit()
     return jsonify({'mensaje': 'Tiempo actualizado'}), 200
 def _parse_date(s: str):
@@ -127,6 +140,25 @@ def _rango_fechas_desde_request():
 
     return hoy, hoy, 'hoy'
 
+_CUTOVER = {"dia": None}
+
+
+def _cutover_horas():
+    """
+    Primer día con hora real en `registro` (antes todo se guardaba a las 00:00).
+    MIN sobre la columna `dia` (recorre ix_registro_dia_usuario y para en la primera
+    fila válida); el valor es histórico, así que se guarda por proceso una vez hallado.
+    """
+    if _CUTOVER["dia"] is None:
+        _CUTOVER["dia"] = (
+            db.session.query(func.min(Registro.dia))
+            .filter(Registro.fecha_hora.isnot(None))
+            .filter(func.hour(Registro.fecha_hora) != 0)
+            .scalar()
+        )
+    return _CUTOVER["dia"]
+
+
 def _unificar_alias_sin_categoria(m: dict) -> dict:
     """Funde claves viejas hacia 'Sin categoría'."""
     if not m:
@@ -152,86 +184,36 @@ def dashboard():
         nombre = usuario.nombre if usuario else "Usuario"
         fecha_inicio, fecha_fin, etiqueta_rango = _rango_fechas_desde_request()
 
-        cutover = (
-            db.session.query(func.min(func.date(Registro.fecha_hora)))
-            .filter(func.date(Registro.fecha_hora).isnot(None))
-            .filter(func.hour(Registro.fecha_hora) != 0)
-            .scalar()
-        )
-        from datetime import date
-        cutover = cutover or date.today()
-
-        q_hora = db.session.query(
-            FeatureHoraria.hora.label('hora'),
-            func.sum(FeatureHoraria.minutos).label('total')
-        ).filter(
-            FeatureHoraria.usuario_id == usuario_id
-        )
-
-        cutover = (
-            db.session.query(func.min(func.date(Registro.fecha_hora)))
-            .filter(func.date(Registro.fecha_hora).isnot(None))
-            .filter(func.hour(Registro.fecha_hora) != 0)
-            .scalar()
-        )
         from datetime import date
-        cutover = cutover or date.today()
+        cutover = _cutover_horas() or date.today()
 
         todo_historico = request.args.get('todo_historico', '1') == '1'
 
+        # Sumas por rango desde el cubo en memoria (features_diarias / features_horarias)
+        from app.services.cubo_features import obtener_cubo
+        cubo = obtener_cubo(usuario_id)
+
         if etiqueta_rango == 'total':
-            if not todo_historico:
-                q_hora = q_hora.filter(FeatureHoraria.fecha >= cutover)
+            ini, fin = None, None
+            ini_hora = None if todo_historico else cutover
         else:
-
-            q_hora = q_hora.filter(
-                FeatureHoraria.fecha >= fecha_inicio,
-                FeatureHoraria.fecha <= fecha_fin
-            )
-
-        q_hora = q_hora.group_by(FeatureHoraria.hora).order_by(FeatureHoraria.hora)
+            ini, fin = fecha_inicio, fecha_fin
+            ini_hora = fecha_inicio
 
         uso_horario = [
-            {'hora': int(r.hora), 'total': int(r.total or 0)}
-            for r in q_hora.all()
+            {'hora': h, 'total': total}
+            for h, total in sorted(cubo.por_hora(ini_hora, fin).items())
         ]
 
-        q_dia = db.session.query(
-            FeatureDiaria.fecha.label('dia'),
-            func.sum(FeatureDiaria.minutos).label('total')
-        ).filter(
-            FeatureDiaria.usuario_id == usuario_id
-        )
-        if etiqueta_rango != 'total':
-            q_dia = q_dia.filter(
-                FeatureDiaria.fecha >= fecha_inicio,
-                FeatureDiaria.fecha <= fecha_fin
-            )
-        q_dia = q_dia.group_by(FeatureDiaria.fecha).order_by(FeatureDiaria.fecha.asc())
-
         uso_diario = [
-            {'dia': str(r.dia), 'total': int(r.total or 0)}
-            for r in q_dia.all()
+            {'dia': str(d), 'total': total}
+            for d, total in cubo.serie_diaria(ini, fin)
         ]
 
-        q_cat = db.session.query(
-            FeatureDiaria.categoria,
-            func.sum(FeatureDiaria.minutos).label('total')
-        ).filter(
-            FeatureDiaria.usuario_id == usuario_id
-        )
-        if etiqueta_rango != 'total':
-            q_cat = q_cat.filter(
-                FeatureDiaria.fecha >= fecha_inicio,
-                FeatureDiaria.fecha <= fecha_fin
-            )
-        q_cat = q_cat.group_by(FeatureDiaria.categoria)\
-                     .order_by(func.sum(FeatureDiaria.minutos).desc())
-
         por_categoria = {}
-        for cat, total in q_cat.all():
+        for cat, total in sorted(cubo.suma_por_categoria(ini, fin).items(), key=lambda x: -x[1]):
             key = cat or 'Sin categoría'
-            por_categoria[key] = int(total or 0)
+            por_categoria[key] = total
         por_categoria = _unificar_alias_sin_categoria(por_categoria)
 
         q_dom = db.session.query(
@@ -241,10 +223,10 @@ def dashboard():
             Registro.usuario_id == usuario_id
         )
         if etiqueta_rango != 'total':
-            q_dom = q_dom.filter(
-                func.date(Registro.fecha) >= (fecha_inicio or func.date(Registro.fecha)),
-                func.date(Registro.fecha) <= (fecha_fin or func.date(Registro.fecha))
-            )
+            if fecha_inicio:
+                q_dom = q_dom.filter(Registro.dia >= fecha_inicio)
+            if fecha_fin:
+                q_dom = q_dom.filter(Registro.dia <= fecha_fin)
         q_dom = q_dom.group_by(Registro.dominio)\
                      .order_by(func.sum(Registro.tiempo).desc())
 
@@ -346,7 +328,7 @@ def resumen():
         """), {'usuario_id': usuario_id}).fetchone()
 
         dia_top = db.session.execute(text("""
-            SELECT DATE(fecha) as dia, SUM(tiempo) AS total
+            SELECT dia, SUM(tiempo) AS total
             FROM registro
             WHERE usuario_id = :usuario_id
             GROUP BY dia
@@ -356,32 +338,18 @@ def resumen():
 
         promedio_diario = db.session.execute(text("""
             SELECT AVG(t.total) FROM (
-                SELECT DATE(fecha) AS dia, SUM(tiempo) AS total
+                SELECT dia, SUM(tiempo) AS total
                 FROM registro
                 WHERE usuario_id = :usuario_id
                 GROUP BY dia
             ) AS t
         """), {'usuario_id': usuario_id}).scalar() or 0
 
-        asociaciones = db.session.query(DominioCategoria.dominio, Categoria.nombre) \
-            .join(Categoria) \
-            .all()
-
-        mapa_dominios = {dominio: categoria for dominio, categoria in asociaciones}
-
-        registros = db.session.execute(text("""
-            SELECT dominio, SUM(tiempo) AS total
-            FROM registro
-            WHERE usuario_id = :usuario_id
-            GROUP BY dominio
-        """), {'usuario_id': usuario_id}).fetchall()
-
-        por_categoria = defaultdict(int)
-        for dominio, total in registros:
-            categoria = mapa_dominios.get(dominio, 'Otros')
-            por_categoria[categoria] += total
-
-        categoria_top = max(por_categoria.items(), key=lambda x: x[1]) if por_categoria else ('N/A', 0)
+        # Categoría dominante desde el cubo en memoria (features_diarias, en minutos),
+        # igual que la gráfica por categoría de /dashboard
+        from app.services.cubo_features import obtener_cubo
+        top = obtener_cubo(usuario_id).top_k(1)
+        categoria_top = (top[0][0] or 'Sin categoría', top[0][1]) if top else ('N/A', 0)
 
 
         return jsonify({
@@ -392,7 +360,7 @@ def resumen():
             'tiempo_dia_top': int(round(dia_top[1] / 60)) if dia_top else 0,
             'promedio_diario': int(round(promedio_diario / 60)),
             'categoria_dominante': categoria_top[0],
-            'tiempo_categoria_top': int(round(categoria_top[1] / 60))
+            'tiempo_categoria_top': int(categoria_top[1])
         })
 
     except Exception as e:
@@ -4,6 +4,7 @@ Controller para sistema de feedback de clasificaciones
 from flask import Blueprint, jsonify, request, session
 from app.models.models_coach import NotificacionClasificacion
 from app.models.models import Categoria, DominioCategoria
+from app.services import categoria_cache
 from app import db
 from datetime import datetime
 
@@ -107,6 +108,7 @@ def rechazar_clasificacion(notif_id):
         dominio_cat.categoria = categoria.nombre
     
     db.session.commit()
+    categoria_cache.invalidar_dominio(usuario_id, notif.dominio)
     
     return jsonify({
         'success': True,
@@ -162,6 +164,7 @@ def clasificar_manual(notif_id):
         print(f"[CLASIFICACIÓN MANUAL]  Dominio no encontrado: {notif.dominio} (usuario {usuario_id})")
     
     db.session.commit()
+    categoria_cache.invalidar_dominio(usuario_id, notif.dominio)
     
     return jsonify({
         'success': True,
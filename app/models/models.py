@@ -69,6 +69,14 @@ class Registro(db.Model):
     fecha = db.Column(db.DateTime)
     fecha_hora = db.Column(db.DateTime)  
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    # Día del registro, generado por MySQL (ver 04_migracion_registro_dia.sql)
+    dia = db.Column(db.Date, db.Computed("DATE(COALESCE(fecha_hora, fecha))", persisted=True))
+
+    __table_args__ = (
+        Index("ix_registro_usuario_dia_dominio", "usuario_id", "dia", "dominio"),
+        Index("ix_registro_usuario_fecha_hora", "usuario_id", "fecha_hora"),
+        Index("ix_registro_dia_usuario", "dia", "usuario_id"),
+    )
 
 # ============================================================================
 # ✅ CAMBIO CRÍTICO 1: Categoria con restricción única compuesta
@@ -202,6 +210,16 @@ class AggKpiRango(db.Model):
     pct_productivo    = db.Column(db.Float, nullable=False)
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
+class UsoIntradia(db.Model):
+    """Segundos acumulados por (usuario, día, categoría, hora); se mantiene en la ingesta."""
+    __tablename__ = 'uso_intradia'
+    usuario_id   = db.Column(db.Integer, primary_key=True)
+    dia          = db.Column(db.Date,    primary_key=True)
+    categoria_id = db.Column(db.Integer, primary_key=True)   # 0 = sin categoría
+    hora         = db.Column(db.SmallInteger, primary_key=True)
+    segundos     = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+
 class ContextoDia(db.Model):
     """Contexto de días atípicos detectados"""
     __tablename__ = 'contexto_dia'
@@ -1,28 +1,202 @@
-from flask import g
+from flask import g, current_app
 import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError, OperationalError
 import os
+import threading
+import time
 from app.extensions import db
 
 
+def _params_conexion():
+    """Parámetros de conexión desde variables de entorno (Railway o local)."""
+    return dict(
+        host=os.environ.get('MYSQLHOST', 'localhost'),
+        port=int(os.environ.get('MYSQLPORT', '3306')),
+        user=os.environ.get('MYSQLUSER', 'angel'),
+        password=os.environ.get('MYSQLPASSWORD', 'base'),
+        database=os.environ.get('MYSQLDATABASE', 'tiempocheck_db')
+    )
+
+
+class _PoolMySQL:
+    """
+    Pool de conexiones mysql.connector compartido por el proceso.
+
+    - MYSQL_POOL_SIZE conexiones persistentes (MySQLConnectionPool, máx 32).
+    - MYSQL_POOL_MAX_OVERFLOW conexiones extra que se cierran al devolverse.
+    - Si todo está ocupado se espera hasta MYSQL_POOL_TIMEOUT segundos.
+    """
+
+    def __init__(self, size=10, max_overflow=10, timeout=30.0, pre_ping=True):
+        self.size = max(1, min(int(size), pooling.CNX_POOL_MAXSIZE))
+        self.max_overflow = max(0, int(max_overflow))
+        self.timeout = float(timeout)
+        self.pre_ping = pre_ping
+        self.pid = os.getpid()
+
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=f"tiempocheck_{self.pid}",
+            pool_size=self.size,
+            pool_reset_session=True,
+            **_params_conexion()
+        )
+        self._cupos = threading.BoundedSemaphore(self.size + self.max_overflow)
+        self._lock = threading.Lock()
+        self._m = {
+            "prestamos": 0,
+            "en_uso": 0,
+            "overflow_en_uso": 0,
+            "overflow_total": 0,
+            "esperas": 0,
+            "timeouts": 0,
+            "espera_total_ms": 0.0,
+            "espera_max_ms": 0.0,
+            "reconexiones": 0,
+        }
+
+    def obtener(self):
+        t0 = time.perf_counter()
+        if not self._cupos.acquire(blocking=False):
+            with self._lock:
+                self._m["esperas"] += 1
+            if not self._cupos.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._m["timeouts"] += 1
+                raise PoolError(
+                    f"Pool MySQL agotado ({self.size}+{self.max_overflow}) tras {self.timeout}s"
+                )
+        espera_ms = (time.perf_counter() - t0) * 1000.0
+
+        try:
+            try:
+                cnx = self._pool.get_connection()
+                overflow = False
+            except PoolError:
+                cnx = mysql.connector.connect(**_params_conexion())
+                overflow = True
+
+            if self.pre_ping and not overflow:
+                try:
+                    cnx.ping()
+                except Exception:
+                    with self._lock:
+                        self._m["reconexiones"] += 1
+                    cnx.reconnect(attempts=1, delay=0)
+        except Exception:
+            self._cupos.release()
+            raise
+
+        with self._lock:
+            self._m["prestamos"] += 1
+            self._m["en_uso"] += 1
+            self._m["espera_total_ms"] += espera_ms
+            self._m["espera_max_ms"] = max(self._m["espera_max_ms"], round(espera_ms, 2))
+            if overflow:
+                self._m["overflow_en_uso"] += 1
+                self._m["overflow_total"] += 1
+        return _ConexionPrestada(self, cnx, overflow)
+
+    def devolver(self, cnx, overflow):
+        try:
+            if overflow:
+                cnx.close()
+            else:
+                try:
+                    cnx.rollback()
+                except Exception:
+                    pass
+                cnx.close()  # PooledMySQLConnection.close() la regresa al pool
+        finally:
+            with self._lock:
+                self._m["en_uso"] -= 1
+                if overflow:
+                    self._m["overflow_en_uso"] -= 1
+            self._cupos.release()
+
+    def metricas(self):
+        with self._lock:
+            m = dict(self._m)
+        total = m.pop("espera_total_ms")
+        m["espera_promedio_ms"] = round(total / m["prestamos"], 3) if m["prestamos"] else 0.0
+        m["pool_size"] = self.size
+        m["max_overflow"] = self.max_overflow
+        m["timeout_s"] = self.timeout
+        return m
+
+
+class _ConexionPrestada:
+    """
+    Envoltura de una conexión prestada: delega todo a mysql.connector y hace
+    que `close()` la devuelva al pool una sola vez (idempotente).
+    """
+
+    def __init__(self, pool, cnx, overflow):
+        self._pool = pool
+        self._cnx = cnx
+        self._overflow = overflow
+        self.liberada = False
+
+    def close(self):
+        if not self.liberada:
+            self.liberada = True
+            self._pool.devolver(self._cnx, self._overflow)
+
+    def __getattr__(self, nombre):
+        if self.liberada:
+            raise OperationalError("Conexión ya devuelta al pool")
+        return getattr(self._cnx, nombre)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool del proceso actual; se crea tras el fork de cada worker de gunicorn."""
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            cfg = current_app.config
+            _pool = _PoolMySQL(
+                size=cfg.get('MYSQL_POOL_SIZE', 10),
+                max_overflow=cfg.get('MYSQL_POOL_MAX_OVERFLOW', 10),
+                timeout=cfg.get('MYSQL_POOL_TIMEOUT', 30),
+                pre_ping=cfg.get('MYSQL_POOL_PRE_PING', True),
+            )
+            print(f"[MYSQL] Pool creado (pid={_pool.pid}, size={_pool.size}, overflow={_pool.max_overflow})")
+    return _pool
+
+
+def pool_metricas():
+    return _pool.metricas() if _pool is not None else {"activo": False}
+
+
 def get_mysql():
     """
-    Obtiene una conexión MySQL leyendo las variables de entorno.
+    Obtiene una conexión MySQL del pool compartido, una por contexto de app.
     Compatible con Railway y desarrollo local.
     """
-    if 'mysql_conn' not in g:
-        # Leer variables de entorno (Railway las proporciona automáticamente)
-        g.mysql_conn = mysql.connector.connect(
-            host=os.environ.get('MYSQLHOST', 'localhost'),
-            port=int(os.environ.get('MYSQLPORT', '3306')),
-            user=os.environ.get('MYSQLUSER', 'angel'),
-            password=os.environ.get('MYSQLPASSWORD', 'base'),
-            database=os.environ.get('MYSQLDATABASE', 'tiempocheck_db')
-        )
-    return g.mysql_conn
+    conn = g.get('mysql_conn')
+    if conn is None or conn.liberada:
+        conn = g.mysql_conn = get_pool().obtener()
+    return conn
+
+
+def conexion_dedicada():
+    """
+    Conexión propia fuera del pool (autocommit); el llamador la cierra.
+    Para candados GET_LOCK que duran todo un job: no ocupa un cupo del pool.
+    """
+    cnx = mysql.connector.connect(**_params_conexion())
+    cnx.autocommit = True
+    return cnx
 
 
 def close_mysql(e=None):
-    """Cierra la conexión MySQL al final del request"""
+    """Devuelve la conexión MySQL al pool al final del request"""
     conn = g.pop('mysql_conn', None)
     if conn is not None:
-        conn.close()
\ No newline at end of file
+        conn.close()
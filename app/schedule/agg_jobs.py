@@ -27,7 +27,10 @@ def job_agg_close_day(app=None, usuario_id: int = 1, fecha: date = None):
         try:
             res1 = engine.calcular_estado_dia_usuario(usuario_id, fecha)
             res2 = engine.calcular_ventanas_usuario(usuario_id, fecha)
-            res3 = engine.calcular_kpis_usuario(usuario_id, fecha)
+            # Cada AGG_KPI_VERIFICAR_DIAS se recalculan mes/total completos para corregir desvíos
+            cada = int(app.config.get("AGG_KPI_VERIFICAR_DIAS", 7) or 0)
+            verificar = cada > 0 and fecha.toordinal() % cada == 0
+            res3 = engine.calcular_kpis_usuario(usuario_id, fecha, verificar=verificar)
 
             print(f"[SCHED][OK][agg_close_day] {fecha} → estado={res1['procesadas']} ventanas={res2['ventanas']} kpis={res3['rangos_procesados']}")
             return {"estado": res1, "ventanas": res2, "kpis": res3}
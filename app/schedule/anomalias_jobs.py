@@ -5,6 +5,7 @@ from app import db
 import json
 from datetime import date, timedelta, datetime
 from app.services.detector_anomalias import detectar_anomalia_dia, guardar_anomalia
+from app.services import uso_intradia
 
 def job_detectar_anomalias(app, usuario_id: int = None):
     """
@@ -43,7 +44,7 @@ def job_monitoreo_tiempo_real(app, usuario_id: int = None):
     Monitorea el uso EN TIEMPO REAL y alerta si detecta anomalías en progreso
     """
     with app.app_context():
-        from app.models.models import Usuario, Registro
+        from app.models.models import Usuario
         from app.models.models_coach import CoachSugerencia
         from sqlalchemy import func, text
         from datetime import date, time, datetime, timedelta
@@ -68,15 +69,7 @@ def job_monitoreo_tiempo_real(app, usuario_id: int = None):
         for uid in usuario_ids:
             try:
                 # Calcular uso hasta ahora HOY
-                uso_hasta_ahora = db.session.query(
-                    func.sum(Registro.tiempo) / 60.0
-                ).filter(
-                    Registro.usuario_id == uid,
-                    func.date(Registro.fecha) == hoy
-                ).scalar()
-                
-                # Convertir a float
-                uso_hasta_ahora = float(uso_hasta_ahora) if uso_hasta_ahora else 0.0
+                uso_hasta_ahora = uso_intradia.segundos_usuario(uid, hoy) / 60.0
                 
                 # Si no hay uso hoy, saltar
                 if uso_hasta_ahora == 0:
@@ -91,13 +84,13 @@ def job_monitoreo_tiempo_real(app, usuario_id: int = None):
                 query_promedio = text("""
                     SELECT AVG(uso_diario) as promedio
                     FROM (
-                        SELECT DATE(fecha) as dia, SUM(tiempo)/60.0 as uso_diario
+                        SELECT dia, SUM(tiempo)/60.0 as uso_diario
                         FROM registro
                         WHERE usuario_id = :usuario_id
-                          AND DATE(fecha) >= :fecha_inicio
-                          AND DATE(fecha) < :hoy
+                          AND dia >= :fecha_inicio
+                          AND dia < :hoy
                           AND fecha <= :hora_corte
-                        GROUP BY DATE(fecha)
+                        GROUP BY dia
                     ) as subq
                 """)
                 
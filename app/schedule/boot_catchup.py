@@ -1,118 +1,248 @@
-from datetime import date, timedelta, datetime
+"""
+Puesta al día tras un arranque, en segundo plano y para todos los usuarios.
+
+- `iniciar(app)` solo programa un hilo daemon (BOOT_CATCHUP_RETRASO_S): create_app
+  vuelve enseguida y el servidor atiende mientras tanto. El hilo pasa por
+  candados.ejecutar_exclusivo, así con varios workers de gunicorn lo corre uno solo,
+  y comparte el candado del DAG nocturno (grupo "noche") para no correr a la vez
+  que noche_reanudar.
+- Huecos: los (usuario, día) de los últimos BOOT_CATCHUP_LOOKBACK_DIAS con actividad
+  en `registro` (rango sobre ix_registro_dia_usuario) a los que les falte alguna
+  etapa del DAG nocturno según sched_etapa_completada. Las features también cuentan
+  como hechas si ya hay filas en features_diarias (días anteriores a las marcas).
+  Hasta ayer; hoy lo cierra el DAG nocturno.
+- Features: recalcular_rango_multi por lotes de BOOT_CATCHUP_LOTE usuarios.
+- Luego, por usuario y en orden de fecha (las rachas son acumulativas): las etapas
+  pendientes del DAG en su orden topológico (cada una deja su marca; si una falla,
+  sus dependientes esperan a la próxima pasada) y rachas. Usuarios en paralelo en
+  un pool de BOOT_CATCHUP_WORKERS hilos.
+- Avance en `progreso()` (admin: /api/boot_catchup).
+"""
 import os
-from pathlib import Path
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
 
 import pandas as pd
-from flask import current_app
 from sqlalchemy import text
 from zoneinfo import ZoneInfo
 
 from app.extensions import db
-from .features_jobs import job_features_diarias          
-from .agg_jobs import job_agg_close_day                 
-from .ml_jobs import job_ml_predict_multi               
-from .rachas_jobs import job_rachas                      
+from app.services.features_engine import recalcular_rango_multi
+from .nocturno import DAG, ORDEN, correr_nodo, marcar
+from .rachas_jobs import job_rachas
+
+_lock = threading.Lock()
+_progreso = {"estado": "inactivo"}
 
 
 def _is_reloader_child(app) -> bool:
     return (app.debug and os.environ.get("WERKZEUG_RUN_MAIN") == "true") or (not app.debug)
 
 
-def _csv_has_rows(path: Path) -> bool:
-    if not path.exists() or path.stat().st_size == 0:
-        return False
-    try:
-        chk = pd.read_csv(path, nrows=1)
-        return not chk.empty
-    except Exception:
-        return False
+def _actualizar(**cambios):
+    with _lock:
+        _progreso.update(cambios)
+
+
+def _sumar(campo: str, n: int = 1):
+    with _lock:
+        _progreso[campo] = _progreso.get(campo, 0) + n
 
 
-def _daterange(d0: date, d1: date):
-    cur = d0
-    while cur <= d1:
-        yield cur
-        cur = cur + timedelta(days=1)
+def progreso() -> dict:
+    with _lock:
+        p = dict(_progreso)
+    if p.get("dias"):
+        p["avance"] = round(p.get("dias_hechos", 0) / p["dias"], 4)
+    return p
 
 
-def _dias_faltantes_features(app, usuario_id: int, lookback_days: int = 7):
+# ----------------------------------------------------------------------
+# Detección de huecos
+# ----------------------------------------------------------------------
+def dias_faltantes(app, lookback_days: int = 7, usuario_id: int = None) -> dict:
     """
-    Busca días faltantes de features en [hoy-lookback .. hoy] usando tz de config.
-    Intenta columna 'dia'; si no existe, usa 'fecha'.
+    usuario_id -> {día: [etapas pendientes en ORDEN]} para los días con actividad en
+    [hoy-lookback, ayer] a los que les falta alguna etapa del DAG nocturno.
     """
     tz = ZoneInfo(app.config.get("TZ", "America/Mexico_City"))
-    hoy = datetime.now(tz).date()
-    start = hoy - timedelta(days=lookback_days)
-    expected = list(_daterange(start, hoy))
-
-    try:
-        sql = text("""
-            SELECT DISTINCT dia
-            FROM features_diarias
-            WHERE usuario_id = :uid AND dia BETWEEN :d0 AND :d1
-        """)
-        rows = db.session.execute(sql, {"uid": usuario_id, "d0": start, "d1": hoy}).fetchall()
-        present = {pd.to_datetime(r[0]).date() for r in rows}
-    except Exception:
-        sql = text("""
-            SELECT DISTINCT fecha
-            FROM features_diarias
-            WHERE usuario_id = :uid AND fecha BETWEEN :d0 AND :d1
-        """)
-        rows = db.session.execute(sql, {"uid": usuario_id, "d0": start, "d1": hoy}).fetchall()
-        present = {pd.to_datetime(r[0]).date() for r in rows}
-
-    missing = [d for d in expected if d not in present]
-    if missing:
-        print(f"[BOOT][CATCHUP] Días faltantes (features): {', '.join(map(str, missing))}")
-    else:
-        print("[BOOT][CATCHUP] Sin días pendientes. Todo en orden (según features_diarias)")
-    return missing
-
-def boot_catchup(app, usuario_id: int):
-    if not _is_reloader_child(app):
-        print("[BOOT][SKIP] Proceso primario del reloader (dev).")
-        return
-
-    print(f"[BOOT][CATCHUP] Verificando integridad temporal del sistema para usuario {usuario_id}...")
-    dias_faltantes = _dias_faltantes_features(app, usuario_id, lookback_days=7)
-
-    preds_dir = Path(current_app.root_path).parent / "ml" / "preds"
-    
-    # ✅ CAMBIO 1: Crear directorio por usuario
-    usuario_preds_dir = preds_dir / f"usuario_{usuario_id}"
-    usuario_preds_dir.mkdir(parents=True, exist_ok=True)
-
-    for dia in dias_faltantes:
-        print(f"[BOOT][CATCHUP] Corrigiendo día {dia} ...")
-
+    hasta = datetime.now(tz).date() - timedelta(days=1)
+    desde = hasta - timedelta(days=max(0, int(lookback_days) - 1))
+    filtro = " AND usuario_id = :uid" if usuario_id is not None else ""
+    params = {"d0": desde, "d1": hasta, "uid": usuario_id}
+
+    with app.app_context():
+        # dia primero: con o sin usuario, rango sobre ix_registro_dia_usuario
+        activos = db.session.execute(text(f"""
+            SELECT r.dia, r.usuario_id, f.fecha IS NOT NULL AS con_features
+            FROM (
+                SELECT dia, usuario_id FROM registro
+                WHERE dia BETWEEN :d0 AND :d1{filtro}
+                GROUP BY dia, usuario_id
+            ) r
+            LEFT JOIN (
+                SELECT fecha, usuario_id FROM features_diarias
+                WHERE fecha BETWEEN :d0 AND :d1{filtro}
+                GROUP BY fecha, usuario_id
+            ) f ON f.fecha = r.dia AND f.usuario_id = r.usuario_id
+        """), params).fetchall()
         try:
-            job_features_diarias(current_app, usuario_id, dia)
-            job_agg_close_day(current_app, usuario_id, dia)
+            filas = db.session.execute(text(f"""
+                SELECT fecha, usuario_id, etapa FROM sched_etapa_completada
+                WHERE fecha BETWEEN :d0 AND :d1{filtro}
+            """), params).fetchall()
         except Exception as e:
-            print(f"[BOOT][CATCHUP][ERR] Fallo en features/agg para {dia}: {e}")
-            continue
-
-        # ✅ CAMBIO 2: Buscar en directorio del usuario
-        target = usuario_preds_dir / f"preds_future_{dia}.csv"
-        
-        if not _csv_has_rows(target):
-            print(f"[BOOT][CATCHUP][PRED-MISS] No existe/está vacío {target.name} para usuario {usuario_id}, generando...")
+            print(f"[BOOT][CATCHUP][WARN] sin marcas de etapas ({e}); solo se miran features")
+            db.session.rollback()
+            filas = []
+
+    hechas = defaultdict(set)
+    for fecha, uid, etapa in filas:
+        hechas[(int(uid), pd.to_datetime(fecha).date())].add(etapa)
+
+    faltantes = defaultdict(dict)
+    for dia, uid, con_features in sorted(activos, key=lambda f: (f[1], f[0])):
+        uid, dia = int(uid), pd.to_datetime(dia).date()
+        ya = hechas.get((uid, dia), set())
+        if con_features:
+            ya = ya | {"features_diarias"}
+        pendientes = [e for e in ORDEN if e not in ya]
+        if pendientes:
+            faltantes[uid][dia] = pendientes
+    return dict(faltantes)
+
+
+# ----------------------------------------------------------------------
+# Trabajo
+# ----------------------------------------------------------------------
+def _features_lote(app, lote: dict, desde: date, hasta: date):
+    """Recalcula features del lote y marca la etapa en los días que la tenían pendiente."""
+    t0 = time.perf_counter()
+    with app.app_context():
+        recalcular_rango_multi(list(lote), desde, hasta)
+    duracion = (time.perf_counter() - t0) / max(1, sum(len(d) for d in lote.values()))
+    for uid, dias in lote.items():
+        for dia in dias:
+            marcar(app, dia, "features_diarias", uid, duracion)
+
+
+def _ponerse_al_dia(app, usuario_id: int, dias: dict, features_ok: bool = True) -> int:
+    """Etapas pendientes del DAG → rachas, día por día. Devuelve días con error."""
+    errores = 0
+    for dia in sorted(dias):
+        # Sin features (o con una dependencia caída) la etapa y sus dependientes esperan
+        fallidas = set() if features_ok else {"features_diarias"} & set(dias[dia])
+        for etapa in dias[dia]:
+            if etapa == "features_diarias":
+                continue
+            if any(d in fallidas for d in DAG[etapa][1]):
+                fallidas.add(etapa)
+                continue
+            try:
+                correr_nodo(app, etapa, usuario_id, dia)
+            except Exception as e:
+                fallidas.add(etapa)
+                print(f"[BOOT][CATCHUP][ERR] {etapa} user={usuario_id} {dia} → {e}")
+        if fallidas:
+            errores += 1
+
+        job_rachas(app, usuario_id, dia)
+        _sumar("dias_hechos")
+    return errores
+
+
+def boot_catchup(app, usuario_id: int = None) -> dict:
+    """Detecta huecos de todos los usuarios (o de `usuario_id`) y los procesa."""
+    lookback = int(app.config.get("BOOT_CATCHUP_LOOKBACK_DIAS", 7))
+    workers = max(1, int(app.config.get("BOOT_CATCHUP_WORKERS", 4)))
+    tam_lote = max(1, int(app.config.get("BOOT_CATCHUP_LOTE", 50)))
+
+    t0 = time.perf_counter()
+    _actualizar(estado="detectando", inicio=datetime.now().isoformat(timespec="seconds"), fin=None,
+                usuarios=0, usuarios_hechos=0, dias=0, dias_hechos=0, errores=0)
+    faltantes = dias_faltantes(app, lookback, usuario_id)
+    total_dias = sum(len(d) for d in faltantes.values())
+    _actualizar(estado="corriendo", usuarios=len(faltantes), dias=total_dias)
+    if not faltantes:
+        print(f"[BOOT][CATCHUP] Sin días pendientes en los últimos {lookback} días")
+    else:
+        print(f"[BOOT][CATCHUP] {total_dias} días pendientes en {len(faltantes)} usuarios "
+              f"({workers} hilos, lotes de {tam_lote})")
+
+    # Features solo para quien las tiene pendientes; el resto pasa directo a sus etapas
+    con_features = sorted(u for u, dias in faltantes.items()
+                          if any("features_diarias" in e for e in dias.values()))
+    lotes = [con_features[i:i + tam_lote] for i in range(0, len(con_features), tam_lote)]
+    aviso = max(1, len(faltantes) // 10)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="boot-catchup") as pool:
+        futuros_usuario = {
+            pool.submit(_ponerse_al_dia, app, uid, faltantes[uid]): uid
+            for uid in sorted(set(faltantes) - set(con_features))
+        }
+        futuros_features = {}
+        for lote in lotes:
+            pend = {u: [d for d, e in faltantes[u].items() if "features_diarias" in e] for u in lote}
+            desde = min(min(d) for d in pend.values())
+            hasta = max(max(d) for d in pend.values())
+            futuros_features[pool.submit(_features_lote, app, pend, desde, hasta)] = lote
+
+        for fut in as_completed(futuros_features):
+            lote = futuros_features[fut]
+            ok = fut.exception() is None
+            if not ok:
+                _sumar("errores")
+                print(f"[BOOT][CATCHUP][ERR] features usuarios {lote[0]}..{lote[-1]} → {fut.exception()}")
+            for uid in lote:
+                futuros_usuario[pool.submit(_ponerse_al_dia, app, uid, faltantes[uid], ok)] = uid
+
+        for fut in as_completed(futuros_usuario):
+            uid = futuros_usuario[fut]
             try:
-                job_ml_predict_multi(current_app, usuario_id, fecha_base=dia)
+                errores = fut.result()
             except Exception as e:
-                print(f"[BOOT][CATCHUP][ERR] multi para {dia}: {e}")
+                errores = 1
+                print(f"[BOOT][CATCHUP][ERR] user={uid} → {e}")
+            if errores:
+                _sumar("errores", errores)
+            _sumar("usuarios_hechos")
+            p = progreso()
+            if p["usuarios_hechos"] % aviso == 0 or p["usuarios_hechos"] == p["usuarios"]:
+                print(f"[BOOT][CATCHUP] {p['usuarios_hechos']}/{p['usuarios']} usuarios, "
+                      f"{p['dias_hechos']}/{p['dias']} días, {p['errores']} errores")
+
+    duracion = round(time.perf_counter() - t0, 3)
+    _actualizar(estado="terminado", fin=datetime.now().isoformat(timespec="seconds"), duracion_s=duracion)
+    print(f"[BOOT][CATCHUP] Finalizado en {duracion}s")
+    return progreso()
+
+
+def iniciar(app) -> bool:
+    """Programa boot_catchup en un hilo daemon; create_app no espera."""
+    if not _is_reloader_child(app):
+        print("[BOOT][SKIP] Proceso primario del reloader (dev).")
+        return False
 
-            if not _csv_has_rows(target):
-                print(f"[BOOT][CATCHUP][WARN] {target.name} sigue vacío. Revisar pipeline/logs.")
-            else:
-                print(f"[BOOT][CATCHUP][OK] {target.name} generado.")
-        else:
-            print(f"[BOOT][CATCHUP] Predicciones OK para {dia}.")
+    from app.schedule.candados import ejecutar_exclusivo
 
+    def correr():
         try:
-            job_rachas(current_app, usuario_id, dia)
+            # Un solo worker de gunicorn por arranque (slot de 10 min). Grupo "noche":
+            # corre los mismos nodos (usuario, ayer) que noche / noche_reanudar, así
+            # nunca se solapan; el que llegue después solo ve lo que quede sin marca.
+            ejecutar_exclusivo(app, "boot_catchup", boot_catchup, app, grupo="noche", slot_s=600)
         except Exception as e:
-            print(f"[SCHED][ERR][rachas] user={usuario_id} dia={dia} → {e}")
-
-    print(f"[BOOT][CATCHUP] Finalizado para usuario {usuario_id}.")
\ No newline at end of file
+            _actualizar(estado="error", error=str(e))
+            print(f"[BOOT][CATCHUP][ERR] {e}")
+
+    retraso = float(app.config.get("BOOT_CATCHUP_RETRASO_S", 15))
+    hilo = threading.Timer(retraso, correr)
+    hilo.daemon = True
+    hilo.name = "boot-catchup"
+    hilo.start()
+    _actualizar(estado="programado")
+    print(f"[BOOT][CATCHUP] Programado en segundo plano (en {retraso:.0f}s)")
+    return True
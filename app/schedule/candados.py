@@ -0,0 +1,200 @@
+"""
+Un solo worker por disparo de job del scheduler.
+
+gunicorn levanta varios workers y cada uno arranca su BackgroundScheduler con los
+mismos jobs. Cada job se registra envuelto en `ejecutar_exclusivo`, que antes de
+correr:
+
+1. Reclama el disparo: INSERT IGNORE en sched_job_reclamo (job_id, slot), con el
+   slot = hora *programada* del disparo (la calcula el trigger, no el reloj al
+   correr), truncada al minuto (cron) o al intervalo. Un worker que arranca tarde
+   el job (pool ocupado, pausa de GC) reclama el mismo slot que los demás. Solo
+   el worker que inserta la fila ejecuta; los demás lo omiten.
+2. Toma GET_LOCK('tiempocheck:job:<grupo>', 0) en una conexión dedicada y lo
+   mantiene mientras corre: jobs del mismo grupo (p. ej. noche y noche_reanudar)
+   no se solapan. Si el proceso muere, MySQL suelta el candado con la conexión.
+
+Si la BD no responde o falta la tabla, el job corre igual (mejor duplicado que
+perdido) y se cuenta como "sin_bd". Métricas por job en `metricas()`.
+"""
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+_lock = threading.Lock()
+_stats = defaultdict(lambda: {
+    "reclamados": 0, "omitidos": 0, "contencion": 0, "errores": 0, "sin_bd": 0,
+    "ultima_ejecucion": None, "ultima_duracion_s": None,
+})
+_purga = {"dia": None}
+
+_SQL_RECLAMAR = """
+    INSERT IGNORE INTO sched_job_reclamo (job_id, slot, worker, reclamado_en)
+    VALUES (%s, %s, %s, NOW())
+"""
+_SQL_TERMINAR = """
+    UPDATE sched_job_reclamo
+    SET terminado_en = NOW(), duracion_ms = %s, error = %s
+    WHERE job_id = %s AND slot = %s
+"""
+
+
+def _worker() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _contar(job_id: str, campo: str):
+    with _lock:
+        _stats[job_id][campo] += 1
+
+
+def slot(ahora: datetime, slot_s: int) -> datetime:
+    """Disparo truncado a múltiplos de slot_s (los workers disparan con segundos de desfase)."""
+    epoch = int(ahora.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % max(1, int(slot_s)))
+
+
+def disparo_programado(trigger, ahora: datetime) -> datetime:
+    """
+    Último disparo programado de `trigger` que no es posterior a `ahora` (API de
+    triggers de APScheduler 3). Sin trigger, o si no hay disparo en la ventana, `ahora`.
+    """
+    if trigger is None:
+        return ahora
+    run_date = getattr(trigger, "run_date", None)
+    if run_date is not None:  # DateTrigger
+        return run_date
+    # Ventana: un intervalo (IntervalTrigger) o una semana (cron semanales)
+    ventana = getattr(trigger, "interval", None) or timedelta(days=7)
+    ultimo = None
+    t = trigger.get_next_fire_time(None, ahora - ventana)
+    while t is not None and t <= ahora:
+        ultimo = t
+        t = trigger.get_next_fire_time(t, t + timedelta(microseconds=1))
+    return ultimo or ahora
+
+
+def _purgar(cursor, app):
+    hoy = date.today()
+    if _purga["dia"] == hoy:
+        return
+    _purga["dia"] = hoy
+    dias = int(app.config.get("SCHED_RECLAMOS_DIAS", 14))
+    cursor.execute("DELETE FROM sched_job_reclamo WHERE slot < NOW() - INTERVAL %s DAY", (dias,))
+
+
+def ejecutar_exclusivo(app, job_id: str, func, *args, grupo: str = None, slot_s: int = 60, trigger=None):
+    """
+    Job de APScheduler: corre func(*args) solo si este worker reclama el disparo.
+    `trigger` es el del job: el slot sale de su hora programada, no de la hora de ejecución.
+    """
+    if not app.config.get("SCHED_CANDADOS", True):
+        return func(*args)
+
+    from app.mysql_conn import conexion_dedicada
+
+    s = slot(disparo_programado(trigger, datetime.now().astimezone()), slot_s)
+    candado = f"tiempocheck:job:{grupo or job_id}"
+    try:
+        cnx = conexion_dedicada()
+    except Exception as e:
+        _contar(job_id, "sin_bd")
+        print(f"[SCHED][CANDADO][WARN] {job_id}: sin conexión ({e}); se ejecuta sin candado")
+        return func(*args)
+
+    reclamo = False
+    try:
+        with cnx.cursor() as cursor:
+            try:
+                cursor.execute(_SQL_RECLAMAR, (job_id, s, _worker()))
+                reclamo = True
+                if cursor.rowcount == 0:
+                    _contar(job_id, "omitidos")
+                    print(f"[SCHED][CANDADO] {job_id} {s:%Y-%m-%d %H:%M} ya reclamado por otro worker, se omite")
+                    return None
+                _purgar(cursor, app)
+            except Exception as e:
+                # Sin tabla de reclamos: queda solo el GET_LOCK
+                _contar(job_id, "sin_bd")
+                print(f"[SCHED][CANDADO][WARN] {job_id}: no se pudo reclamar ({e})")
+
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (candado,))
+            (obtenido,) = cursor.fetchone()
+        if not obtenido:
+            _contar(job_id, "contencion")
+            print(f"[SCHED][CANDADO] {job_id}: '{candado}' ocupado por otra ejecución, se omite")
+            if reclamo:
+                _terminar(cnx, job_id, s, 0, "candado ocupado")
+            return None
+
+        _contar(job_id, "reclamados")
+        t0 = time.perf_counter()
+        error = None
+        try:
+            return func(*args)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:255]
+            _contar(job_id, "errores")
+            raise
+        finally:
+            duracion = time.perf_counter() - t0
+            with _lock:
+                _stats[job_id]["ultima_ejecucion"] = datetime.now().isoformat(timespec="seconds")
+                _stats[job_id]["ultima_duracion_s"] = round(duracion, 3)
+            if reclamo:
+                _terminar(cnx, job_id, s, int(duracion * 1000), error)
+            try:
+                with cnx.cursor() as cursor:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (candado,))
+                    cursor.fetchall()
+            except Exception:
+                pass  # conexión caída: MySQL ya soltó el candado
+    finally:
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+
+def _terminar(cnx, job_id: str, s: datetime, duracion_ms: int, error):
+    try:
+        with cnx.cursor() as cursor:
+            cursor.execute(_SQL_TERMINAR, (duracion_ms, error, job_id, s))
+    except Exception as e:
+        print(f"[SCHED][CANDADO][WARN] {job_id}: no se pudo cerrar el reclamo ({e})")
+
+
+def metricas() -> dict:
+    with _lock:
+        jobs = {j: dict(m) for j, m in _stats.items()}
+    totales = defaultdict(int)
+    for m in jobs.values():
+        for k in ("reclamados", "omitidos", "contencion", "errores", "sin_bd"):
+            totales[k] += m[k]
+    return {"worker": _worker(), "totales": dict(totales), "jobs": jobs}
+
+
+def reclamos_recientes(app, limite: int = 50) -> list:
+    """Últimos disparos reclamados (todos los workers) desde sched_job_reclamo."""
+    from sqlalchemy import text
+    from app.extensions import db
+
+    with app.app_context():
+        filas = db.session.execute(text("""
+            SELECT job_id, slot, worker, reclamado_en, terminado_en, duracion_ms, error
+            FROM sched_job_reclamo
+            ORDER BY slot DESC
+            LIMIT :n
+        """), {"n": int(limite)}).fetchall()
+    return [
+        {
+            "job_id": j, "slot": s.isoformat() if s else None, "worker": w,
+            "reclamado_en": r.isoformat() if r else None,
+            "terminado_en": t.isoformat() if t else None,
+            "duracion_ms": d, "error": e,
+        }
+        for j, s, w, r, t, d, e in filas
+    ]
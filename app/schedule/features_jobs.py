@@ -2,7 +2,7 @@ import os
 import subprocess
 from datetime import datetime, timedelta, date
 from zoneinfo import ZoneInfo
-from app.services.features_engine import calcular_persistir_features
+from app.services.features_engine import calcular_persistir_features, recalcular_rango_multi
 from app.extensions import db  
 from flask import current_app
 
@@ -46,12 +46,8 @@ def job_catchup(app, usuario_id: int, dias_atras: int = 3):
         tz = ZoneInfo(app.config.get("TZ", "America/Mexico_City"))
         hoy = datetime.now(tz).date()
         first = hoy - timedelta(days=dias_atras)
-        d = first
-        res = []
-        while d <= hoy:
-            r = calcular_persistir_features(usuario_id=usuario_id, dia=d)
-            res.append(r)
-            d += timedelta(days=1)
-        print(f"[SCHED][catchup] user={usuario_id} dias_atras={dias_atras} → {res}")
+        res = recalcular_rango_multi([usuario_id], first, hoy)
+        print(f"[SCHED][catchup] user={usuario_id} dias_atras={dias_atras} → "
+              f"filas={res['filas']} diarias={res['diarias']} horarias={res['horarias']}")
         return res
 
@@ -0,0 +1,27 @@
+from datetime import date, datetime, timedelta
+from flask import current_app
+from app.services.uso_intradia import reconciliar_dia
+
+
+def job_reconciliar_uso_intradia(app=None, dias: int = None):
+    """
+    Verifica uso_intradia contra `registro` para hoy (y ayer justo después de
+    medianoche, por lotes tardíos de la extensión) y corrige desviaciones.
+    """
+    app = app or current_app
+    with app.app_context():
+        hoy = date.today()
+        if dias is None:
+            dias = 2 if datetime.now().hour < 1 else 1
+        resumenes = []
+        for i in range(dias):
+            dia = hoy - timedelta(days=i)
+            try:
+                res = reconciliar_dia(dia)
+                resumenes.append(res)
+                if res.get("omitido"):
+                    continue
+                print(f"[SCHED][OK][intradia] {dia} → celdas={res['celdas']} corregidas={res['corregidas']}")
+            except Exception as e:
+                print(f"[SCHED][ERR][intradia] {dia} → {e}")
+        return resumenes
@@ -0,0 +1,104 @@
+"""
+Etapas del scheduler: un job por tipo de tarea en lugar de uno por usuario.
+
+Cada etapa, al dispararse:
+- recorre los usuarios en páginas (keyset por id, SCHED_PAGINA_USUARIOS), así
+  los usuarios dados de alta después del arranque entran solos;
+- despacha el trabajo al pool de hilos compartido (SCHED_POOL_WORKERS) con un
+  tope de tareas en vuelo por etapa (SCHED_CONCURRENCIA[etapa]);
+- escalona el primer tramo de tareas con un retraso aleatorio de hasta
+  SCHED_JITTER_S segundos; las siguientes ya salen desfasadas al liberarse cupo.
+
+Las etapas "por página" (ML) reciben la lista de ids de la página y reparten
+ellas mismas el trabajo (app/services/ml_runner.py).
+
+La cadena nocturna (features, agregados, predicción, coach, anomalías) no pasa
+por aquí: es el DAG de app/schedule/nocturno.py, que usa este mismo pool.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from app.schedule.ml_jobs import job_ml_train_daily
+from app.schedule.rachas_jobs import job_rachas
+from app.schedule.perfil_jobs import job_actualizar_perfil
+
+# etapa -> (función, por_pagina)
+ETAPAS = {
+    "ml_train_weekly": (job_ml_train_daily, True),
+    "perfil": (job_actualizar_perfil, False),
+    "rachas": (job_rachas, False),
+}
+
+_lock = threading.Lock()
+_pool = None
+
+
+def pool_compartido(app) -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(app.config.get("SCHED_POOL_WORKERS", 8)),
+                                       thread_name_prefix="sched-etapa")
+        return _pool
+
+
+def paginar_usuarios(app, tam_pagina: int = None):
+    """Genera listas de ids de usuario (orden por id, keyset: sin OFFSET)."""
+    from app.extensions import db
+    from app.models.models import Usuario
+
+    tam_pagina = int(tam_pagina or app.config.get("SCHED_PAGINA_USUARIOS", 200))
+    ultimo = 0
+    while True:
+        with app.app_context():
+            ids = [uid for (uid,) in (
+                db.session.query(Usuario.id)
+                .filter(Usuario.id > ultimo)
+                .order_by(Usuario.id)
+                .limit(tam_pagina)
+                .all()
+            )]
+        if not ids:
+            return
+        yield ids
+        ultimo = ids[-1]
+
+
+def _correr(fn, app, arg, retraso: float):
+    if retraso > 0:
+        time.sleep(retraso)
+    return fn(app, arg)
+
+
+def ejecutar_etapa(app, etapa: str):
+    """Job de APScheduler para una etapa: bloquea hasta que terminan todas sus tareas."""
+    fn, por_pagina = ETAPAS[etapa]
+    cap = int((app.config.get("SCHED_CONCURRENCIA") or {}).get(etapa, 4))
+    jitter = float(app.config.get("SCHED_JITTER_S", 30))
+    pool = pool_compartido(app)
+    cupo = threading.BoundedSemaphore(cap)
+
+    t0 = time.perf_counter()
+    futuros, unidades, usuarios = [], 0, 0
+    for pagina in paginar_usuarios(app):
+        usuarios += len(pagina)
+        for arg in ([pagina] if por_pagina else pagina):
+            cupo.acquire()
+            retraso = random.uniform(0, jitter) if unidades < cap else 0.0
+            fut = pool.submit(_correr, fn, app, arg, retraso)
+            fut.add_done_callback(lambda _f: cupo.release())
+            futuros.append(fut)
+            unidades += 1
+
+    wait(futuros)
+    errores = 0
+    for fut in futuros:
+        if fut.exception() is not None:
+            errores += 1
+            print(f"[SCHED][ETAPA][ERR] {etapa} → {fut.exception()}")
+
+    print(f"[SCHED][ETAPA] {etapa}: {usuarios} usuarios, {unidades} tareas, {errores} errores, "
+          f"concurrencia={cap}, {time.perf_counter() - t0:.1f}s")
+    return {"etapa": etapa, "usuarios": usuarios, "tareas": unidades, "errores": errores}
@@ -1,96 +1,76 @@
 import subprocess
 from datetime import date, timedelta, datetime
-import os
-from app.mysql_conn import get_mysql
+from app.services import ml_runner
+
+
+def _usuarios(app, usuario_id):
+    """usuario_id: un id, una lista de ids (página del scheduler) o None = todos."""
+    if isinstance(usuario_id, (list, tuple)):
+        return list(usuario_id)
+    if usuario_id is not None:
+        return [usuario_id]
+    with app.app_context():
+        from app.models.models import Usuario
+        return [u.id for u in Usuario.query.all()]
 
 
 def job_ml_train(app, usuario_id: int):
     print(f"[SCHED][ML] Entrenando modelo para user={usuario_id}")
-    cmd = [
-        "python3", "-m", "ml.pipeline", "train",
-        "--usuario", str(usuario_id),
-        "--hist", "90", "--holdout", "7"
-    ]
-    subprocess.run(cmd, check=True)
+    ml_runner.ejecutar(app, "train", usuario_id, 90)
 
-def job_ml_train_daily(app, usuario_id: int):
+def job_ml_train_daily(app, usuario_id):
     """
     Wrapper explícito para entrenamiento periódico.
-    Mantiene la importación usada por scheduler.py.
+    Con una lista de ids (etapa ml_train_weekly) entrena toda la página en un solo
+    lote de fits (usuario, categoría).
     """
+    if isinstance(usuario_id, (list, tuple)):
+        print(f"[SCHED][ML] Entrenamiento programado (weekly) users={len(usuario_id)}")
+        ml_runner.ejecutar(app, "train_lote", list(usuario_id), 180)
+        return
     print(f"[SCHED][ML] Entrenamiento programado (weekly) user={usuario_id}")
-    cmd = [
-        "python3", "-m", "ml.pipeline", "train",
-        "--usuario", str(usuario_id),
-        "--hist", "180", "--holdout", "7"
-    ]
-    subprocess.run(cmd, check=True)
+    ml_runner.ejecutar(app, "train", usuario_id, 180)
 
 def job_ml_predict(app, usuario_id: int = None):
     """Genera predicciones para usuario(s)"""
     # Si no se especifica usuario, usar todos los activos
-    if usuario_id is None:
-        with app.app_context():
-            from app.models.models import Usuario
-            usuarios = Usuario.query.all()
-            usuario_ids = [u.id for u in usuarios]
-    else:
-        usuario_ids = [usuario_id]
-    
+    usuario_ids = _usuarios(app, usuario_id)
     tomorrow = (date.today() + timedelta(days=1)).isoformat()
-    
-    for uid in usuario_ids:
-        print(f"[SCHED][ML] Predicción {tomorrow} user={uid}")
-        cmd = [
-            "python3", "-m", "ml.pipeline", "predict",
-            "--usuario", str(uid),
-            "--fecha", tomorrow,
-            "--save-csv"
-        ]
-        try:
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"[SCHED][ERR][PREDICT] user={uid} → {e}")
+
+    print(f"[SCHED][ML] Predicción {tomorrow} users={len(usuario_ids)}")
+    resultados = ml_runner.ejecutar_lote(app, "predict", [(uid, tomorrow, True) for uid in usuario_ids])
+    for uid, res in zip(usuario_ids, resultados):
+        if res and "error" in res:
+            print(f"[SCHED][ERR][PREDICT] user={uid} → {res['error']}")
 
 def job_ml_train_cat(app, usuario_id: int):
-    with app.app_context():
-        from ml.pipeline import train_por_categoria
-        print(f"[JOB][ML] Entrenamiento por categoría iniciado → usuario {usuario_id}")
-        train_por_categoria(usuario_id)
-        print(f"[JOB][ML] Entrenamiento por categoría finalizado → usuario {usuario_id}")
+    print(f"[JOB][ML] Entrenamiento por categoría iniciado → usuario {usuario_id}")
+    ml_runner.ejecutar(app, "train", usuario_id, 180)
+    print(f"[JOB][ML] Entrenamiento por categoría finalizado → usuario {usuario_id}")
 
 def job_ml_predict_multi(app, usuario_id: int = None, fecha_base=None):
     """
     Genera predicciones multi-horizonte POR USUARIO
     Ya no necesita --save-csv porque SIEMPRE guarda por usuario
     """
-    if usuario_id is None:
-        with app.app_context():
-            from app.models.models import Usuario
-            usuarios = Usuario.query.all()
-            usuario_ids = [u.id for u in usuarios]
-    else:
-        usuario_ids = [usuario_id]
-    
+    usuario_ids = _usuarios(app, usuario_id)
+
     if isinstance(fecha_base, str):
         target = fecha_base
     elif fecha_base is None:
         target = date.today().isoformat()
     else:
         target = fecha_base.isoformat()
-    
-    for uid in usuario_ids:
-        print(f"[SCHED][ML] Predicción multi-horizonte {target} user={uid}")
-        cmd = [
-            "python3", "-m", "ml.pipeline", "multi",
-            "--usuario", str(uid),
-            "--fecha", target
-        ]
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            print(f"[SCHED][OK][MULTI] user={uid} → {result.stdout[:200]}")
-        except subprocess.CalledProcessError as e:
-            print(f"[SCHED][ERR][MULTI] user={uid} → {e.stderr}")
+
+    print(f"[SCHED][ML] Predicción multi-horizonte {target} users={len(usuario_ids)}")
+    resultados = ml_runner.ejecutar_lote(app, "multi", [(uid, target) for uid in usuario_ids])
+    for uid, res in zip(usuario_ids, resultados):
+        if res and "error" in res:
+            print(f"[SCHED][ERR][MULTI] user={uid} → {res['error']}")
+        elif res and res["filas"] == 0:
+            print(f"[WARN][MULTI] user={uid} → no se generaron predicciones")
+        else:
+            print(f"[SCHED][OK][MULTI] user={uid} → {res}")
 
 def job_ml_eval_daily(app=None, usuario_id=None):
     """Ejecuta evaluación diaria de desempeño multihorizonte"""
@@ -0,0 +1,337 @@
+"""
+Cadena nocturna como DAG por usuario, en lugar de etapas separadas por horario fijo.
+
+Antes: agregados 00:05, features 00:30, predicción 01:00, alertas 01:30,
+autometas 01:45, anomalías 02:30. Los agregados corrían antes que las features
+de las que dependen y la ventana duraba 2.5 h aunque el trabajo cupiera en minutos.
+
+Ahora un solo job (`ejecutar_noche`) procesa el día cerrado (ayer):
+- cada nodo (usuario, etapa) sale al pool compartido en cuanto terminan sus
+  dependencias (DAG); los usuarios son independientes entre sí;
+- tope de nodos en vuelo por etapa (SCHED_NOCHE_CONCURRENCIA) y total (SCHED_POOL_WORKERS);
+- al terminar un nodo se guarda su marca en sched_etapa_completada
+  (06_migracion_sched_etapas.sql); al reanudar la misma fecha se omiten los
+  nodos ya marcados;
+- si un nodo falla, sus dependientes de ese usuario quedan bloqueados (sin marca)
+  y se reintentan en la próxima ejecución de la fecha;
+- reporte de latencia por etapa (p50/p95/máx) y camino crítico.
+"""
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.schedule.lotes import paginar_usuarios, pool_compartido
+
+
+# ----------------------------------------------------------------------
+# Nodos: (app, usuario_id, fecha) → lanzan excepción si fallan
+# ----------------------------------------------------------------------
+def _features(app, usuario_id: int, fecha: date):
+    from app.services.features_engine import calcular_persistir_features
+    with app.app_context():
+        res = calcular_persistir_features(usuario_id, fecha)
+    if not res or not res.get("ok"):
+        raise RuntimeError("calcular_persistir_features sin resultado (ver log)")
+
+
+def _agg_close(app, usuario_id: int, fecha: date):
+    from app.schedule.agg_jobs import job_agg_close_day
+    if job_agg_close_day(app, usuario_id, fecha=fecha) is None:
+        raise RuntimeError("agg_close_day sin resultado (ver log)")
+
+
+def _ml_predict(app, usuario_id: int, fecha: date):
+    from app.services import ml_runner
+    ml_runner.ejecutar(app, "multi", usuario_id, (fecha + timedelta(days=1)).isoformat())
+
+
+def _coach_alertas(app, usuario_id: int, fecha: date):
+    from app.services.coach_alerta import generar_alertas_exceso
+    with app.app_context():
+        generar_alertas_exceso(usuario_id=usuario_id, dia=fecha)
+
+
+def _coach_autometas(app, usuario_id: int, fecha: date):
+    from app.schedule.coach_jobs import job_coach_autometas
+    job_coach_autometas(app, usuario_id)
+
+
+def _anomalias(app, usuario_id: int, fecha: date):
+    from app.services.detector_anomalias import detectar_anomalia_dia, guardar_anomalia
+    with app.app_context():
+        guardar_anomalia(usuario_id, fecha, detectar_anomalia_dia(usuario_id, fecha))
+
+
+# etapa -> (función, dependencias). Las dependencias son las lecturas reales:
+# agregados, ML (features_categoria_diaria) y alertas leen las features del día;
+# autometas consume las sugerencias que dejan predicción y alertas;
+# anomalías solo lee `registro`.
+DAG = {
+    "features_diarias": (_features, ()),
+    "agg_close": (_agg_close, ("features_diarias",)),
+    "ml_predict_multi": (_ml_predict, ("features_diarias",)),
+    "coach_alertas": (_coach_alertas, ("features_diarias",)),
+    "coach_autometas": (_coach_autometas, ("ml_predict_multi", "coach_alertas")),
+    "detectar_anomalias": (_anomalias, ()),
+}
+
+
+def _orden_topologico(dag: dict) -> list:
+    orden, vistos, en_curso = [], set(), set()
+
+    def visitar(e):
+        if e in vistos:
+            return
+        if e in en_curso:
+            raise ValueError(f"ciclo en el DAG nocturno: {e}")
+        en_curso.add(e)
+        for d in dag[e][1]:
+            visitar(d)
+        en_curso.discard(e)
+        vistos.add(e)
+        orden.append(e)
+
+    for e in dag:
+        visitar(e)
+    return orden
+
+
+ORDEN = _orden_topologico(DAG)
+DEPENDIENTES = {e: [d for d in ORDEN if e in DAG[d][1]] for e in ORDEN}
+
+# Prioridad al despachar: primero las etapas con más camino por delante
+_RESTANTE = {}
+for _e in reversed(ORDEN):
+    _RESTANTE[_e] = 1 + max((_RESTANTE[d] for d in DEPENDIENTES[_e]), default=0)
+PRIORIDAD = sorted(ORDEN, key=lambda e: (-_RESTANTE[e], ORDEN.index(e)))
+
+
+# ----------------------------------------------------------------------
+# Marcas de completado
+# ----------------------------------------------------------------------
+def _marcas(app, fecha: date, usuario_ids: list) -> dict:
+    """usuario_id -> {etapas ya completadas para la fecha}."""
+    hechas = defaultdict(set)
+    try:
+        with app.app_context():
+            filas = db.session.execute(text("""
+                SELECT usuario_id, etapa FROM sched_etapa_completada
+                WHERE fecha = :f AND usuario_id BETWEEN :a AND :b
+            """), {"f": fecha, "a": min(usuario_ids), "b": max(usuario_ids)}).fetchall()
+    except Exception as e:
+        print(f"[NOCHE][WARN] no se pudieron leer marcas ({e}); se ejecuta todo")
+        return hechas
+    ids = set(usuario_ids)
+    for uid, etapa in filas:
+        if uid in ids:
+            hechas[uid].add(etapa)
+    return hechas
+
+
+def marcar(app, fecha: date, etapa: str, usuario_id: int, duracion_s: float):
+    try:
+        with app.app_context():
+            db.session.execute(text("""
+                INSERT INTO sched_etapa_completada (fecha, etapa, usuario_id, completado_en, duracion_ms)
+                VALUES (:f, :e, :u, NOW(), :ms)
+                ON DUPLICATE KEY UPDATE completado_en = VALUES(completado_en), duracion_ms = VALUES(duracion_ms)
+            """), {"f": fecha, "e": etapa, "u": usuario_id, "ms": int(duracion_s * 1000)})
+            db.session.commit()
+    except Exception as e:
+        # El trabajo ya se hizo: sin marca solo se repetirá al reanudar
+        print(f"[NOCHE][WARN] sin marca {etapa} user={usuario_id} {fecha} → {e}")
+
+
+def correr_nodo(app, etapa: str, usuario_id: int, fecha: date) -> float:
+    t0 = time.perf_counter()
+    DAG[etapa][0](app, usuario_id, fecha)
+    duracion = time.perf_counter() - t0
+    marcar(app, fecha, etapa, usuario_id, duracion)
+    return duracion
+
+
+# ----------------------------------------------------------------------
+# Ejecutor
+# ----------------------------------------------------------------------
+def _ayer(app) -> date:
+    tz = ZoneInfo(app.config.get("TZ", "America/Mexico_City"))
+    return datetime.now(tz).date() - timedelta(days=1)
+
+
+def _topes(app) -> dict:
+    conf = app.config.get("SCHED_NOCHE_CONCURRENCIA") or {}
+    topes = {}
+    for e in ORDEN:
+        n = int(conf.get(e, 2) or 0)
+        if n <= 0:  # 0 = tantos como workers del pool ML
+            n = int(app.config.get("ML_POOL_WORKERS", 1) or 0)
+        topes[e] = max(1, n)
+    return topes
+
+
+def _percentil(valores: list, q: float) -> float:
+    v = sorted(valores)
+    return v[min(len(v) - 1, int(round(q * (len(v) - 1))))]
+
+
+def ejecutar_noche(app, fecha: date = None, usuario_ids: list = None) -> dict:
+    """
+    Corre el DAG nocturno para `fecha` (por defecto ayer en TZ) sobre todos los
+    usuarios (o `usuario_ids`). Idempotente: se puede relanzar para la misma fecha.
+    """
+    fecha = fecha or _ayer(app)
+    topes = _topes(app)
+    max_vuelo = int(app.config.get("SCHED_POOL_WORKERS", 8))
+    tam_pagina = int(app.config.get("SCHED_PAGINA_USUARIOS", 200))
+    pool = pool_compartido(app)
+    paginas = iter([sorted(usuario_ids)]) if usuario_ids else paginar_usuarios(app, tam_pagina)
+
+    listos = {e: deque() for e in ORDEN}
+    faltan = {}                   # usuario_id -> {etapa: dependencias sin terminar}
+    dur_usuario = defaultdict(dict)
+    en_vuelo = {}                 # future -> (usuario_id, etapa)
+    vuelo_etapa = defaultdict(int)
+    cuenta = {e: {"ok": 0, "errores": 0, "bloqueadas": 0, "omitidas": 0} for e in ORDEN}
+    latencias = defaultdict(list)
+    estado = {"paginas_agotadas": False, "usuarios": 0}
+
+    def cargar_pagina():
+        pagina = next(paginas, None)
+        if pagina is None:
+            estado["paginas_agotadas"] = True
+            return
+        hechas = _marcas(app, fecha, pagina)
+        estado["usuarios"] += len(pagina)
+        for uid in pagina:
+            ya = hechas.get(uid, set())
+            pend = {}
+            for e in ORDEN:
+                if e in ya:
+                    cuenta[e]["omitidas"] += 1
+                    continue
+                pend[e] = {d for d in DAG[e][1] if d not in ya}
+                if not pend[e]:
+                    listos[e].append(uid)
+            if pend:
+                faltan[uid] = pend
+
+    def terminar(uid, etapa):
+        faltan[uid].pop(etapa, None)
+        if not faltan[uid]:
+            del faltan[uid]
+
+    def bloquear(uid, etapa):
+        for d in DEPENDIENTES[etapa]:
+            if uid in faltan and d in faltan[uid]:
+                cuenta[d]["bloqueadas"] += 1
+                terminar(uid, d)
+                bloquear(uid, d)
+
+    t0 = time.perf_counter()
+    while True:
+        while not estado["paginas_agotadas"] and len(faltan) < tam_pagina:
+            cargar_pagina()
+
+        for e in PRIORIDAD:
+            while listos[e] and vuelo_etapa[e] < topes[e] and len(en_vuelo) < max_vuelo:
+                uid = listos[e].popleft()
+                en_vuelo[pool.submit(correr_nodo, app, e, uid, fecha)] = (uid, e)
+                vuelo_etapa[e] += 1
+
+        if not en_vuelo:
+            if estado["paginas_agotadas"]:
+                break
+            continue
+
+        hechos, _ = wait(list(en_vuelo), return_when=FIRST_COMPLETED)
+        for fut in hechos:
+            uid, e = en_vuelo.pop(fut)
+            vuelo_etapa[e] -= 1
+            try:
+                dur = fut.result()
+            except Exception as ex:
+                cuenta[e]["errores"] += 1
+                print(f"[NOCHE][ERR] {e} user={uid} {fecha} → {ex}")
+                bloquear(uid, e)
+                terminar(uid, e)
+                continue
+            cuenta[e]["ok"] += 1
+            latencias[e].append(dur)
+            dur_usuario[uid][e] = dur
+            for d in DEPENDIENTES[e]:
+                pend = faltan[uid].get(d)
+                if pend is not None:
+                    pend.discard(e)
+                    if not pend:
+                        listos[d].append(uid)
+            terminar(uid, e)
+
+    # Camino crítico: la cadena de dependencias más larga de un usuario (solo nodos corridos)
+    critico = 0.0
+    for durs in dur_usuario.values():
+        fin = {}
+        for e in ORDEN:
+            fin[e] = durs.get(e, 0.0) + max((fin[d] for d in DAG[e][1]), default=0.0)
+        critico = max(critico, max(fin.values()))
+
+    etapas = {}
+    for e in ORDEN:
+        lat = latencias[e]
+        etapas[e] = dict(cuenta[e], **({
+            "p50_s": round(_percentil(lat, 0.50), 3),
+            "p95_s": round(_percentil(lat, 0.95), 3),
+            "max_s": round(max(lat), 3),
+            "total_s": round(sum(lat), 3),
+        } if lat else {}))
+
+    reporte = {
+        "fecha": fecha.isoformat(),
+        "usuarios": estado["usuarios"],
+        "pared_s": round(time.perf_counter() - t0, 3),
+        "camino_critico_s": round(critico, 3),
+        "etapas": etapas,
+    }
+    print(f"[NOCHE] {fecha}: {reporte['usuarios']} usuarios en {reporte['pared_s']}s "
+          f"(camino crítico por usuario {reporte['camino_critico_s']}s)")
+    for e, m in etapas.items():
+        lat = f" p50={m['p50_s']}s p95={m['p95_s']}s máx={m['max_s']}s" if "p50_s" in m else ""
+        print(f"[NOCHE]   {e}: ok={m['ok']} err={m['errores']} bloq={m['bloqueadas']} "
+              f"omit={m['omitidas']}{lat}")
+    return reporte
+
+
+def reporte(app, fecha: date = None) -> dict:
+    """Resumen por etapa desde las marcas (sirve entre workers y tras reinicios)."""
+    fecha = fecha or _ayer(app)
+    with app.app_context():
+        filas = db.session.execute(text("""
+            SELECT etapa, COUNT(*), AVG(duracion_ms), MAX(duracion_ms),
+                   MIN(completado_en), MAX(completado_en)
+            FROM sched_etapa_completada
+            WHERE fecha = :f
+            GROUP BY etapa
+        """), {"f": fecha}).fetchall()
+    etapas = {
+        etapa: {
+            "completados": int(n),
+            "promedio_ms": float(prom or 0),
+            "max_ms": int(mx or 0),
+            "primero": ini.isoformat() if ini else None,
+            "ultimo": fin.isoformat() if fin else None,
+        }
+        for etapa, n, prom, mx, ini, fin in filas
+    }
+    inicios = [v["primero"] for v in etapas.values() if v["primero"]]
+    fines = [v["ultimo"] for v in etapas.values() if v["ultimo"]]
+    return {
+        "fecha": fecha.isoformat(),
+        "orden": ORDEN,
+        "dependencias": {e: list(DAG[e][1]) for e in ORDEN},
+        "etapas": etapas,
+        "ventana": {"inicio": min(inicios) if inicios else None, "fin": max(fines) if fines else None},
+    }
@@ -1,23 +1,18 @@
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from flask import current_app
-from app.schedule.features_jobs import job_features_diarias
-from app.schedule.agg_jobs import job_agg_close_day
-from app.schedule.ml_jobs import (
-    job_ml_train,
-    job_ml_train_cat,
-    job_ml_predict,
-)
-from app.schedule.ml_jobs import job_ml_train_daily
-from app.schedule.ml_jobs import job_ml_predict_multi
 from app.schedule.ml_jobs import job_ml_eval_weekly
-from app.schedule.coach_jobs import job_coach_alertas, job_coach_autometas
-from app.schedule.rachas_jobs import job_rachas
 from .ml_jobs import job_ml_eval_daily
-from app.schedule.anomalias_jobs import job_detectar_anomalias, job_monitoreo_tiempo_real
+from app.schedule.anomalias_jobs import job_monitoreo_tiempo_real
+from app.schedule.clasificador_jobs import job_reentrenar_clasificador
+from app.schedule.lotes import ejecutar_etapa
+from app.schedule.nocturno import ejecutar_noche
+from app.schedule.intradia_jobs import job_reconciliar_uso_intradia
+from app.schedule.candados import ejecutar_exclusivo
 
 _SCHED = None 
 
@@ -44,13 +39,22 @@ def get_scheduler_global():
     except Exception:
         return _SCHED
 
-def _usuarios_activos():
-    """Devuelve IDs de usuarios activos en el sistema."""
-    from app.models import Usuario
-    try:
-        return [u.id for u in Usuario.query.all()]
-    except Exception:
-        return [1]
+def _add_job(sched, app, func, trigger, args, id, grupo=None, **opciones):
+    """
+    add_job envuelto en candados.ejecutar_exclusivo: con varios workers de gunicorn
+    cada disparo lo ejecuta solo el worker que lo reclama (app/schedule/candados.py).
+    Se pasa el trigger para reclamar por hora programada; los IntervalTrigger necesitan
+    start_date fijo (igual en todos los workers).
+    """
+    slot_s = int(trigger.interval.total_seconds()) if isinstance(trigger, IntervalTrigger) else 60
+    sched.add_job(
+        func=ejecutar_exclusivo,
+        trigger=trigger,
+        args=[app, id, func, *args],
+        kwargs={"grupo": grupo, "slot_s": slot_s, "trigger": trigger},
+        id=id,
+        **opciones,
+    )
 
 def start_scheduler(app):
     """
@@ -69,120 +73,81 @@ def start_scheduler(app):
         return
 
     with app.app_context():
-        usuarios = _usuarios_activos()
-
-        for uid in usuarios:
-            # FEATURES DIARIAS - Solo una vez al día (00:30)
-            sched.add_job(
-                func=job_features_diarias,
-                trigger=CronTrigger(hour=0, minute=30, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"features_diarias_u{uid}",
-                replace_existing=True,
-                coalesce=True,
-                max_instances=1,
-            )
-
-            # CIERRE DE DÍA - 00:05
-            sched.add_job(
-                func=job_agg_close_day,
-                trigger=CronTrigger(hour=0, minute=5, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"agg_close_u{uid}",
-                replace_existing=True,
-                coalesce=True,
-                max_instances=1,
-            )
-
-            # ENTRENAMIENTO SEMANAL - Domingos 02:00
-            sched.add_job(
-                func=job_ml_train_daily,
-                trigger=CronTrigger(day_of_week="sun", hour=2, minute=0, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"ml_train_weekly_u{uid}",
-                replace_existing=True,
-                coalesce=True,
-                max_instances=1,
-            )
-
-            # PREDICCIONES MULTI - 01:00
-            sched.add_job(
-                func=job_ml_predict_multi,
-                trigger=CronTrigger(hour=1, minute=0, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"ml_predict_multi_u{uid}",
-                replace_existing=True,
-                coalesce=True,
-                max_instances=1,
-            )
-
-            # ALERTAS DEL COACH - 01:30
-            sched.add_job(
-                func=job_coach_alertas,
-                trigger=CronTrigger(hour=1, minute=30, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"coach_alertas_u{uid}",
-                replace_existing=True,
-                coalesce=True,
-                max_instances=1,
-            )
-
-            # RACHAS - 23:55
-            sched.add_job(
-                func=job_rachas,
-                trigger=CronTrigger(hour=23, minute=55, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"rachas_cierre_u{uid}",
+        # Cadena nocturna como DAG por usuario (app/schedule/nocturno.py):
+        # features → agregados / predicción / alertas → autometas, y anomalías
+        _add_job(
+            sched, app,
+            func=ejecutar_noche,
+            trigger=CronTrigger(hour=0, minute=5, timezone=sched.timezone),
+            args=[app],
+            id="noche",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
+        # Tras un reinicio: completa la noche de ayer (los nodos con marca se omiten).
+        # Minuto redondo: workers que arrancan en el mismo minuto reclaman el mismo slot.
+        ahora = datetime.now(sched.timezone)
+        if app.config.get("SCHED_NOCHE_REANUDAR", True) and (ahora.hour, ahora.minute) >= (0, 5):
+            _add_job(
+                sched, app,
+                func=ejecutar_noche,
+                trigger=DateTrigger(run_date=ahora.replace(second=0, microsecond=0) + timedelta(minutes=2),
+                                    timezone=sched.timezone),
+                args=[app],
+                id="noche_reanudar",
+                grupo="noche",
                 replace_existing=True,
-                coalesce=True,
                 max_instances=1,
             )
 
-            # EVALUACIÓN DIARIA - 02:00
-            sched.add_job(
-                func=job_ml_eval_daily,
-                trigger=CronTrigger(hour=2, minute=0, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"ml_eval_daily_u{uid}",
-                replace_existing=True,
-                coalesce=True,
-                max_instances=1,
-            )
-            # DETECCIÓN DE ANOMALÍAS - 02:30
-            sched.add_job(
-                func=job_detectar_anomalias,
-                trigger=CronTrigger(hour= 2, minute=30, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"detectar_anomalias_u{uid}",
+        # Un job por etapa: cada ejecución pagina los usuarios vigentes (app/schedule/lotes.py)
+        etapas = [
+            ("ml_train_weekly", CronTrigger(day_of_week="sun", hour=2, minute=0, timezone=sched.timezone)),
+            ("perfil", CronTrigger(day_of_week="sun", hour=4, minute=0, timezone=sched.timezone)),
+            ("rachas", CronTrigger(hour=23, minute=55, timezone=sched.timezone)),
+        ]
+        for etapa, trigger in etapas:
+            _add_job(
+                sched, app,
+                func=ejecutar_etapa,
+                trigger=trigger,
+                args=[app, etapa],
+                id=f"etapa_{etapa}",
                 replace_existing=True,
                 coalesce=True,
                 max_instances=1,
             )
-            from app.schedule.perfil_jobs import job_actualizar_perfil
-
-            sched.add_job(
-                func=job_actualizar_perfil,
-                trigger=CronTrigger(day_of_week='sun', hour=4, minute=0),
-                args=[app, uid],
-                id=f"perfil_u{uid}",
-                replace_existing=True
-            )
-            print(f"  [PERFIL] Job perfil usuario {uid} programado (Dom 04:00)")
-            from app.schedule.clasificador_jobs import job_reentrenar_clasificador
-
-            sched.add_job(
-                func=job_reentrenar_clasificador,
-                trigger=CronTrigger(hour=3, minute=0),  # Diario a las 3:00 AM
-                args=[app],
-                id="reentrenar_clasificador_diario",
-                replace_existing=True
-            )
-            print("[CLASIFICADOR] Job de reentrenamiento programado (Diario 03:00)")
+        print(f"[SCHED][LOAD] DAG nocturno + {len(etapas)} etapas registradas (usuarios por páginas de "
+              f"{app.config.get('SCHED_PAGINA_USUARIOS', 200)})")
+
+        # EVALUACIÓN DIARIA (GLOBAL) - 02:00
+        _add_job(
+            sched, app,
+            func=job_ml_eval_daily,
+            trigger=CronTrigger(hour=2, minute=0, timezone=sched.timezone),
+            args=[app],
+            id="ml_eval_daily",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
 
-            print(f"[SCHED][LOAD] Jobs registrados para user={uid}")
+        # REENTRENAMIENTO DEL CLASIFICADOR (GLOBAL) - 03:00
+        _add_job(
+            sched, app,
+            func=job_reentrenar_clasificador,
+            trigger=CronTrigger(hour=3, minute=0, timezone=sched.timezone),
+            args=[app],
+            id="reentrenar_clasificador_diario",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
 
         # EVALUACIÓN SEMANAL (GLOBAL) - Domingos 03:00
-        sched.add_job(
+        _add_job(
+            sched, app,
             func=job_ml_eval_weekly,
             trigger=CronTrigger(day_of_week="sun", hour=3, minute=0, timezone=sched.timezone),
             args=[app],
@@ -191,18 +156,9 @@ def start_scheduler(app):
             coalesce=True,
             max_instances=1,
         )
-        # AUTOMETAS GENERADAS POR ML
-        sched.add_job(
-                func=job_coach_autometas,
-                trigger=CronTrigger(hour=1, minute=45, timezone=sched.timezone),
-                args=[app, uid],
-                id=f"coach_autometas_u{uid}",
-                replace_existing=True,
-                coalesce=True,
-                max_instances=1,
-        )
         for hora in range(8, 24):  # 8 AM - 11 PM
-            sched.add_job(
+            _add_job(
+                sched, app,
                 func=job_monitoreo_tiempo_real,
                 trigger=CronTrigger(hour=hora, minute=15, timezone=sched.timezone),
                 args=[app, None],  # ← None = todos los usuarios
@@ -211,6 +167,21 @@ def start_scheduler(app):
                 coalesce=True,
                 max_instances=1,
             )
+
+        # RECONCILIACIÓN uso_intradia vs registro (global)
+        _add_job(
+            sched, app,
+            func=job_reconciliar_uso_intradia,
+            # Alineado a la medianoche: todos los workers disparan en el mismo slot
+            trigger=IntervalTrigger(minutes=app.config.get("USO_INTRADIA_RECONCILIAR_MIN", 30),
+                                    start_date=ahora.replace(hour=0, minute=0, second=0, microsecond=0),
+                                    timezone=sched.timezone),
+            args=[app],
+            id="reconciliar_uso_intradia",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
         
         sched.start()
         register_scheduler(app, sched)
@@ -221,13 +192,12 @@ def start_scheduler(app):
 
         print("[SCHED][OK] scheduler iniciado")
         print("[SCHED][INFO] Horarios configurados:")
-        print("  • 00:05 - Cierre de día")
-        print("  • 00:30 - Features diarias")
-        print("  • 01:00 - Predicciones multi-horizonte")
-        print("  • 01:30 - Alertas del coach")
+        print("  • 00:05 - Noche (DAG por usuario): features → agregados / predicción / alertas → autometas; anomalías")
         print("  • 02:00 - Evaluación diaria + Entrenamiento (domingos)")
         print("  • 03:00 - Evaluación semanal (domingos)")
         print("  • 23:55 - Rachas")
+        print("  • 04:00 - Perfil (domingos)")
+        print(f"  • cada {app.config.get('USO_INTRADIA_RECONCILIAR_MIN', 30)} min - Reconciliación uso_intradia")
 
     return sched
 
@@ -9,169 +9,215 @@ import logging
 from datetime import date, datetime, timedelta
 from typing import Dict, Iterable, Tuple
 from collections import defaultdict
-from app.models.models import Registro, Categoria, MetaCategoria, LimiteCategoria, UsuarioLogro, DominioCategoria, ContextoDia, PatronCategoria, RachaUsuario, ConfiguracionLogro, AggEstadoDia, AggVentanaCategoria, AggKpiRango
+import numpy as np
+from app.models.models import Registro, Categoria, MetaCategoria, LimiteCategoria, UsuarioLogro, DominioCategoria, ContextoDia, PatronCategoria, RachaUsuario, ConfiguracionLogro, AggKpiRango
 from app.models.ml import MLModelo, MLPrediccionFuture, MlMetric
 from app.models.features import FeatureDiaria, FeatureHoraria
 from app.models.models_coach import CoachAlerta, CoachSugerencia, CoachAccionLog, NotificacionClasificacion, CoachEstadoRegla
 from app.extensions import db
+from app.services.cubo_features import cargar_rango
 from sqlalchemy import func, and_, text
 
 logger = logging.getLogger(__name__)
 
 PRODUCTIVAS = {"productividad", "estudio", "herramientas", "trabajo"}  
 
-def _categoria_id_por_nombre(nombre: str):
-    row = db.session.execute(
-        text("SELECT id FROM categorias WHERE nombre = :n LIMIT 1"),
-        {"n": nombre}
-    ).fetchone()
-    return row[0] if row else None
-
 def _rango(fecha_fin: date, dias: int) -> Tuple[date, date]:
     return (fecha_fin - timedelta(days=dias - 1), fecha_fin)
 
 
 def _minutos_por_categoria(usuario_id: int, f_ini: date, f_fin: date) -> Dict[str, float]:
     """
-    Retorna minutos totales por categoría en el rango [f_ini, f_fin]
+    Retorna minutos totales por categoría en el rango [f_ini, f_fin] (leído de MySQL)
+    """
+    return {c: float(m) for c, m in cargar_rango(usuario_id, f_ini, f_fin).suma_por_categoria(f_ini, f_fin).items()}
+
+
+def _es_productiva(categoria) -> bool:
+    return bool(categoria) and categoria.lower() in PRODUCTIVAS
+
+
+def _split_productivo_por_dia(usuario_id: int, f_ini: date, f_fin: date) -> Dict[date, Tuple[float, float]]:
+    """{fecha: (min_productivo, min_no_productivo)} para el rango [f_ini, f_fin] (leído de MySQL)."""
+    categorias, minutos, presencia = cargar_rango(usuario_id, f_ini, f_fin).matriz(f_ini, f_fin)
+    if not categorias:
+        return {}
+    prod = np.array([_es_productiva(c) for c in categorias])
+    p = minutos[:, prod].sum(axis=1)
+    n = minutos[:, ~prod].sum(axis=1)
+    return {
+        f_ini + timedelta(days=int(i)): (float(p[i]), float(n[i]))
+        for i in np.flatnonzero(presencia.any(axis=1))
+    }
+
+
+def _total_productivo(usuario_id: int, f_fin: date) -> Tuple[float, float]:
+    """
+    (productivo, no productivo) de todo el historial hasta f_fin. Recorrido completo en
+    MySQL a propósito: es la referencia con la que se verifican los KPIs incrementales.
     """
     rows = (
         db.session.query(FeatureDiaria.categoria, func.sum(FeatureDiaria.minutos))
-        .filter(
-            FeatureDiaria.usuario_id == usuario_id,
-            FeatureDiaria.fecha >= f_ini,
-            FeatureDiaria.fecha <= f_fin,
-        )
+        .filter(FeatureDiaria.usuario_id == usuario_id, FeatureDiaria.fecha <= f_fin)
         .group_by(FeatureDiaria.categoria)
         .all()
     )
-    return {cat: float(mins or 0.0) for cat, mins in rows}
+    prod = sum(float(m or 0.0) for c, m in rows if _es_productiva(c))
+    nprod = sum(float(m or 0.0) for c, m in rows if not _es_productiva(c))
+    return prod, nprod
 
 
-def _dias_con_datos_por_categoria(usuario_id: int, f_ini: date, f_fin: date) -> Dict[str, int]:
+_SQL_UPSERT_VENTANA = text("""
+    INSERT INTO agg_ventana_categoria
+        (usuario_id, categoria, ventana, fecha_fin, minutos_sum, minutos_promedio, dias_con_datos, pct_del_total)
+    VALUES (:usuario_id, :categoria, :ventana, :fecha_fin, :minutos_sum, :minutos_promedio, :dias_con_datos, :pct_del_total)
+    ON DUPLICATE KEY UPDATE
+        minutos_sum = VALUES(minutos_sum),
+        minutos_promedio = VALUES(minutos_promedio),
+        dias_con_datos = VALUES(dias_con_datos),
+        pct_del_total = VALUES(pct_del_total)
+""")
+
+
+def _serie_diaria(usuario_id: int, f_ini: date, f_fin: date):
     """
-    Cuenta cuántos días (fechas) tuvieron minutos > 0 por categoría en el rango.
+    Matrices densas día×categoría del rango, leídas de MySQL (sin la caché por worker:
+    lo que se persiste no puede salir de un cubo viejo):
+    (categorias, minutos, presencia) con presencia=1 si existe fila ese día (aunque sean 0 min).
     """
-    rows = (
-        db.session.query(FeatureDiaria.categoria, FeatureDiaria.fecha, func.sum(FeatureDiaria.minutos))
-        .filter(
-            FeatureDiaria.usuario_id == usuario_id,
-            FeatureDiaria.fecha >= f_ini,
-            FeatureDiaria.fecha <= f_fin,
-        )
-        .group_by(FeatureDiaria.categoria, FeatureDiaria.fecha)
-        .having(func.sum(FeatureDiaria.minutos) > 0)
-        .all()
-    )
-    cont = defaultdict(int)
-    for cat, _fecha, _mins in rows:
-        cont[cat] += 1
-    return dict(cont)
-
-
-def _total_global(usuario_id: int, f_ini: date, f_fin: date) -> float:
-    total = (
-        db.session.query(func.sum(FeatureDiaria.minutos))
-        .filter(
-            FeatureDiaria.usuario_id == usuario_id,
-            FeatureDiaria.fecha >= f_ini,
-            FeatureDiaria.fecha <= f_fin,
-        )
-        .scalar()
-    )
-    return float(total or 0.0)
+    return cargar_rango(usuario_id, f_ini, f_fin).matriz(f_ini, f_fin)
 
 
-def _meta_limite_en_fecha(usuario_id: int, categoria: str, f):
+def _ventanas_deslizantes(minutos, presencia, ventanas, inicio: int):
     """
-    Lee meta y límite desde tus tablas:
-      - metas_categoria: meta_minutos (o minutos_meta)
-      - limite_categoria: limite_minutos
-    Usa categoria_id (resolviendo por nombre en 'categorias'). Si no existe, intenta por nombre directo.
-    Devuelve (meta_min, limite_min) como float o None.
+    Sumas por ventana con sumas acumuladas: para cada fin e >= inicio y cada W,
+    sum[e] = S[e+1] - S[e+1-W]. Devuelve {W: (sum, dias_con_datos, con_filas, total)}
+    con matrices (n_fines × categorías) y total (n_fines,).
     """
-    meta = None
-    limite = None
-
-
-    cat_id = _categoria_id_por_nombre(categoria)
-
-    if cat_id is not None:
-
-        for col in ("meta_minutos", "minutos_meta"):
-            try:
-                row = db.session.execute(
-                    text(f"""
-                        SELECT {col} AS m
-                        FROM metas_categoria
-                        WHERE usuario_id = :u AND categoria_id = :c
-                        ORDER BY fecha DESC, id DESC
-                        LIMIT 1
-                    """),
-                    {"u": usuario_id, "c": cat_id},
-                ).fetchone()
-                if row and row[0] is not None:
-                    meta = float(row[0])
-                    break
-            except Exception:
+    n = minutos.shape[0]
+    ceros = np.zeros((1, minutos.shape[1]))
+    s_min = np.vstack([ceros, np.cumsum(minutos, axis=0)])
+    s_pos = np.vstack([ceros, np.cumsum(minutos > 0, axis=0)])
+    s_pre = np.vstack([ceros, np.cumsum(presencia, axis=0)])
+
+    fin = np.arange(inicio, n) + 1
+    res = {}
+    for w in ventanas:
+        ini = np.maximum(fin - w, 0)
+        suma = s_min[fin] - s_min[ini]
+        res[w] = (suma, s_pos[fin] - s_pos[ini], (s_pre[fin] - s_pre[ini]) > 0, suma.sum(axis=1))
+    return res
+
+
+# ----------------------------------------------------------------------
+# Metas y límites: esquema probado una vez + resolver por usuario en bloque
+# ----------------------------------------------------------------------
+_ESQUEMA_METAS_LIMITES = None
+
+
+def probar_esquema_metas_limites(forzar: bool = False) -> dict:
+    """
+    Detecta una sola vez (al arrancar) qué columnas existen en metas_categoria y
+    limite_categoria, para no tantear nombres dentro de try/except en cada consulta.
+    """
+    global _ESQUEMA_METAS_LIMITES
+    if _ESQUEMA_METAS_LIMITES is not None and not forzar:
+        return _ESQUEMA_METAS_LIMITES
+
+    from sqlalchemy import inspect
+    insp = inspect(db.engine)
+    cols_meta = {c["name"] for c in insp.get_columns("metas_categoria")}
+    cols_lim = {c["name"] for c in insp.get_columns("limite_categoria")}
+
+    col_meta = next((c for c in ("minutos_meta", "meta_minutos") if c in cols_meta), None)
+    orden_meta = "m.fecha, m.id" if "fecha" in cols_meta else "m.id"
+    orden_lim = "l.updated_at, l.id" if "updated_at" in cols_lim else "l.id"
+
+    _ESQUEMA_METAS_LIMITES = {
+        "col_meta": col_meta,
+        "meta_con_fecha": "fecha" in cols_meta,
+        "orden_meta": orden_meta,
+        "orden_limite": orden_lim,
+    }
+    print(f"[AGG] Esquema metas/límites: {_ESQUEMA_METAS_LIMITES}")
+    return _ESQUEMA_METAS_LIMITES
+
+
+class ResolverMetasLimites:
+    """
+    Carga todas las metas y límites del usuario en dos consultas y responde
+    (meta_min, limite_min) por nombre o id de categoría para cualquier día del lote.
+
+    Meta: la más reciente con fecha <= f (si no hay, la más reciente registrada).
+    Límite: el último registrado.
+    """
+
+    def __init__(self, usuario_id: int):
+        esquema = probar_esquema_metas_limites()
+        self.usuario_id = usuario_id
+        self._metas = defaultdict(list)   # categoria_id -> [(fecha, minutos)] ascendente
+        self._limites = {}                # categoria_id -> minutos
+        self._ids = {}                    # nombre -> categoria_id
+
+        if esquema["col_meta"]:
+            fecha_sql = "m.fecha" if esquema["meta_con_fecha"] else "NULL"
+            rows = db.session.execute(text(f"""
+                SELECT m.categoria_id, c.nombre, m.{esquema["col_meta"]}, {fecha_sql}
+                FROM metas_categoria m
+                LEFT JOIN categorias c ON c.Id = m.categoria_id
+                WHERE m.usuario_id = :u
+                ORDER BY {esquema["orden_meta"]}
+            """), {"u": usuario_id}).fetchall()
+            for cat_id, nombre, minutos, fecha in rows:
+                if minutos is None:
+                    continue
+                self._metas[cat_id].append((fecha, float(minutos)))
+                if nombre:
+                    self._ids[nombre] = cat_id
+
+        rows = db.session.execute(text(f"""
+            SELECT l.categoria_id, c.nombre, l.limite_minutos
+            FROM limite_categoria l
+            LEFT JOIN categorias c ON c.Id = l.categoria_id
+            WHERE l.usuario_id = :u
+            ORDER BY {esquema["orden_limite"]}
+        """), {"u": usuario_id}).fetchall()
+        for cat_id, nombre, minutos in rows:
+            if minutos is None:
                 continue
+            self._limites[cat_id] = float(minutos)
+            if nombre:
+                self._ids[nombre] = cat_id
+
+    def en_fecha(self, categoria, f: date) -> Tuple[float, float]:
+        """categoria: nombre (str) o categoria_id (int)."""
+        cat_id = categoria if isinstance(categoria, int) else self._ids.get(categoria)
+        if cat_id is None:
+            return None, None
+
+        meta = None
+        metas = self._metas.get(cat_id)
+        if metas:
+            meta = metas[-1][1]
+            for fecha, minutos in reversed(metas):
+                if fecha is None or fecha <= f:
+                    meta = minutos
+                    break
+        return meta, self._limites.get(cat_id)
+
 
+_SQL_UPSERT_ESTADO = text("""
+    INSERT INTO agg_estado_dia
+        (usuario_id, fecha, categoria, minutos, meta_min, limite_min, cumplio_meta, excedio_limite)
+    VALUES (:usuario_id, :fecha, :categoria, :minutos, :meta_min, :limite_min, :cumplio_meta, :excedio_limite)
+    ON DUPLICATE KEY UPDATE
+        minutos = VALUES(minutos),
+        meta_min = VALUES(meta_min),
+        limite_min = VALUES(limite_min),
+        cumplio_meta = VALUES(cumplio_meta),
+        excedio_limite = VALUES(excedio_limite)
+""")
 
-        try:
-            row = db.session.execute(
-                text("""
-                    SELECT limite_minutos
-                    FROM limite_categoria
-                    WHERE usuario_id = :u AND categoria_id = :c
-                    ORDER BY updated_at DESC, id DESC
-                    LIMIT 1
-                """),
-                {"u": usuario_id, "c": cat_id},
-            ).fetchone()
-            if row and row[0] is not None:
-                limite = float(row[0])
-        except Exception:
-            pass
-
-        return meta, limite
-
-
-    for col in ("meta_minutos", "minutos_meta"):
-        try:
-            row = db.session.execute(
-                text(f"""
-                    SELECT {col} AS m
-                    FROM metas_categoria
-                    WHERE usuario_id = :u AND (categoria = :cat OR categoria_nombre = :cat)
-                    ORDER BY fecha DESC, id DESC
-                    LIMIT 1
-                """),
-                {"u": usuario_id, "cat": categoria},
-            ).fetchone()
-            if row and row[0] is not None:
-                meta = float(row[0])
-                break
-        except Exception:
-            continue
-
-
-    try:
-        row = db.session.execute(
-            text("""
-                SELECT limite_minutos
-                FROM limite_categoria
-                WHERE usuario_id = :u AND (categoria = :cat OR categoria_nombre = :cat)
-                ORDER BY updated_at DESC, id DESC
-                LIMIT 1
-            """),
-            {"u": usuario_id, "cat": categoria},
-        ).fetchone()
-        if row and row[0] is not None:
-            limite = float(row[0])
-    except Exception:
-        pass
-
-    return meta, limite
 
 class AgregadosEngine:
     """
@@ -182,44 +228,76 @@ class AgregadosEngine:
     VENTANAS = (7, 14, 30)
 
     def calcular_ventanas_usuario(self, usuario_id: int, fecha_fin: date) -> Dict[str, int]:
-        logger.info(f"[AGG] Ventanas user={usuario_id} fecha_fin={fecha_fin}")
+        return self.calcular_ventanas_rango(usuario_id, fecha_fin, fecha_fin)
+
+    def calcular_ventanas_rango(self, usuario_id: int, desde: date, hasta: date,
+                                lote: int = 5000) -> Dict[str, int]:
+        """
+        Ventanas 7/14/30d para cada fecha_fin en [desde, hasta] en una sola pasada:
+        la serie del cubo en memoria (desde - 29 días .. hasta), sumas acumuladas
+        por categoría y UPSERT en bloque de agg_ventana_categoria.
+        """
+        logger.info(f"[AGG] Ventanas user={usuario_id} rango={desde}..{hasta}")
         cont = {"ventanas": 0, "categorias": 0}
-
-        for dias in self.VENTANAS:
-            f_ini, f_fin = _rango(fecha_fin, dias)
-            por_cat = _minutos_por_categoria(usuario_id, f_ini, f_fin)
-            dias_cat = _dias_con_datos_por_categoria(usuario_id, f_ini, f_fin)
-            total = _total_global(usuario_id, f_ini, f_fin) or 1.0
-
-            for cat, mins in por_cat.items():
-                dias_con = int(dias_cat.get(cat, 0)) or 1
-                obj = AggVentanaCategoria(
-                    usuario_id=usuario_id,
-                    categoria=cat,
-                    ventana=f"{dias}d",
-                    fecha_fin=fecha_fin,
-                    minutos_sum=mins,
-                    minutos_promedio=mins / dias_con,
-                    dias_con_datos=dias_con,
-                    pct_del_total=(mins / total),
-                )
-                db.session.merge(obj)
-                cont["ventanas"] += 1
-
-            cont["categorias"] = max(cont["categorias"], len(por_cat))
-
+        if hasta < desde:
+            return cont
+
+        f_ini = desde - timedelta(days=max(self.VENTANAS) - 1)
+        categorias, minutos, presencia = _serie_diaria(usuario_id, f_ini, hasta)
+        if not categorias:
+            return cont
+
+        inicio = (desde - f_ini).days
+        filas = []
+        for dias, (suma, dias_pos, con_filas, total) in _ventanas_deslizantes(
+                minutos, presencia, self.VENTANAS, inicio).items():
+            ventana = f"{dias}d"
+            for k, j in zip(*np.nonzero(con_filas)):
+                mins = float(suma[k, j])
+                dias_con = int(dias_pos[k, j]) or 1
+                filas.append({
+                    "usuario_id": usuario_id,
+                    "categoria": categorias[j],
+                    "ventana": ventana,
+                    "fecha_fin": desde + timedelta(days=int(k)),
+                    "minutos_sum": mins,
+                    "minutos_promedio": mins / dias_con,
+                    "dias_con_datos": dias_con,
+                    "pct_del_total": mins / (float(total[k]) or 1.0),
+                })
+            cont["categorias"] = max(cont["categorias"], int(con_filas.sum(axis=1).max()))
+
+        for i in range(0, len(filas), lote):
+            db.session.execute(_SQL_UPSERT_VENTANA, filas[i:i + lote])
         db.session.commit()
+        cont["ventanas"] = len(filas)
         return cont
 
 
-    def calcular_estado_dia_usuario(self, usuario_id: int, f: date) -> Dict[str, int]:
-        logger.info(f"[AGG] Estado día user={usuario_id} fecha={f}")
+    def calcular_estado_dia_usuario(self, usuario_id: int, f: date,
+                                    resolver: ResolverMetasLimites = None) -> Dict[str, int]:
+        return self.calcular_estado_rango(usuario_id, f, f, resolver=resolver)
 
-        por_cat = _minutos_por_categoria(usuario_id, f, f)
+    def calcular_estado_rango(self, usuario_id: int, desde: date, hasta: date,
+                              resolver: ResolverMetasLimites = None) -> Dict[str, int]:
+        """
+        Estado diario (minutos vs meta/límite) para cada día de [desde, hasta]:
+        minutos desde el cubo, metas/límites cargados una vez y UPSERT en bloque.
+        """
+        logger.info(f"[AGG] Estado día user={usuario_id} rango={desde}..{hasta}")
         cont = {"procesadas": 0, "con_meta": 0, "con_limite": 0, "excesos": 0}
+        resolver = resolver or ResolverMetasLimites(usuario_id)
 
-        for cat, mins in por_cat.items():
-            m, l = _meta_limite_en_fecha(usuario_id, cat, f)
+        categorias, minutos, presencia = _serie_diaria(usuario_id, desde, hasta)
+        rows = [
+            (desde + timedelta(days=int(i)), categorias[j], minutos[i, j])
+            for i, j in zip(*np.nonzero(presencia))
+        ]
+
+        filas = []
+        for f, cat, mins in rows:
+            mins = float(mins or 0.0)
+            m, l = resolver.en_fecha(cat, f)
 
             cumplio = (m is not None) and (mins >= m)
             excedio = (l is not None) and (mins > l)
@@ -231,33 +309,50 @@ class AgregadosEngine:
             if excedio:
                 cont["excesos"] += 1
 
-            db.session.merge(
-                AggEstadoDia(
-                    usuario_id=usuario_id,
-                    fecha=f,
-                    categoria=cat,
-                    minutos=mins,
-                    meta_min=m,
-                    limite_min=l,
-                    cumplio_meta=cumplio,
-                    excedio_limite=excedio,
-                )
-            )
+            filas.append({
+                "usuario_id": usuario_id,
+                "fecha": f,
+                "categoria": cat,
+                "minutos": mins,
+                "meta_min": m,
+                "limite_min": l,
+                "cumplio_meta": cumplio,
+                "excedio_limite": excedio,
+            })
             cont["procesadas"] += 1
 
+        for i in range(0, len(filas), 5000):
+            db.session.execute(_SQL_UPSERT_ESTADO, filas[i:i + 5000])
         db.session.commit()
         return cont
 
 
-    def calcular_kpis_usuario(self, usuario_id: int, fecha_ref: date) -> Dict[str, int]:
-        logger.info(f"[AGG] KPIs user={usuario_id} fecha_ref={fecha_ref}")
+    def calcular_kpis_usuario(self, usuario_id: int, fecha_ref: date,
+                              verificar: bool = False) -> Dict[str, int]:
+        """
+        KPIs hoy / 7dias / mes / total al cierre de `fecha_ref`.
 
-        def _guarda(rango: str, ini: date, fin: date):
-            por_cat = _minutos_por_categoria(usuario_id, ini, fin)
-            prod = sum(v for c, v in por_cat.items() if c and c.lower() in PRODUCTIVAS)
-            nprod = sum(v for c, v in por_cat.items() if not c or c.lower() not in PRODUCTIVAS)
-            total = prod + nprod
+        "mes" y "total" se mantienen de forma incremental: fila del rango en la
+        fecha de cierre anterior + días nuevos, así el cierre diario no relee
+        todo el historial. Con verificar=True se recalculan completos desde
+        features_diarias, se reporta el desvío del incremental y se guarda el exacto.
+        """
+        logger.info(f"[AGG] KPIs user={usuario_id} fecha_ref={fecha_ref} verificar={verificar}")
 
+        ini7, fin7 = _rango(fecha_ref, 7)
+        por_dia = _split_productivo_por_dia(usuario_id, ini7, fin7)
+
+        def _suma(ini: date, fin: date) -> Tuple[float, float]:
+            if ini > fin:
+                return 0.0, 0.0
+            if ini >= ini7:
+                vals = [v for f, v in por_dia.items() if ini <= f <= fin]
+            else:
+                vals = _split_productivo_por_dia(usuario_id, ini, fin).values()
+            return sum(p for p, _ in vals), sum(n for _, n in vals)
+
+        def _guarda(rango: str, prod: float, nprod: float):
+            total = prod + nprod
             db.session.merge(
                 AggKpiRango(
                     usuario_id=usuario_id,
@@ -270,26 +365,44 @@ class AgregadosEngine:
                 )
             )
 
-        
-        _guarda("hoy", fecha_ref, fecha_ref)
+        def _incremental(rango: str, desde_min: date, completo) -> Tuple[float, float]:
+            """Última fila del rango antes de fecha_ref (no anterior a desde_min) + días faltantes."""
+            prev = (
+                db.session.query(AggKpiRango)
+                .filter(
+                    AggKpiRango.usuario_id == usuario_id,
+                    AggKpiRango.rango == rango,
+                    AggKpiRango.fecha_ref < fecha_ref,
+                    AggKpiRango.fecha_ref >= desde_min,
+                )
+                .order_by(AggKpiRango.fecha_ref.desc())
+                .first()
+            )
+            if prev is None:
+                return completo()
+            p, n = _suma(prev.fecha_ref + timedelta(days=1), fecha_ref)
+            return float(prev.min_productivo) + p, float(prev.min_no_productivo) + n
 
-        
-        ini7, fin7 = _rango(fecha_ref, 7)
-        _guarda("7dias", ini7, fin7)
+        _guarda("hoy", *por_dia.get(fecha_ref, (0.0, 0.0)))
+        _guarda("7dias", *_suma(ini7, fin7))
 
-    
         mes_ini = date(fecha_ref.year, fecha_ref.month, 1)
-        _guarda("mes", mes_ini, fecha_ref)
-
-    
-        first = (
-            db.session.query(FeatureDiaria.fecha)
-            .filter(FeatureDiaria.usuario_id == usuario_id)
-            .order_by(FeatureDiaria.fecha.asc())
-            .first()
-        )
-        tot_ini = first[0] if first else fecha_ref
-        _guarda("total", tot_ini, fecha_ref)
+        mes = _incremental("mes", mes_ini, lambda: _suma(mes_ini, fecha_ref))
+        total = _incremental("total", date.min, lambda: _total_productivo(usuario_id, fecha_ref))
+
+        res = {"rangos_procesados": 4, "verificado": verificar}
+        if verificar:
+            exactos = {"mes": _suma(mes_ini, fecha_ref), "total": _total_productivo(usuario_id, fecha_ref)}
+            for rango, inc in (("mes", mes), ("total", total)):
+                desvio = abs(sum(inc) - sum(exactos[rango]))
+                res[f"desvio_{rango}"] = round(desvio, 3)
+                if desvio > 0.5:
+                    print(f"[AGG][KPI] Desvío {rango} user={usuario_id} fecha_ref={fecha_ref}: "
+                          f"incremental={sum(inc):.1f} exacto={sum(exactos[rango]):.1f}")
+            mes, total = exactos["mes"], exactos["total"]
+
+        _guarda("mes", *mes)
+        _guarda("total", *total)
 
         db.session.commit()
-        return {"rangos_procesados": 4}
+        return res
@@ -0,0 +1,117 @@
+"""
+Caché en memoria para resolver dominio→categoria_id en la ruta de ingesta.
+
+- Dominios: LRU global con TTL, clave (usuario_id, dominio).
+- Patrones: MatcherPatrones compilado por usuario (PatronCategoria activos), con TTL.
+
+Los controladores que escriben dominio_categoria / categorias / patrones llaman
+a `invalidar_usuario` o `invalidar_dominio` tras el commit. La invalidación es
+por proceso; el TTL acota la vigencia en los demás workers de gunicorn.
+Las mismas llamadas propagan el cambio al índice versionado de
+app/services/indice_categorias.py, que sí se comparte entre workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAX_DOMINIOS = 50000
+CACHE_TTL_S = 600
+
+_lock = threading.RLock()
+_dominios = OrderedDict()   # (usuario_id, dominio) -> (categoria_id, expira)
+_patrones = {}              # usuario_id -> (expira, MatcherPatrones)
+_stats = {"hits": 0, "misses": 0, "invalidaciones": 0, "patrones_cargados": 0}
+
+
+def obtener_categoria(usuario_id, dominio):
+    """Devuelve categoria_id cacheado o None si no está (o expiró)."""
+    clave = (int(usuario_id), dominio)
+    ahora = time.monotonic()
+    with _lock:
+        item = _dominios.get(clave)
+        if item is None or item[1] < ahora:
+            if item is not None:
+                del _dominios[clave]
+            _stats["misses"] += 1
+            return None
+        _dominios.move_to_end(clave)
+        _stats["hits"] += 1
+        return item[0]
+
+
+def guardar_categoria(usuario_id, dominio, categoria_id):
+    if categoria_id is None:
+        return
+    clave = (int(usuario_id), dominio)
+    with _lock:
+        _dominios[clave] = (categoria_id, time.monotonic() + CACHE_TTL_S)
+        _dominios.move_to_end(clave)
+        while len(_dominios) > CACHE_MAX_DOMINIOS:
+            _dominios.popitem(last=False)
+
+
+def matcher_patrones(usuario_id):
+    """
+    Matcher compilado con los patrones activos del usuario (prioridad = id).
+    Se recompila al expirar o tras invalidar.
+    """
+    usuario_id = int(usuario_id)
+    ahora = time.monotonic()
+    with _lock:
+        item = _patrones.get(usuario_id)
+        if item and item[0] >= ahora:
+            return item[1]
+
+    from app.extensions import db
+    from app.models.models import PatronCategoria, Categoria
+    from app.services.patrones_matcher import MatcherPatrones
+
+    filas = (
+        db.session.query(PatronCategoria.patron, PatronCategoria.categoria_id, Categoria.nombre)
+        .outerjoin(Categoria, PatronCategoria.categoria_id == Categoria.id)
+        .filter(PatronCategoria.usuario_id == usuario_id, PatronCategoria.activo.is_(True))
+        .order_by(PatronCategoria.id)
+        .all()
+    )
+    compilados = MatcherPatrones([(p, cat_id, nombre) for p, cat_id, nombre in filas])
+
+    with _lock:
+        _patrones[usuario_id] = (ahora + CACHE_TTL_S, compilados)
+        _stats["patrones_cargados"] += 1
+    return compilados
+
+
+def invalidar_dominio(usuario_id, dominio):
+    with _lock:
+        _dominios.pop((int(usuario_id), dominio), None)
+        _stats["invalidaciones"] += 1
+    try:
+        from app.services import indice_categorias
+        indice_categorias.recargar_dominio(usuario_id, dominio)
+    except Exception as e:
+        print(f"[INDICE][ERROR] recargar_dominio {dominio} usuario={usuario_id}: {e}")
+
+
+def invalidar_usuario(usuario_id):
+    """Descarta dominios y patrones cacheados del usuario."""
+    usuario_id = int(usuario_id)
+    with _lock:
+        for clave in [k for k in _dominios if k[0] == usuario_id]:
+            del _dominios[clave]
+        _patrones.pop(usuario_id, None)
+        _stats["invalidaciones"] += 1
+    try:
+        from app.services import indice_categorias
+        indice_categorias.invalidar_usuario(usuario_id)
+    except Exception as e:
+        print(f"[INDICE][ERROR] invalidar_usuario {usuario_id}: {e}")
+
+
+def metricas():
+    with _lock:
+        m = dict(_stats)
+        m["dominios_cacheados"] = len(_dominios)
+        m["usuarios_con_patrones"] = len(_patrones)
+    total = m["hits"] + m["misses"]
+    m["hit_rate"] = round(m["hits"] / total, 4) if total else 0.0
+    return m
@@ -0,0 +1,420 @@
+"""
+Cubo columnar en memoria por usuario: minutos por (fecha, categoria) y por (fecha, hora, categoria).
+
+- Se carga de forma perezosa desde features_diarias / features_horarias (dos consultas).
+- features_engine lo actualiza en caliente al persistir features (`actualizar_dia`).
+- Un archivo marcador por usuario (CUBO_FEATURES_DIR, por defecto instance/cubo_features)
+  guarda un contador que sube en cada escritura de features (sin depender de la
+  resolución de mtime del sistema de archivos); si otro worker de gunicorn lo subió,
+  el cubo local se descarta y se recarga en el siguiente acceso.
+- Quien borre o reescriba features_diarias / features_horarias fuera de
+  features_engine llama a `publicar_cambio(usuario_id)` tras el commit.
+- Red de seguridad: un cubo con más de CUBO_FEATURES_TTL_S segundos se recarga.
+- Expulsión LRU cuando la suma de arreglos supera CUBO_FEATURES_MEMORIA_MB.
+- `cargar_rango` arma un cubo desde MySQL sin pasar por la caché (lo usa el motor
+  de agregados, que persiste resultados y no debe leer un cubo viejo).
+
+Lectores: /dashboard, /resumen (categoría dominante) y /api/sugerencias_detalle. La
+predicción ML no lo usa: corre en el pool de procesos de ml_runner, que no comparte
+memoria con los workers web, y lee features_categoria_diaria vía ml.data.
+
+Las consultas de rango (suma por categoría, top-k, serie diaria, por hora, por día
+de la semana) son slices de NumPy: microsegundos, sin ir a MySQL. Se hacen bajo el
+mismo lock que `actualizar_dia`, que amplía los arreglos en sitio.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from functools import wraps
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+_lock = threading.RLock()
+_cubos = OrderedDict()   # usuario_id -> CuboUsuario
+_stats = {"hits": 0, "cargas": 0, "recargas_externas": 0, "expiraciones": 0, "expulsiones": 0,
+          "actualizaciones": 0}
+
+
+def _bajo_lock(metodo):
+    """Lecturas bajo _lock: actualizar_dia muta el cubo en sitio (np.pad de columnas/filas)."""
+    @wraps(metodo)
+    def envuelto(self, *args, **kwargs):
+        with _lock:
+            return metodo(self, *args, **kwargs)
+    return envuelto
+
+
+class CuboUsuario:
+    __slots__ = ("usuario_id", "fecha0", "categorias", "_idx", "minutos", "presencia",
+                 "horas", "presencia_horas", "marcador", "cargado_en")
+
+    def __init__(self, usuario_id: int, fecha0: date, n_dias: int, categorias: List[str]):
+        self.usuario_id = usuario_id
+        self.fecha0 = fecha0
+        self.categorias = list(categorias)
+        self._idx = {c: j for j, c in enumerate(self.categorias)}
+        c = len(self.categorias)
+        self.minutos = np.zeros((n_dias, c), dtype=np.int32)
+        self.presencia = np.zeros((n_dias, c), dtype=bool)
+        self.horas = np.zeros((n_dias, 24, c), dtype=np.int32)
+        self.presencia_horas = np.zeros((n_dias, 24, c), dtype=bool)
+        self.marcador = None
+        self.cargado_en = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Estructura
+    # ------------------------------------------------------------------
+    @property
+    def n_dias(self) -> int:
+        return self.minutos.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return (self.minutos.nbytes + self.presencia.nbytes
+                + self.horas.nbytes + self.presencia_horas.nbytes)
+
+    def _col(self, categoria: str) -> int:
+        j = self._idx.get(categoria)
+        if j is None:
+            j = len(self.categorias)
+            self.categorias.append(categoria)
+            self._idx[categoria] = j
+            self.minutos = np.pad(self.minutos, ((0, 0), (0, 1)))
+            self.presencia = np.pad(self.presencia, ((0, 0), (0, 1)))
+            self.horas = np.pad(self.horas, ((0, 0), (0, 0), (0, 1)))
+            self.presencia_horas = np.pad(self.presencia_horas, ((0, 0), (0, 0), (0, 1)))
+        return j
+
+    def _fila(self, fecha: date) -> int:
+        i = (fecha - self.fecha0).days
+        if i < 0:
+            self._crecer(antes=-i)
+            i = 0
+        elif i >= self.n_dias:
+            self._crecer(despues=i - self.n_dias + 1)
+        return i
+
+    def _crecer(self, antes: int = 0, despues: int = 0):
+        self.minutos = np.pad(self.minutos, ((antes, despues), (0, 0)))
+        self.presencia = np.pad(self.presencia, ((antes, despues), (0, 0)))
+        self.horas = np.pad(self.horas, ((antes, despues), (0, 0), (0, 0)))
+        self.presencia_horas = np.pad(self.presencia_horas, ((antes, despues), (0, 0), (0, 0)))
+        self.fecha0 -= timedelta(days=antes)
+
+    def _slice(self, ini: Optional[date], fin: Optional[date]) -> slice:
+        """[ini, fin] inclusivo → slice de filas (None = sin límite)."""
+        a = 0 if ini is None else max(0, (ini - self.fecha0).days)
+        b = self.n_dias if fin is None else min(self.n_dias, (fin - self.fecha0).days + 1)
+        return slice(a, max(a, b))
+
+    # ------------------------------------------------------------------
+    # Escritura (mismas semánticas que el UPSERT: el valor reemplaza)
+    # ------------------------------------------------------------------
+    def set_dia(self, fecha: date, categoria: str, minutos: int):
+        j = self._col(categoria)
+        i = self._fila(fecha)
+        self.minutos[i, j] = int(minutos)
+        self.presencia[i, j] = True
+
+    def set_hora(self, fecha: date, hora: int, categoria: str, minutos: int):
+        j = self._col(categoria)
+        i = self._fila(fecha)
+        self.horas[i, int(hora), j] = int(minutos)
+        self.presencia_horas[i, int(hora), j] = True
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    @_bajo_lock
+    def suma_por_categoria(self, ini: date = None, fin: date = None) -> Dict[str, int]:
+        """{categoria: minutos} de las categorías con filas en el rango."""
+        s = self._slice(ini, fin)
+        sumas = self.minutos[s].sum(axis=0)
+        con = self.presencia[s].any(axis=0)
+        return {self.categorias[j]: int(sumas[j]) for j in np.flatnonzero(con)}
+
+    @_bajo_lock
+    def dias_con_filas(self, ini: date = None, fin: date = None) -> Dict[str, int]:
+        """{categoria: nº de días con fila} en el rango."""
+        s = self._slice(ini, fin)
+        cont = self.presencia[s].sum(axis=0)
+        return {self.categorias[j]: int(cont[j]) for j in np.flatnonzero(cont)}
+
+    @_bajo_lock
+    def top_k(self, k: int, ini: date = None, fin: date = None) -> List[Tuple[str, int]]:
+        return sorted(self.suma_por_categoria(ini, fin).items(), key=lambda x: -x[1])[:k]
+
+    @_bajo_lock
+    def serie_diaria(self, ini: date = None, fin: date = None) -> List[Tuple[date, int]]:
+        """[(fecha, minutos totales)] de los días con alguna fila, ascendente."""
+        s = self._slice(ini, fin)
+        tot = self.minutos[s].sum(axis=1)
+        con = self.presencia[s].any(axis=1)
+        base = self.fecha0 + timedelta(days=s.start)
+        return [(base + timedelta(days=int(i)), int(tot[i])) for i in np.flatnonzero(con)]
+
+    @_bajo_lock
+    def por_hora(self, ini: date = None, fin: date = None) -> Dict[int, int]:
+        """{hora: minutos} de las horas con alguna fila en el rango."""
+        s = self._slice(ini, fin)
+        tot = self.horas[s].sum(axis=(0, 2))
+        con = self.presencia_horas[s].any(axis=(0, 2))
+        return {int(h): int(tot[h]) for h in np.flatnonzero(con)}
+
+    @_bajo_lock
+    def por_dia_semana(self, ini: date = None, fin: date = None) -> Dict[int, Dict[str, int]]:
+        """{weekday (0=lunes): {categoria: minutos}}."""
+        s = self._slice(ini, fin)
+        if s.start >= s.stop:
+            return {}
+        dow = (np.arange(s.start, s.stop) + self.fecha0.weekday()) % 7
+        bloque = self.minutos[s]
+        out = {}
+        for d in range(7):
+            sumas = bloque[dow == d].sum(axis=0)
+            if sumas.any():
+                out[d] = {self.categorias[j]: int(sumas[j]) for j in np.flatnonzero(sumas)}
+        return out
+
+    @_bajo_lock
+    def matriz(self, ini: date, fin: date) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        (categorias, minutos, presencia) densos para [ini, fin] (días fuera del cubo en cero),
+        solo con las categorías que tienen filas en el rango.
+        """
+        n = (fin - ini).days + 1
+        c = len(self.categorias)
+        minutos = np.zeros((n, c), dtype=np.float64)
+        presencia = np.zeros((n, c), dtype=np.int32)
+        s = self._slice(ini, fin)
+        if s.start < s.stop:
+            off = (self.fecha0 - ini).days + s.start
+            minutos[off:off + (s.stop - s.start)] = self.minutos[s]
+            presencia[off:off + (s.stop - s.start)] = self.presencia[s]
+        cols = np.flatnonzero(presencia.any(axis=0))
+        orden = sorted(cols, key=lambda j: self.categorias[j])
+        return [self.categorias[j] for j in orden], minutos[:, orden], presencia[:, orden]
+
+
+# ----------------------------------------------------------------------
+# Marcador entre procesos
+# ----------------------------------------------------------------------
+def _ruta_marcador(usuario_id: int) -> str:
+    from flask import current_app
+    ruta = current_app.config.get("CUBO_FEATURES_DIR") or os.path.join(
+        current_app.instance_path, "cubo_features"
+    )
+    os.makedirs(ruta, exist_ok=True)
+    return os.path.join(ruta, f"usuario_{usuario_id}.ver")
+
+
+def _leer_marcador(usuario_id: int) -> Optional[int]:
+    try:
+        with open(_ruta_marcador(usuario_id)) as fh:
+            return int(fh.read().strip() or 0)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _lock_marcador(usuario_id: int):
+    if fcntl is None:
+        yield
+        return
+    with open(_ruta_marcador(usuario_id) + ".lock", "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _tocar_marcador(usuario_id: int) -> int:
+    """Sube el contador (llamar con _lock_marcador tomado); escritura atómica."""
+    ruta = _ruta_marcador(usuario_id)
+    nuevo = (_leer_marcador(usuario_id) or 0) + 1
+    fd, tmp = tempfile.mkstemp(prefix=".ver.", dir=os.path.dirname(ruta))
+    try:
+        with os.fdopen(fd, "w") as fh:
+            fh.write(str(nuevo))
+        os.replace(tmp, ruta)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return nuevo
+
+
+# ----------------------------------------------------------------------
+# Carga / LRU
+# ----------------------------------------------------------------------
+def _presupuesto_bytes() -> int:
+    from flask import current_app
+    return int(float(current_app.config.get("CUBO_FEATURES_MEMORIA_MB", 64)) * 1024 * 1024)
+
+
+def _cargar(usuario_id: int, ini: date = None, fin: date = None, horas: bool = True) -> CuboUsuario:
+    from app.extensions import db
+    from app.models.features import FeatureDiaria, FeatureHoraria
+
+    marcador = _leer_marcador(usuario_id)
+    q = (
+        db.session.query(FeatureDiaria.fecha, FeatureDiaria.categoria, FeatureDiaria.minutos)
+        .filter(FeatureDiaria.usuario_id == usuario_id)
+    )
+    if ini is not None:
+        q = q.filter(FeatureDiaria.fecha >= ini)
+    if fin is not None:
+        q = q.filter(FeatureDiaria.fecha <= fin)
+    diarias = q.all()
+    horarias = []
+    if horas:
+        horarias = (
+            db.session.query(FeatureHoraria.fecha, FeatureHoraria.hora,
+                             FeatureHoraria.categoria, FeatureHoraria.minutos)
+            .filter(FeatureHoraria.usuario_id == usuario_id)
+            .all()
+        )
+
+    fechas = [f for f, _, _ in diarias] + [f for f, _, _, _ in horarias]
+    cats = sorted({c for _, c, _ in diarias if c is not None} | {c for _, _, c, _ in horarias if c is not None})
+    if fechas:
+        f0 = min(fechas)
+        n = (max(fechas) - f0).days + 1
+    else:
+        f0, n = date.today(), 0
+    cubo = CuboUsuario(usuario_id, f0, n, cats)
+
+    if diarias:
+        i = np.fromiter(((f - f0).days for f, _, _ in diarias), dtype=np.int64, count=len(diarias))
+        j = np.fromiter((cubo._idx[c] for _, c, _ in diarias), dtype=np.int64, count=len(diarias))
+        m = np.fromiter((int(x or 0) for _, _, x in diarias), dtype=np.int32, count=len(diarias))
+        cubo.minutos[i, j] = m
+        cubo.presencia[i, j] = True
+    if horarias:
+        i = np.fromiter(((f - f0).days for f, _, _, _ in horarias), dtype=np.int64, count=len(horarias))
+        h = np.fromiter((int(x) for _, x, _, _ in horarias), dtype=np.int64, count=len(horarias))
+        j = np.fromiter((cubo._idx[c] for _, _, c, _ in horarias), dtype=np.int64, count=len(horarias))
+        m = np.fromiter((int(x or 0) for _, _, _, x in horarias), dtype=np.int32, count=len(horarias))
+        cubo.horas[i, h, j] = m
+        cubo.presencia_horas[i, h, j] = True
+
+    cubo.marcador = marcador
+    return cubo
+
+
+def _expulsar(presupuesto: int, conservar: int):
+    total = sum(c.nbytes for c in _cubos.values())
+    while total > presupuesto and len(_cubos) > 1:
+        uid, cubo = next(iter(_cubos.items()))
+        if uid == conservar:
+            _cubos.move_to_end(uid)
+            uid, cubo = next(iter(_cubos.items()))
+        del _cubos[uid]
+        total -= cubo.nbytes
+        _stats["expulsiones"] += 1
+
+
+def _ttl_s() -> float:
+    from flask import current_app
+    return float(current_app.config.get("CUBO_FEATURES_TTL_S", 300))
+
+
+def cargar_rango(usuario_id: int, ini: date, fin: date) -> CuboUsuario:
+    """Cubo solo de features_diarias en [ini, fin], leído de MySQL y sin caché."""
+    return _cargar(int(usuario_id), ini, fin, horas=False)
+
+
+def obtener_cubo(usuario_id: int) -> CuboUsuario:
+    """Cubo del usuario (requiere app_context). Lo carga si falta o si otro proceso lo cambió."""
+    usuario_id = int(usuario_id)
+    marcador = _leer_marcador(usuario_id)
+    ttl = _ttl_s()
+    with _lock:
+        cubo = _cubos.get(usuario_id)
+        if cubo is not None and cubo.marcador == marcador and time.monotonic() - cubo.cargado_en < ttl:
+            _cubos.move_to_end(usuario_id)
+            _stats["hits"] += 1
+            return cubo
+        if cubo is not None:
+            _stats["recargas_externas" if cubo.marcador != marcador else "expiraciones"] += 1
+
+    cubo = _cargar(usuario_id)
+    with _lock:
+        _cubos[usuario_id] = cubo
+        _cubos.move_to_end(usuario_id)
+        _stats["cargas"] += 1
+        _expulsar(_presupuesto_bytes(), usuario_id)
+    return cubo
+
+
+def actualizar_dia(usuario_id: int, diarias: Iterable[dict], horarias: Iterable[dict]):
+    """
+    Aplica al cubo en memoria las filas recién persistidas (mismo formato que los
+    UPSERT de features_engine) y publica el cambio a los demás procesos.
+    """
+    usuario_id = int(usuario_id)
+    with _lock:
+        try:
+            with _lock_marcador(usuario_id):
+                cubo = _cubos.get(usuario_id)
+                if cubo is not None and cubo.marcador != _leer_marcador(usuario_id):
+                    # otro proceso escribió antes: no se puede parchear, se recarga al leer
+                    del _cubos[usuario_id]
+                    cubo = None
+                if cubo is not None:
+                    for r in diarias:
+                        cubo.set_dia(r["fecha"], r["categoria"], r["minutos"])
+                    for r in horarias:
+                        cubo.set_hora(r["fecha"], r["hora"], r["categoria"], r["minutos"])
+                    _stats["actualizaciones"] += 1
+                nuevo = _tocar_marcador(usuario_id)
+                if cubo is not None:
+                    cubo.marcador = nuevo
+        except OSError as e:
+            print(f"[CUBO][ERROR] No se pudo publicar cambio usuario={usuario_id}: {e}")
+            _cubos.pop(usuario_id, None)
+
+
+def publicar_cambio(usuario_id: int):
+    """
+    Tras borrar o reescribir features del usuario fuera de features_engine (reset,
+    restauración de backup): descarta el cubo local y sube el marcador para que los
+    demás workers también lo recarguen.
+    """
+    usuario_id = int(usuario_id)
+    with _lock:
+        _cubos.pop(usuario_id, None)
+        try:
+            with _lock_marcador(usuario_id):
+                _tocar_marcador(usuario_id)
+        except OSError as e:
+            print(f"[CUBO][ERROR] No se pudo publicar cambio usuario={usuario_id}: {e}")
+
+
+def invalidar(usuario_id: int = None):
+    with _lock:
+        if usuario_id is None:
+            _cubos.clear()
+        else:
+            _cubos.pop(int(usuario_id), None)
+
+
+def metricas() -> dict:
+    with _lock:
+        m = dict(_stats)
+        m["usuarios"] = len(_cubos)
+        m["bytes"] = sum(c.nbytes for c in _cubos.values())
+    return m
@@ -28,7 +28,7 @@ def detectar_anomalia_dia(usuario_id: int, fecha: date = None) -> dict:
         func.sum(Registro.tiempo) / 60.0
     ).filter(
         Registro.usuario_id == usuario_id,
-        func.date(Registro.fecha) == fecha
+        Registro.dia == fecha
     ).scalar() or 0.0
     
     # Obtener día de la semana (0=lunes, 6=domingo)
@@ -42,11 +42,11 @@ def detectar_anomalia_dia(usuario_id: int, fecha: date = None) -> dict:
         func.avg(func.sum(Registro.tiempo) / 60.0)
     ).filter(
         Registro.usuario_id == usuario_id,
-        func.date(Registro.fecha) >= fecha_inicio,
-        func.date(Registro.fecha) < fecha,
-        func.dayofweek(Registro.fecha) == (dia_semana + 2) % 7 + 1  # MySQL DAYOFWEEK
+        Registro.dia >= fecha_inicio,
+        Registro.dia < fecha,
+        func.dayofweek(Registro.dia) == (dia_semana + 2) % 7 + 1  # MySQL DAYOFWEEK
     ).group_by(
-        func.date(Registro.fecha)
+        Registro.dia
     ).scalar() or 0.0
     
     # Si no hay suficiente historial, no es atípico
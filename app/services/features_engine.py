@@ -1,15 +1,13 @@
 from __future__ import annotations
 
-import re
 from datetime import date, timedelta
 from typing import Dict, List, Tuple
 import unicodedata
 import pandas as pd
 from app.extensions import db
-from sqlalchemy import and_, func, or_
+from sqlalchemy import and_, text
 from app.models.models import Registro, Categoria, MetaCategoria, LimiteCategoria, UsuarioLogro, DominioCategoria, ContextoDia, PatronCategoria, RachaUsuario, ConfiguracionLogro, AggEstadoDia, AggVentanaCategoria, AggKpiRango, FeaturesCategoriaDiaria
 from app.models.ml import MLModelo, MLPrediccionFuture, MlMetric
-from app.models.features import FeatureDiaria, FeatureHoraria
 from app.models.models_coach import CoachAlerta, CoachSugerencia, CoachAccionLog, NotificacionClasificacion, CoachEstadoRegla
 VERSION = "fe-0.7-stable"
 print(f"[ENG][LOAD] features_engine {VERSION} file={__file__}")
@@ -85,8 +83,16 @@ def dominio_base(s: str) -> str:
 
 
 
-def _cargar_mapa_dominios() -> Dict[str, str]:
-    """Carga dominio→categoria (texto). Incluye host y base para maximizar matches."""
+def _cargar_mapa_dominios(usuario_id: int | None = None) -> Dict[str, str]:
+    """
+    Carga dominio→categoria (texto). Incluye host y base para maximizar matches.
+    Con usuario_id usa el índice versionado del usuario (app/services/indice_categorias.py),
+    sin releer la tabla; sin usuario_id mantiene el mapa global anterior.
+    """
+    if usuario_id is not None:
+        from app.services.indice_categorias import obtener_indice
+        return obtener_indice(usuario_id).mapa
+
     rows: List[Tuple[str, str]] = (
         db.session.query(DominioCategoria.dominio, Categoria.nombre)
         .join(Categoria, DominioCategoria.categoria_id == Categoria.id)
@@ -103,12 +109,18 @@ def _cargar_mapa_dominios() -> Dict[str, str]:
         mapa[host] = cat
     return mapa
 
-def _cargar_patrones() -> List[Tuple[re.Pattern, str]]:
-    """Si existiera una tabla de patrones, compilar aquí; por ahora, vacío."""
-    return []
+def _cargar_patrones(usuario_id: int | None = None):
+    """
+    Matcher compilado (y cacheado) con los PatronCategoria activos del usuario.
+    Sin usuario_id no hay patrones.
+    """
+    if usuario_id is None:
+        return []
+    from app.services.categoria_cache import matcher_patrones
+    return matcher_patrones(usuario_id)
 
 
-def _categorizar(host_o_url: str, mapa: Dict[str, str], patrones: List[Tuple[re.Pattern, str]]) -> str:
+def _categorizar(host_o_url: str, mapa: Dict[str, str], patrones) -> str:
     host = _solo_host(host_o_url)
     if not host:
         return "Sin categoría"
@@ -122,13 +134,125 @@ def _categorizar(host_o_url: str, mapa: Dict[str, str], patrones: List[Tuple[re.
     if cat:
         return _canon_cat(cat)
 
-    for rex, nombre in patrones:
-        if rex.search(host):
-            return nombre
+    if patrones:
+        match = patrones.buscar(host)
+        if match and match[1]:
+            return _canon_cat(match[1])
     return "Sin categoría"
 
 
 
+_SQL_UPSERT_DIARIA = text("""
+    INSERT INTO features_diarias (usuario_id, fecha, categoria, minutos)
+    VALUES (:usuario_id, :fecha, :categoria, :minutos)
+    ON DUPLICATE KEY UPDATE minutos = VALUES(minutos)
+""")
+
+_SQL_UPSERT_FC_DIARIA = text("""
+    INSERT INTO features_categoria_diaria (usuario_id, fecha, categoria, minutos)
+    VALUES (:usuario_id, :fecha, :categoria, :minutos)
+    ON DUPLICATE KEY UPDATE minutos = VALUES(minutos)
+""")
+
+_SQL_UPSERT_HORARIA = text("""
+    INSERT INTO features_horarias (usuario_id, fecha, hora, categoria, minutos)
+    VALUES (:usuario_id, :fecha, :hora, :categoria, :minutos)
+    ON DUPLICATE KEY UPDATE minutos = VALUES(minutos)
+""")
+
+
+def _filtro_dia(dia: date):
+    """Filtro del día sobre la columna generada `dia` = DATE(COALESCE(fecha_hora, fecha))."""
+    return Registro.dia == dia
+
+
+def _cargar_registros_dia(usuario_id: int, dia: date) -> pd.DataFrame:
+    """Una sola consulta de columnas (sin objetos ORM) → DataFrame dominio/tiempo/fecha_hora."""
+    rows = (
+        db.session.query(Registro.dominio, Registro.tiempo, Registro.fecha_hora)
+        .filter(Registro.usuario_id == usuario_id)
+        .filter(_filtro_dia(dia))
+        .all()
+    )
+    return pd.DataFrame.from_records(rows, columns=["dominio", "tiempo", "fecha_hora"])
+
+
+def _preparar_registros(df: pd.DataFrame, mapa: Dict[str, str], patrones) -> pd.DataFrame:
+    """Añade categoria/hora/seg al frame crudo; categoriza una vez por dominio distinto."""
+    dominios = df["dominio"].fillna("")
+    cats = {d: _canon_cat(_categorizar(d, mapa, patrones)) for d in dominios.unique()}
+
+    fh = pd.to_datetime(df["fecha_hora"], errors="coerce")
+    trabajo = pd.DataFrame({
+        "categoria": dominios.map(cats),
+        "hora": fh.dt.hour.fillna(0).astype("int64"),
+        "seg": pd.to_numeric(df["tiempo"], errors="coerce").fillna(0).astype("int64").clip(lower=0),
+    })
+    for col in ("usuario_id", "dia"):
+        if col in df.columns:
+            trabajo[col] = df[col].values
+    return trabajo
+
+
+def agregar_registros(df: pd.DataFrame, mapa: Dict[str, str], patrones,
+                      claves: Tuple[str, ...] = ()) -> Tuple[pd.Series, pd.Series]:
+    """
+    Agrega segundos por categoría y por (hora, categoría).
+    Categoriza una vez por dominio distinto y agrupa en memoria.
+    `claves` antepone columnas de agrupación (p. ej. ("usuario_id", "dia") en backfill).
+    Devuelve (seg_por_cat, seg_por_hora_cat).
+    """
+    if df.empty:
+        vacio = pd.Series(dtype="int64")
+        return vacio, vacio
+
+    trabajo = _preparar_registros(df, mapa, patrones)
+    claves = list(claves)
+    por_cat = trabajo.groupby(claves + ["categoria"], sort=False)["seg"].sum()
+    por_hora = trabajo.groupby(claves + ["hora", "categoria"], sort=False)["seg"].sum()
+    return por_cat, por_hora
+
+
+def _upsert_features_bloque(diarias: List[dict], horarias: List[dict], lote: int = 5000):
+    """UPSERT en bloque de las tres tablas (executemany → INSERT multi-fila)."""
+    for i in range(0, len(diarias), lote):
+        chunk = diarias[i:i + lote]
+        db.session.execute(_SQL_UPSERT_DIARIA, chunk)
+        db.session.execute(_SQL_UPSERT_FC_DIARIA, chunk)
+    for i in range(0, len(horarias), lote):
+        db.session.execute(_SQL_UPSERT_HORARIA, horarias[i:i + lote])
+
+
+def _publicar_en_cubo(diarias: List[dict], horarias: List[dict]):
+    """Tras el commit: aplica las filas al cubo en memoria de cada usuario afectado."""
+    from app.services import cubo_features
+
+    por_usuario = {}
+    for r in diarias:
+        por_usuario.setdefault(r["usuario_id"], ([], []))[0].append(r)
+    for r in horarias:
+        por_usuario.setdefault(r["usuario_id"], ([], []))[1].append(r)
+    for usuario_id, (d, h) in por_usuario.items():
+        try:
+            cubo_features.actualizar_dia(usuario_id, d, h)
+        except Exception as e:
+            print(f"[CUBO][ERROR] usuario={usuario_id}: {e}")
+            cubo_features.publicar_cambio(usuario_id)
+
+
+def _upsert_features_dia(usuario_id: int, dia: date, por_cat: pd.Series, por_hora: pd.Series):
+    diarias = [
+        {"usuario_id": usuario_id, "fecha": dia, "categoria": cat, "minutos": int(seg) // 60}
+        for cat, seg in por_cat.items()
+    ]
+    horarias = [
+        {"usuario_id": usuario_id, "fecha": dia, "hora": int(h), "categoria": cat, "minutos": int(seg) // 60}
+        for (h, cat), seg in por_hora.items()
+    ]
+    _upsert_features_bloque(diarias, horarias)
+    return diarias, horarias
+
+
 def calcular_persistir_features(usuario_id: int, dia: date) -> dict:
     """
     Calcula agregados por categoría (y por hora) para el día `dia` y hace UPSERT.
@@ -136,142 +260,141 @@ def calcular_persistir_features(usuario_id: int, dia: date) -> dict:
     """
     print(f"[ENG][RUN] calcular_persistir_features usuario={usuario_id} dia={dia}")
 
-    mapa = _cargar_mapa_dominios()
-    patrones = _cargar_patrones()
+    mapa = _cargar_mapa_dominios(usuario_id)
+    patrones = _cargar_patrones(usuario_id)
+
+    df = _cargar_registros_dia(usuario_id, dia)
+    print(f"[DEBUG] {dia} → registros={len(df)}")
+
+    por_cat, por_hora = agregar_registros(df, mapa, patrones)
 
-    if hasattr(Registro, 'fecha_hora') and hasattr(Registro, 'fecha'):
-        # Si ambas existen, buscar en cualquiera
-        day_filter = or_(
-            func.date(Registro.fecha_hora) == dia,
-            func.date(Registro.fecha) == dia
-        )
-    elif hasattr(Registro, 'fecha_hora'):
-        # Solo fecha_hora existe
-        day_filter = func.date(Registro.fecha_hora) == dia
-    else:
-        # Solo fecha existe
-        day_filter = func.date(Registro.fecha) == dia
-
-    registros = (
-        db.session.query(Registro)
-        .filter(Registro.usuario_id == usuario_id)
-        .filter(day_filter)
-        .all()
-    )
-    print(f"[DEBUG] {dia} → registros={len(registros)}")
-    acc_diario: Dict[str, int] = {}
-    acc_hora: Dict[tuple, int] = {}
-
-    for r in registros:
-        cat = _canon_cat(_categorizar(getattr(r, "dominio", "") or "", mapa, patrones))
-        seg = max(0, int(getattr(r, "tiempo", 0) or 0))
-        #print(f"[DEBUG] {dia} → cat={cat}, seg={seg}, dominio={getattr(r, 'dominio', '')}") #DESCOMENTAR SOLO EN CASO DE PRUEBAS O VERIFICAR QUE FUNCIONA CON NORMALIDAD
-        h = r.fecha_hora.hour if getattr(r, 'fecha_hora', None) else 0
-
-        acc_diario[cat] = acc_diario.get(cat, 0) + seg
-        acc_hora[(h, cat)] = acc_hora.get((h, cat), 0) + seg
-
-    # --- FeatureDiaria ---
-    for cat, seg in acc_diario.items():
-        mins = seg // 60
-        obj = (
-            FeatureDiaria.query
-            .filter_by(usuario_id=usuario_id, fecha=dia, categoria=cat)
-            .first()
-        )
-        if obj:
-            obj.minutos = mins
-        else:
-            db.session.add(FeatureDiaria(
-                usuario_id=usuario_id, fecha=dia, categoria=cat, minutos=mins
-            ))
-
-    # --- FeaturesCategoriaDiaria ---
-    for cat, seg in acc_diario.items():
-        mins = seg // 60
-        objfc = (
-            FeaturesCategoriaDiaria.query
-            .filter_by(usuario_id=usuario_id, fecha=dia, categoria=cat)
-            .first()
-        )
-        if objfc:
-            objfc.minutos = mins
-        else:
-            db.session.add(FeaturesCategoriaDiaria(
-                usuario_id=usuario_id,
-                fecha=dia,
-                categoria=cat,
-                minutos=mins
-            ))
-            
-    for (h, cat), seg in acc_hora.items():
-        mins = seg // 60
-        objh = (
-            FeatureHoraria.query
-            .filter_by(usuario_id=usuario_id, fecha=dia, hora=int(h), categoria=cat)
-            .first()
-        )
-        if objh:
-            objh.minutos = mins
-        else:
-            db.session.add(FeatureHoraria(
-                usuario_id=usuario_id, fecha=dia, hora=int(h), categoria=cat, minutos=mins
-            ))
-
-    print(f"[DEBUG][COMMIT] {dia} → diarias={len(acc_diario)}, horarias={len(acc_hora)}, new={len(db.session.new)}, dirty={len(db.session.dirty)}")
     try:
+        diarias, horarias = _upsert_features_dia(usuario_id, dia, por_cat, por_hora)
         db.session.commit()
+        _publicar_en_cubo(diarias, horarias)
+        print(f"[DEBUG][COMMIT] {dia} → diarias={len(por_cat)}, horarias={len(por_hora)}")
     except Exception as e:
         print(f"[ERROR][COMMIT] {dia} → {e}")
         db.session.rollback()
-
-    rows = FeatureDiaria.query.filter_by(usuario_id=usuario_id, fecha=dia).all()
-    print(f"[DEBUG][POST-COMMIT] {dia} → rows_in_db={len(rows)}")
+        raise  # sin features persistidas el día no está listo (nocturno bloquea dependientes)
 
     dias_hist = 30
     fecha_inicio = dia - timedelta(days=dias_hist)
     rows_hist = (
-        FeaturesCategoriaDiaria.query
+        db.session.query(
+            FeaturesCategoriaDiaria.fecha,
+            FeaturesCategoriaDiaria.categoria,
+            FeaturesCategoriaDiaria.minutos,
+        )
         .filter(FeaturesCategoriaDiaria.usuario_id == usuario_id)
         .filter(FeaturesCategoriaDiaria.fecha >= fecha_inicio)
         .filter(FeaturesCategoriaDiaria.fecha <= dia)
         .all()
     )
-
-    if rows_hist:
-        df_hist = pd.DataFrame([
-            {
-                "fecha": r.fecha,
-                "categoria": r.categoria,
-                "minutos": r.minutos,
-            }
-            for r in rows_hist
-        ])
-    else:
-        df_hist = pd.DataFrame()
+    df_hist = pd.DataFrame.from_records(rows_hist, columns=["fecha", "categoria", "minutos"]) if rows_hist else pd.DataFrame()
 
     return {
         "ok": 1,
-        "diarias": len(acc_diario),
-        "horarias": len(acc_hora),
+        "diarias": len(por_cat),
+        "horarias": len(por_hora),
         "hist": df_hist
     }
 
-def recalcular_rango(usuario_id: int, desde: date, hasta: date) -> Dict[str, int]:
-    print(f"[DEBUG] Entrando a recalcular_rango {desde} → {hasta}")
+_SQL_REGISTRO_RANGO = """
+    SELECT usuario_id, dominio, tiempo, fecha_hora, dia
+    FROM registro
+    WHERE usuario_id IN :usuarios
+      AND dia >= :d0 AND dia < :d1
+    ORDER BY usuario_id, dia
+"""
+
+
+def recalcular_rango_multi(usuarios: List[int], desde: date, hasta: date,
+                           chunk_filas: int = 50000) -> Dict[str, int]:
+    """
+    Backfill de features para varios usuarios y el rango [desde, hasta] (inclusive)
+    en una sola pasada sobre `registro`:
+
+    - Un único scan por rango semiabierto sobre ix_registro_usuario_dia_dominio, leído por bloques.
+    - El índice de dominios de cada usuario se carga una vez; cada bloque se categoriza
+      por dominio distinto.
+    - Los parciales por (usuario, día, [hora,] categoría) se suman entre bloques y se
+      escriben al final con UPSERT en bloque en las tres tablas y un solo commit.
+
+    El día de cada fila es la columna generada `dia` = DATE(COALESCE(fecha_hora, fecha)).
+    """
+    from sqlalchemy import bindparam
 
-    """Recalcula features para el rango [desde, hasta] (ambos inclusive)."""
     if hasta < desde:
         desde, hasta = hasta, desde
-    d = desde
-    tot_diarias = tot_horarias = 0
-    while d <= hasta:
-        print(f"[DEBUG] Día en loop: {d}")
-        res = calcular_persistir_features(usuario_id=usuario_id, dia=d)
-        tot_diarias += res.get("diarias", 0)
-        tot_horarias += res.get("horarias", 0)
-        d += timedelta(days=1)
-    return {"ok": 1, "diarias": tot_diarias, "horarias": tot_horarias}
+    usuarios = sorted({int(u) for u in usuarios})
+    if not usuarios:
+        return {"ok": 1, "usuarios": 0, "filas": 0, "diarias": 0, "horarias": 0}
+
+    print(f"[ENG][RANGO] usuarios={len(usuarios)} {desde} → {hasta}")
+    mapas = {u: _cargar_mapa_dominios(u) for u in usuarios}
+    patrones = {u: _cargar_patrones(u) for u in usuarios}
+
+    sql = text(_SQL_REGISTRO_RANGO).bindparams(bindparam("usuarios", expanding=True))
+    params = {"usuarios": usuarios, "d0": desde, "d1": hasta + timedelta(days=1)}
+    cols = ["usuario_id", "dominio", "tiempo", "fecha_hora", "dia"]
+
+    parciales_cat, parciales_hora = [], []
+    filas = 0
+    result = db.session.execute(sql.execution_options(stream_results=True), params)
+    while True:
+        bloque = result.fetchmany(chunk_filas)
+        if not bloque:
+            break
+        filas += len(bloque)
+        df = pd.DataFrame.from_records(bloque, columns=cols)
+        df = df[df["dia"].notna()]
+        for u, df_u in df.groupby("usuario_id", sort=False):
+            pc, ph = agregar_registros(df_u, mapas[int(u)], patrones[int(u)], claves=("usuario_id", "dia"))
+            parciales_cat.append(pc)
+            parciales_hora.append(ph)
+    result.close()
+
+    if not filas:
+        print("[ENG][RANGO] Sin registros en el rango")
+        return {"ok": 1, "usuarios": len(usuarios), "filas": 0, "diarias": 0, "horarias": 0}
+
+    por_cat = pd.concat(parciales_cat).groupby(level=[0, 1, 2]).sum()
+    por_hora = pd.concat(parciales_hora).groupby(level=[0, 1, 2, 3]).sum()
+
+    diarias = [
+        {"usuario_id": int(u), "fecha": d, "categoria": cat, "minutos": int(seg) // 60}
+        for (u, d, cat), seg in por_cat.items()
+    ]
+    horarias = [
+        {"usuario_id": int(u), "fecha": d, "hora": int(h), "categoria": cat, "minutos": int(seg) // 60}
+        for (u, d, h, cat), seg in por_hora.items()
+    ]
+
+    try:
+        _upsert_features_bloque(diarias, horarias)
+        db.session.commit()
+        _publicar_en_cubo(diarias, horarias)
+    except Exception as e:
+        print(f"[ERROR][COMMIT][RANGO] {desde} → {hasta}: {e}")
+        db.session.rollback()
+        raise
+
+    print(f"[ENG][RANGO] filas={filas} diarias={len(diarias)} horarias={len(horarias)}")
+    return {
+        "ok": 1,
+        "usuarios": len(usuarios),
+        "filas": filas,
+        "diarias": len(diarias),
+        "horarias": len(horarias),
+        "dias": sorted({d for (_, d, _) in por_cat.index}),
+    }
+
+
+def recalcular_rango(usuario_id: int, desde: date, hasta: date) -> Dict[str, int]:
+    """Recalcula features para el rango [desde, hasta] (ambos inclusive) en una sola pasada."""
+    res = recalcular_rango_multi([usuario_id], desde, hasta)
+    return {"ok": 1, "diarias": res["diarias"], "horarias": res["horarias"]}
     
 def load_fc_diaria(usuario_id: int, start: date | None = None, end: date | None = None) -> pd.DataFrame:
     """
@@ -0,0 +1,231 @@
+"""
+Índice de categorización por usuario: host/dominio base → nombre de categoría.
+
+- Se construye una vez por usuario desde dominio_categoria y lleva un contador `version`.
+- Se guarda como snapshot JSON en CATEGORIAS_INDEX_DIR (por defecto instance/indice_categorias),
+  escrito de forma atómica; los demás workers de gunicorn lo recargan cuando cambia el mtime.
+- Los cambios de mapeo se aplican de forma incremental (`actualizar_dominio`): solo se
+  recalculan desde BD las claves afectadas (varios dominios comparten la clave del dominio base).
+
+La búsqueda por dominio es O(1): un dict en memoria.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+_lock = threading.RLock()
+_indices = {}   # usuario_id -> IndiceCategorias
+
+
+class IndiceCategorias:
+    __slots__ = ("usuario_id", "version", "mapa", "mtime")
+
+    def __init__(self, usuario_id: int, version: int, mapa: Dict[str, str], mtime: float = 0.0):
+        self.usuario_id = usuario_id
+        self.version = version
+        self.mapa = mapa
+        self.mtime = mtime
+
+    def get(self, clave: str) -> Optional[str]:
+        return self.mapa.get(clave)
+
+
+# ----------------------------------------------------------------------
+# Snapshot en disco
+# ----------------------------------------------------------------------
+def _dir_snapshots() -> str:
+    from flask import current_app
+    ruta = current_app.config.get("CATEGORIAS_INDEX_DIR") or os.path.join(
+        current_app.instance_path, "indice_categorias"
+    )
+    os.makedirs(ruta, exist_ok=True)
+    return ruta
+
+
+def _ruta(usuario_id: int) -> str:
+    return os.path.join(_dir_snapshots(), f"usuario_{usuario_id}.json")
+
+
+@contextmanager
+def _lock_archivo(usuario_id: int):
+    """Lock exclusivo entre procesos para leer-modificar-escribir el snapshot."""
+    if fcntl is None:
+        yield
+        return
+    with open(_ruta(usuario_id) + ".lock", "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _leer_snapshot(usuario_id: int) -> Optional[IndiceCategorias]:
+    ruta = _ruta(usuario_id)
+    try:
+        mtime = os.stat(ruta).st_mtime
+        with open(ruta, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return IndiceCategorias(usuario_id, int(data.get("version", 0)), data.get("mapa") or {}, mtime)
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_snapshot(indice: IndiceCategorias):
+    ruta = _ruta(indice.usuario_id)
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"usuario_id": indice.usuario_id, "version": indice.version, "mapa": indice.mapa},
+                  fh, ensure_ascii=False)
+    os.replace(tmp, ruta)
+    indice.mtime = os.stat(ruta).st_mtime
+
+
+# ----------------------------------------------------------------------
+# Construcción desde BD
+# ----------------------------------------------------------------------
+def _claves_dominio(dominio: str):
+    from app.services.features_engine import _solo_host, dominio_base
+    host = _solo_host(dominio)
+    base = dominio_base(dominio)
+    return [c for c in (base, host) if c]
+
+
+def _mapear(rows, claves=None) -> Dict[str, str]:
+    """(dominio, categoria) en orden de id → clave: categoria; la última fila gana."""
+    mapa: Dict[str, str] = {}
+    for dom, cat in rows:
+        if not dom or not cat:
+            continue
+        for clave in _claves_dominio(dom):
+            if claves is None or clave in claves:
+                mapa[clave] = cat
+    return mapa
+
+
+def _claves_desde_bd(usuario_id: int, claves: list) -> Dict[str, str]:
+    """Valor actual de `claves` según BD, con la misma regla que la construcción completa."""
+    from app.extensions import db
+    from app.models.models import DominioCategoria, Categoria
+
+    # Toda fila que produzca una de las claves contiene la clave (host o su dominio base)
+    rows = (
+        db.session.query(DominioCategoria.dominio, Categoria.nombre)
+        .join(Categoria, DominioCategoria.categoria_id == Categoria.id)
+        .filter(DominioCategoria.usuario_id == usuario_id)
+        .filter(db.or_(*[DominioCategoria.dominio.like(f"%{c}%") for c in claves]))
+        .order_by(DominioCategoria.id)
+        .all()
+    )
+    return _mapear(rows, set(claves))
+
+
+def _construir_desde_bd(usuario_id: int, version: int) -> IndiceCategorias:
+    from app.extensions import db
+    from app.models.models import DominioCategoria, Categoria
+
+    rows = (
+        db.session.query(DominioCategoria.dominio, Categoria.nombre)
+        .join(Categoria, DominioCategoria.categoria_id == Categoria.id)
+        .filter(DominioCategoria.usuario_id == usuario_id)
+        .order_by(DominioCategoria.id)
+        .all()
+    )
+    mapa = _mapear(rows)
+    print(f"[INDICE] Construido índice usuario={usuario_id} v{version} claves={len(mapa)}")
+    return IndiceCategorias(usuario_id, version, mapa)
+
+
+# ----------------------------------------------------------------------
+# API pública
+# ----------------------------------------------------------------------
+def obtener_indice(usuario_id: int) -> IndiceCategorias:
+    """
+    Índice del usuario. Usa el de memoria si el snapshot en disco no cambió;
+    si cambió (otro worker), lo recarga; si no existe, lo construye y publica.
+    """
+    usuario_id = int(usuario_id)
+    with _lock:
+        actual = _indices.get(usuario_id)
+        try:
+            mtime = os.stat(_ruta(usuario_id)).st_mtime
+        except OSError:
+            mtime = None
+
+        if actual is not None and mtime is not None and mtime == actual.mtime:
+            return actual
+
+        if mtime is not None:
+            snap = _leer_snapshot(usuario_id)
+            if snap is not None:
+                _indices[usuario_id] = snap
+                return snap
+
+        with _lock_archivo(usuario_id):
+            snap = _leer_snapshot(usuario_id)  # otro worker pudo publicarlo mientras esperábamos
+            if snap is None:
+                version = (actual.version + 1) if actual else 1
+                snap = _construir_desde_bd(usuario_id, version)
+                _escribir_snapshot(snap)
+        _indices[usuario_id] = snap
+        return snap
+
+
+def actualizar_dominio(usuario_id: int, dominio: str):
+    """
+    Cambio incremental de un mapeo (alta, cambio o baja ya confirmados en BD): recalcula
+    desde BD las claves del dominio (host y dominio base) y parchea el snapshot. La clave
+    base la comparten otros dominios del usuario, por eso no basta con escribir o borrar
+    la categoría nueva. Si el usuario aún no tiene snapshot no hace nada (se construirá
+    completo en el próximo uso).
+    """
+    usuario_id = int(usuario_id)
+    claves = _claves_dominio(dominio)
+    if not claves:
+        return
+    with _lock:
+        try:
+            with _lock_archivo(usuario_id):
+                snap = _leer_snapshot(usuario_id)
+                if snap is None:
+                    _indices.pop(usuario_id, None)
+                    return
+                valores = _claves_desde_bd(usuario_id, claves)
+                for clave in claves:
+                    if clave in valores:
+                        snap.mapa[clave] = valores[clave]
+                    else:
+                        snap.mapa.pop(clave, None)
+                snap.version += 1
+                _escribir_snapshot(snap)
+            _indices[usuario_id] = snap
+        except OSError as e:
+            print(f"[INDICE][ERROR] No se pudo actualizar snapshot usuario={usuario_id}: {e}")
+            invalidar_usuario(usuario_id)
+
+
+def recargar_dominio(usuario_id: int, dominio: str):
+    """Relee desde BD las claves de un dominio y las aplica de forma incremental."""
+    actualizar_dominio(usuario_id, dominio)
+
+
+def invalidar_usuario(usuario_id: int):
+    """Descarta el índice completo; el siguiente uso lo reconstruye con versión nueva."""
+    usuario_id = int(usuario_id)
+    with _lock:
+        try:
+            with _lock_archivo(usuario_id):
+                os.remove(_ruta(usuario_id))
+        except OSError:
+            pass
+        # se conserva en memoria solo para continuar el contador de versión
+        actual = _indices.get(usuario_id)
+        if actual is not None:
+            actual.mtime = -1.0
@@ -0,0 +1,357 @@
+"""
+Buffer write-behind para la ingesta de `registro`.
+
+Las rutas de ingesta encolan deltas en memoria y responden de inmediato;
+un hilo de fondo los agrupa por (usuario_id, dominio, minuto) y los escribe
+con un commit de grupo cada INGEST_FLUSH_MS o al llegar a INGEST_FLUSH_ROWS.
+
+- Acotado: si hay más de INGEST_MAX_PENDIENTES grupos pendientes, `encolar`
+  espera hasta INGEST_BACKPRESSURE_TIMEOUT_S y luego rechaza (la ruta responde 503).
+  `encolar_lote` reserva cupo para el lote completo o no encola nada.
+- Filas malas: si el flush falla por datos, el lote se parte (por usuario, luego a
+  la mitad) y lo bueno se confirma. Cada clave fallida cuenta un intento; al llegar
+  a INGEST_MAX_REINTENTOS va al dead-letter (INGEST_DEAD_LETTER_PATH, JSONL).
+  Los errores de conexión reencolan sin contar intentos. Lo reencolado nunca
+  supera INGEST_MAX_PENDIENTES: el excedente también va al dead-letter.
+- Drenado garantizado: `detener_buffer_ingesta()` se llama desde atexit y desde
+  el hook `worker_exit` de gunicorn (gunicorn.conf.py).
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+from app.services.ingesta_service import resolver_categorias, insertar_registros
+
+
+class IngestBuffer:
+    def __init__(self, app, flush_ms=2000, flush_rows=500, max_pendientes=20000,
+                 backpressure_timeout_s=2.0, max_reintentos=5, dead_letter_path=None):
+        self.app = app
+        self.flush_s = max(flush_ms, 50) / 1000.0
+        self.flush_rows = max(int(flush_rows), 1)
+        self.max_pendientes = max(int(max_pendientes), 1)
+        self.backpressure_timeout_s = float(backpressure_timeout_s)
+        self.max_reintentos = max(int(max_reintentos), 1)
+        self.dead_letter_path = dead_letter_path
+
+        # (usuario_id, dominio, minuto) -> [tiempo, fecha_hora del primer evento]
+        self._pendientes = {}
+        self._intentos = {}      # clave -> flushes fallidos por datos
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._hilo = None
+        self._detenido = False
+
+        self._m = {
+            "encolados": 0,
+            "coalescidos": 0,
+            "rechazados": 0,
+            "filas_escritas": 0,
+            "flushes": 0,
+            "errores_flush": 0,
+            "particiones": 0,
+            "reencolados": 0,
+            "dead_letter": 0,
+            "ultimo_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "ultimo_error": None,
+        }
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        with self._cond:
+            if self._hilo and self._hilo.is_alive():
+                return
+            self._detenido = False
+            self._hilo = threading.Thread(target=self._loop, name="ingest-buffer", daemon=True)
+            self._hilo.start()
+        print(f"[INGESTA] Buffer iniciado (flush={int(self.flush_s * 1000)}ms / {self.flush_rows} filas, "
+              f"máx {self.max_pendientes} pendientes)")
+
+    def encolar(self, usuario_id: int, dominio: str, tiempo: int, fecha_hora: datetime) -> bool:
+        """Agrega un delta al buffer. Devuelve False si se rechazó por backpressure."""
+        return self.encolar_lote(usuario_id, [(dominio, tiempo, fecha_hora)])
+
+    def encolar_lote(self, usuario_id: int, filas) -> bool:
+        """
+        Encola [(dominio, tiempo, fecha_hora)] todo o nada: espera cupo para todas las
+        claves nuevas del lote y, si no lo hay a tiempo, no encola ninguna fila.
+        """
+        filas = list(filas)
+        claves = {}
+        for dominio, tiempo, fecha_hora in filas:
+            clave = (int(usuario_id), dominio, fecha_hora.replace(second=0, microsecond=0))
+            fila = claves.setdefault(clave, [0, fecha_hora])
+            fila[0] += int(tiempo)
+        n_filas = len(filas)
+        limite = time.monotonic() + self.backpressure_timeout_s
+
+        with self._cond:
+            if self._detenido:
+                return False
+            if len(claves) > self.max_pendientes:
+                self._m["rechazados"] += n_filas
+                return False
+
+            while len(self._pendientes) + sum(1 for c in claves if c not in self._pendientes) > self.max_pendientes:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._m["rechazados"] += n_filas
+                    return False
+                self._cond.notify_all()  # despertar al flusher
+                self._cond.wait(restante)
+
+            nuevas = 0
+            for clave, (tiempo, fecha_hora) in claves.items():
+                fila = self._pendientes.get(clave)
+                if fila:
+                    fila[0] += tiempo
+                else:
+                    self._pendientes[clave] = [tiempo, fecha_hora]
+                    nuevas += 1
+            self._m["coalescidos"] += n_filas - nuevas
+            self._m["encolados"] += n_filas
+
+            if len(self._pendientes) >= self.flush_rows:
+                self._cond.notify_all()
+        return True
+
+    def flush(self) -> int:
+        """Escribe todo lo pendiente. Devuelve filas escritas."""
+        with self._flush_lock:
+            with self._cond:
+                lote, self._pendientes = self._pendientes, {}
+                self._cond.notify_all()  # libera productores en espera
+            if not lote:
+                return 0
+
+            t0 = time.perf_counter()
+            escritas, fallos = self._escribir_partido(lote)
+            fallidas = set()
+            for parte, error in fallos:
+                fallidas.update(parte)
+                self._reencolar(parte, error)
+            with self._cond:
+                for clave in lote:
+                    if clave not in fallidas:
+                        self._intentos.pop(clave, None)
+            if fallos:
+                ultimo = fallos[-1][1]
+                self._m["errores_flush"] += 1
+                self._m["ultimo_error"] = f"{type(ultimo).__name__}: {ultimo}"
+                print(f"[INGESTA][ERROR] Flush parcial: {escritas} filas escritas, "
+                      f"{len(fallidas)} con error: {ultimo}")
+
+            ms = (time.perf_counter() - t0) * 1000.0
+            self._m["flushes"] += 1
+            self._m["filas_escritas"] += escritas
+            self._m["ultimo_flush_ms"] = round(ms, 2)
+            self._m["max_flush_ms"] = round(max(self._m["max_flush_ms"], ms), 2)
+            self._m["total_flush_ms"] += ms
+            return escritas
+
+    def detener(self, timeout: float = 10.0):
+        """Detiene el hilo y drena lo pendiente (síncrono)."""
+        with self._cond:
+            self._detenido = True
+            self._cond.notify_all()
+        if self._hilo and self._hilo.is_alive() and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout)
+        escritas = self.flush()
+        print(f"[INGESTA] Buffer detenido, drenadas {escritas} filas")
+
+    def metricas(self) -> dict:
+        with self._cond:
+            profundidad = len(self._pendientes)
+        m = dict(self._m)
+        flushes = m.pop("total_flush_ms")
+        m["flush_promedio_ms"] = round(flushes / m["flushes"], 2) if m["flushes"] else 0.0
+        m["profundidad_cola"] = profundidad
+        m["max_pendientes"] = self.max_pendientes
+        m["activo"] = bool(self._hilo and self._hilo.is_alive()) and not self._detenido
+        return m
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._detenido and len(self._pendientes) < self.flush_rows:
+                    self._cond.wait(self.flush_s)
+                detenido = self._detenido
+            if detenido:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[INGESTA][ERROR] Loop del buffer: {e}")
+
+    def _escribir(self, lote: dict) -> int:
+        from app.mysql_conn import get_mysql, close_mysql
+
+        por_usuario = defaultdict(list)
+        for (usuario_id, dominio, _minuto), (tiempo, fh) in lote.items():
+            por_usuario[usuario_id].append((dominio, tiempo, fh))
+
+        with self.app.app_context():
+            conexion = get_mysql()
+            try:
+                escritas = 0
+                for usuario_id, filas in por_usuario.items():
+                    categorias = resolver_categorias(usuario_id, (dom for dom, _, _ in filas))
+                    escritas += insertar_registros(conexion, usuario_id, filas, commit=False,
+                                                   categorias=categorias)
+                conexion.commit()
+                return escritas
+            except Exception:
+                try:
+                    conexion.rollback()
+                except Exception:
+                    pass
+                raise
+            finally:
+                close_mysql()
+
+    def _escribir_partido(self, lote: dict):
+        """
+        Escribe `lote`; si falla por datos lo parte (por usuario, luego a la mitad)
+        para confirmar lo bueno. Devuelve (escritas, [(sublote_fallido, excepción)]).
+        """
+        try:
+            return self._escribir(lote), []
+        except Exception as e:
+            if len(lote) == 1 or _es_transitorio(e):
+                return 0, [(lote, e)]
+
+        self._m["particiones"] += 1
+        usuarios = sorted({clave[0] for clave in lote})
+        if len(usuarios) > 1:
+            partes = [{k: v for k, v in lote.items() if k[0] == u} for u in usuarios]
+        else:
+            items = list(lote.items())
+            mitad = len(items) // 2
+            partes = [dict(items[:mitad]), dict(items[mitad:])]
+
+        escritas, fallos = 0, []
+        for parte in partes:
+            e, f = self._escribir_partido(parte)
+            escritas += e
+            fallos.extend(f)
+        return escritas, fallos
+
+    def _reencolar(self, lote: dict, error: Exception):
+        transitorio = _es_transitorio(error)
+        descartes = []
+        with self._cond:
+            for clave, (tiempo, fh) in lote.items():
+                if not transitorio:
+                    intentos = self._intentos.get(clave, 0) + 1
+                    if intentos >= self.max_reintentos:
+                        self._intentos.pop(clave, None)
+                        descartes.append((clave, tiempo, fh, f"{intentos} intentos: {error}"))
+                        continue
+                    self._intentos[clave] = intentos
+                fila = self._pendientes.get(clave)
+                if fila:
+                    fila[0] += tiempo
+                elif len(self._pendientes) < self.max_pendientes:
+                    self._pendientes[clave] = [tiempo, fh]
+                else:
+                    self._intentos.pop(clave, None)
+                    descartes.append((clave, tiempo, fh, f"buffer lleno: {error}"))
+                    continue
+                self._m["reencolados"] += 1
+        if descartes:
+            self._dead_letter(descartes)
+
+    def _dead_letter(self, descartes: list):
+        self._m["dead_letter"] += len(descartes)
+        print(f"[INGESTA][DLQ] {len(descartes)} filas descartadas → {self.dead_letter_path or 'log'}")
+        lineas = [
+            json.dumps({
+                "usuario_id": usuario_id, "dominio": dominio, "tiempo": tiempo,
+                "fecha_hora": fh.isoformat(), "motivo": motivo,
+                "descartado_en": datetime.now().isoformat(timespec="seconds"),
+            }, ensure_ascii=False)
+            for (usuario_id, dominio, _minuto), tiempo, fh, motivo in descartes
+        ]
+        if self.dead_letter_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.dead_letter_path)), exist_ok=True)
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lineas) + "\n")
+                return
+            except Exception as e:
+                print(f"[INGESTA][DLQ][ERROR] no se pudo escribir {self.dead_letter_path}: {e}")
+        for linea in lineas:
+            print(f"[INGESTA][DLQ] {linea}")
+
+
+def _es_transitorio(error: Exception) -> bool:
+    """Errores de conexión/pool: el lote se reintenta entero y sin contar intentos."""
+    from mysql.connector import errors
+    return isinstance(error, (errors.OperationalError, errors.InterfaceError, errors.PoolError))
+
+
+_buffer: Optional[IngestBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer_ingesta(app=None) -> Optional[IngestBuffer]:
+    """
+    Devuelve el buffer del proceso (lo crea y arranca en el primer uso).
+    None si INGEST_BUFFER_ENABLED está desactivado.
+    """
+    global _buffer
+    if _buffer is not None:
+        return _buffer
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    if not app.config.get("INGEST_BUFFER_ENABLED", True):
+        return None
+
+    with _buffer_lock:
+        if _buffer is None:
+            buf = IngestBuffer(
+                app,
+                flush_ms=app.config.get("INGEST_FLUSH_MS", 2000),
+                flush_rows=app.config.get("INGEST_FLUSH_ROWS", 500),
+                max_pendientes=app.config.get("INGEST_MAX_PENDIENTES", 20000),
+                backpressure_timeout_s=app.config.get("INGEST_BACKPRESSURE_TIMEOUT_S", 2.0),
+                max_reintentos=app.config.get("INGEST_MAX_REINTENTOS", 5),
+                dead_letter_path=app.config.get("INGEST_DEAD_LETTER_PATH"),
+            )
+            buf.iniciar()
+            atexit.register(buf.detener)
+            _buffer = buf
+    return _buffer
+
+
+def encolar_registro(usuario_id: int, dominio: str, tiempo: int, fecha_hora: datetime) -> Optional[bool]:
+    """
+    Encola un delta de tiempo. Devuelve True/False (aceptado/rechazado),
+    o None si el buffer está desactivado y el llamador debe escribir síncrono.
+    """
+    buf = get_buffer_ingesta()
+    if buf is None:
+        return None
+    return buf.encolar(usuario_id, dominio, tiempo, fecha_hora)
+
+
+def detener_buffer_ingesta():
+    """Drena y detiene el buffer del proceso, si existe."""
+    global _buffer
+    with _buffer_lock:
+        buf, _buffer = _buffer, None
+    if buf is not None:
+        buf.detener()
@@ -0,0 +1,156 @@
+"""
+Servicio de ingesta de tiempos enviados por la extensión.
+Clasifica una sola vez por dominio distinto y escribe los registros en lote,
+con un único INSERT multi-fila y un solo commit por petición.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from app.models.models import DominioCategoria
+from app.services import categoria_cache, uso_intradia
+
+MAX_EVENTOS_LOTE = 500
+
+
+def parse_fecha_hora(fh_raw) -> datetime:
+    """
+    Convierte el ISO-8601 que manda la extensión a datetime local naive.
+    Si no viene o es inválido, usa la hora actual del servidor.
+    """
+    fh = None
+    if fh_raw:
+        try:
+            fh = datetime.fromisoformat(str(fh_raw).replace('Z', '+00:00'))
+            if fh.tzinfo:
+                fh = fh.astimezone().replace(tzinfo=None)
+        except Exception:
+            fh = None
+    if fh is None:
+        fh = datetime.now()
+    return fh
+
+
+def normalizar_eventos(eventos: Iterable[dict]) -> Tuple[List[Tuple[str, int, datetime]], int]:
+    """
+    Valida los eventos {dominio, tiempo, fecha_hora} del lote.
+    Devuelve (filas válidas, descartados).
+    """
+    filas = []
+    descartados = 0
+    for ev in eventos or []:
+        if not isinstance(ev, dict):
+            descartados += 1
+            continue
+        dominio = (ev.get('dominio') or '').strip()
+        try:
+            tiempo = int(ev.get('tiempo') or 0)
+        except (TypeError, ValueError):
+            tiempo = 0
+        if not dominio or tiempo <= 0:
+            descartados += 1
+            continue
+        filas.append((dominio, tiempo, parse_fecha_hora(ev.get('fecha_hora'))))
+    return filas, descartados
+
+
+def resolver_categorias(usuario_id: int, dominios: Iterable[str]) -> Dict[str, int]:
+    """
+    Resuelve dominio→categoria_id para todos los dominios distintos del lote.
+    Primero la caché en memoria; una sola consulta para los que falten y los
+    realmente nuevos pasan por el clasificador.
+    """
+    from ml.utils_ml import clasificar_dominio_automatico
+
+    distintos = sorted(set(dominios))
+    if not distintos:
+        return {}
+
+    resueltos = {}
+    faltantes = []
+    for dominio in distintos:
+        cat_id = categoria_cache.obtener_categoria(usuario_id, dominio)
+        if cat_id is None:
+            faltantes.append(dominio)
+        else:
+            resueltos[dominio] = cat_id
+
+    if faltantes:
+        rows = (
+            DominioCategoria.query
+            .with_entities(DominioCategoria.dominio, DominioCategoria.categoria_id)
+            .filter(DominioCategoria.usuario_id == usuario_id)
+            .filter(DominioCategoria.dominio.in_(faltantes))
+            .all()
+        )
+        for dom, cat_id in rows:
+            resueltos[dom] = cat_id
+            categoria_cache.guardar_categoria(usuario_id, dom, cat_id)
+
+    for dominio in faltantes:
+        if dominio not in resueltos:
+            print(f"[→] Clasificando dominio nuevo: {dominio} (usuario {usuario_id})")
+            resueltos[dominio] = clasificar_dominio_automatico(dominio, usuario_id)
+            categoria_cache.guardar_categoria(usuario_id, dominio, resueltos[dominio])
+
+    return resueltos
+
+
+def insertar_registros(conexion, usuario_id: int, filas: List[Tuple[str, int, datetime]],
+                       commit: bool = True, categorias: Dict[str, int] = None) -> int:
+    """
+    Inserta todas las filas en `registro` en una sola transacción.
+    mysql.connector reescribe executemany de un INSERT ... VALUES como un INSERT multi-fila.
+    Con commit=False el llamador agrupa varios usuarios en un mismo commit.
+    Si se pasan `categorias` (dominio→categoria_id), uso_intradia se actualiza
+    en la misma transacción.
+    """
+    if not filas:
+        return 0
+    valores = [(usuario_id, dom, t, fh.date(), fh) for dom, t, fh in filas]
+    with conexion.cursor() as cursor:
+        cursor.executemany("""
+            INSERT INTO registro (usuario_id, dominio, tiempo, fecha, fecha_hora)
+            VALUES (%s, %s, %s, %s, %s)
+        """, valores)
+    if categorias is not None:
+        uso_intradia.acumular(conexion, usuario_id, filas, categorias)
+    if commit:
+        conexion.commit()
+    return len(valores)
+
+
+def guardar_lote(usuario_id: int, eventos: Iterable[dict]) -> dict:
+    """
+    Valida, clasifica por dominio distinto e inserta el lote completo.
+    Si el buffer write-behind está activo, solo encola y responde sin tocar MySQL.
+    """
+    from app.services.ingest_buffer import get_buffer_ingesta
+
+    filas, descartados = normalizar_eventos(eventos)
+
+    buf = get_buffer_ingesta()
+    if buf is not None:
+        # Todo o nada: la extensión reenvía el lote completo ante un 503
+        aceptado = buf.encolar_lote(usuario_id, filas)
+        return {
+            "insertados": 0,
+            "encolados": len(filas) if aceptado else 0,
+            "rechazados": 0 if aceptado else len(filas),
+            "descartados": descartados,
+            "dominios": len({dom for dom, _, _ in filas}),
+        }
+
+    from app.mysql_conn import get_mysql
+
+    categorias = resolver_categorias(usuario_id, (dom for dom, _, _ in filas))
+    conexion = get_mysql()
+    try:
+        insertados = insertar_registros(conexion, usuario_id, filas, categorias=categorias)
+    except Exception:
+        conexion.rollback()
+        raise
+    return {
+        "insertados": insertados,
+        "descartados": descartados,
+        "dominios": len(categorias),
+    }
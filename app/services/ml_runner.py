@@ -0,0 +1,177 @@
+"""
+Ejecución de tareas ML (entrenamiento / predicción) dentro del proceso.
+
+Antes cada job lanzaba `python3 -m ml.pipeline ...` por usuario: un intérprete
+nuevo que reimportaba pandas/sklearn y la app completa en cada llamada. Ahora:
+
+- ML_POOL_WORKERS > 0: ProcessPoolExecutor persistente (spawn) de workers "calientes".
+  Cada worker crea su app una sola vez en modo ML (sin scheduler ni boot catchup)
+  y conserva imports y caché de modelos entre tareas.
+- ML_POOL_WORKERS = 0: las tareas corren en el hilo del job, dentro del app_context.
+
+Las tareas son funciones de módulo con argumentos simples (picklables).
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_atexit_registrado = False
+
+_APP_WORKER = None   # app creada por el initializer en cada worker del pool
+
+
+# ----------------------------------------------------------------------
+# Tareas (se ejecutan en el worker o en línea, siempre con app_context)
+# ----------------------------------------------------------------------
+def _tarea_train(usuario_id: int, hist_days: int):
+    from ml.pipeline import train_por_categoria
+    train_por_categoria(usuario_id, hist_days=hist_days)
+    return {"usuario_id": usuario_id, "hist_days": hist_days}
+
+
+def _tarea_train_lote(usuario_ids: list, hist_days: int):
+    from ml.pipeline import entrenar_usuarios
+    res = entrenar_usuarios(usuario_ids, hist_days=hist_days)
+    return {"usuarios": len(usuario_ids), "fits": res["fits"], "errores": len(res["errores"])}
+
+
+def _tarea_predict(usuario_id: int, fecha: str, save_csv: bool):
+    from ml.pipeline import predict
+    res = predict(usuario_id, fecha=date.fromisoformat(fecha), save_csv=save_csv)
+    return {"usuario_id": usuario_id, "fecha_pred": fecha, "predicciones": len(res.get("predicciones", []))}
+
+
+def _tarea_multi(usuario_id: int, fecha_base: str):
+    from ml.pipeline import predict_multi_horizon
+    df = predict_multi_horizon(usuario_id, fecha_base=date.fromisoformat(fecha_base))
+    return {"usuario_id": usuario_id, "fecha_base": fecha_base, "filas": 0 if df is None else int(len(df))}
+
+
+TAREAS = {
+    "train": _tarea_train,
+    "train_lote": _tarea_train_lote,
+    "predict": _tarea_predict,
+    "multi": _tarea_multi,
+}
+
+
+# ----------------------------------------------------------------------
+# Pool
+# ----------------------------------------------------------------------
+def _init_worker(cwd: str):
+    """Initializer del pool: una app por worker, en modo ML."""
+    global _APP_WORKER
+    os.chdir(cwd)  # ml/ usa rutas relativas (ml/artifacts, ml/preds)
+    os.environ["TIEMPOCHECK_ML_MODE"] = "1"
+    from app import create_app
+    _APP_WORKER = create_app()
+    print(f"[ML-POOL] worker {os.getpid()} listo")
+
+
+def _en_worker(nombre: str, args: tuple):
+    with _APP_WORKER.app_context():
+        return TAREAS[nombre](*args)
+
+
+def _workers(app) -> int:
+    return int(app.config.get("ML_POOL_WORKERS", 1) or 0)
+
+
+def _obtener_pool(app):
+    global _pool, _pool_pid, _atexit_registrado
+    with _lock:
+        # Un pool por proceso: tras un fork (gunicorn) el heredado no sirve
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=_workers(app),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(os.getcwd(),),
+            )
+            _pool_pid = os.getpid()
+            if not _atexit_registrado:
+                atexit.register(cerrar)
+                _atexit_registrado = True
+            print(f"[ML-POOL] pool iniciado ({_workers(app)} workers, pid={_pool_pid})")
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def cerrar():
+    """Apaga el pool de este proceso (atexit, worker_exit de gunicorn, tests)."""
+    with _lock:
+        if _pool is not None and _pool_pid != os.getpid():
+            return  # heredado por fork: es del proceso padre
+    _descartar_pool()
+
+
+# ----------------------------------------------------------------------
+# API para los jobs
+# ----------------------------------------------------------------------
+def ejecutar(app, nombre: str, *args):
+    """Ejecuta una tarea y devuelve su resultado; propaga la excepción de la tarea."""
+    return ejecutar_lote(app, nombre, [args], propagar=True)[0]
+
+
+def ejecutar_lote(app, nombre: str, lista_args, propagar: bool = False) -> list:
+    """
+    Reparte las tareas `nombre(*args)` entre los workers del pool y espera a todas.
+    Devuelve los resultados en el orden de `lista_args`; con propagar=False una
+    tarea fallida deja {"error": ...} en su posición y se registra en el log.
+    """
+    lista_args = [tuple(a) for a in lista_args]
+    resultados = [None] * len(lista_args)
+    if not lista_args:
+        return resultados
+
+    if _workers(app) <= 0:
+        for i, args in enumerate(lista_args):
+            try:
+                with app.app_context():
+                    resultados[i] = TAREAS[nombre](*args)
+            except Exception as e:
+                if propagar:
+                    raise
+                print(f"[ML-POOL][ERR] {nombre}{args} → {e}")
+                resultados[i] = {"error": str(e)}
+        return resultados
+
+    pool = _obtener_pool(app)
+    try:
+        futuros = {pool.submit(_en_worker, nombre, args): i for i, args in enumerate(lista_args)}
+    except BrokenProcessPool:
+        _descartar_pool()
+        pool = _obtener_pool(app)
+        futuros = {pool.submit(_en_worker, nombre, args): i for i, args in enumerate(lista_args)}
+
+    for fut in as_completed(futuros):
+        i = futuros[fut]
+        try:
+            resultados[i] = fut.result()
+        except BrokenProcessPool as e:
+            # Un worker murió (OOM, señal): el siguiente lote crea un pool nuevo
+            _descartar_pool()
+            if propagar:
+                raise
+            print(f"[ML-POOL][ERR] {nombre}{lista_args[i]} → pool roto: {e}")
+            resultados[i] = {"error": f"pool roto: {e}"}
+        except Exception as e:
+            if propagar:
+                raise
+            print(f"[ML-POOL][ERR] {nombre}{lista_args[i]} → {e}")
+            resultados[i] = {"error": str(e)}
+    return resultados
@@ -0,0 +1,135 @@
+"""
+Matcher compilado para PatronCategoria.
+
+Prioridad = orden de los patrones (id ascendente): gana el primer patrón que
+aparece en cualquier parte del dominio, igual que el bucle anterior de `re.search`.
+
+- Patrones literales ('youtube', 'docs\\.google', ...): un autómata Aho–Corasick
+  que en una sola pasada sobre el dominio devuelve el literal de mayor prioridad.
+- Patrones con metacaracteres: regex precompiladas que solo se evalúan si su
+  prioridad es mejor que la del literal encontrado.
+
+Nota: en CPython una alternativa gigante `(?:p0|p1|...)` es más lenta que el
+bucle, por eso los literales (la gran mayoría) van por el autómata.
+"""
+import re
+from collections import deque
+from typing import List, Optional, Tuple
+
+_META = set(".^$*+?{}[]|()")
+_ESCAPES_LITERALES = set(".-/_:")
+_SIN_MATCH = float("inf")
+
+
+def _como_literal(patron: str) -> Optional[str]:
+    """Devuelve el texto literal (minúsculas) si el patrón no usa metacaracteres."""
+    out = []
+    i = 0
+    while i < len(patron):
+        c = patron[i]
+        if c == "\\":
+            if i + 1 < len(patron) and patron[i + 1] in _ESCAPES_LITERALES:
+                out.append(patron[i + 1])
+                i += 2
+                continue
+            return None
+        if c in _META:
+            return None
+        out.append(c)
+        i += 1
+    return "".join(out).lower() or None
+
+
+class _AhoCorasick:
+    """Autómata Aho–Corasick mínimo; cada nodo guarda la mejor prioridad alcanzable."""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.mejor = [_SIN_MATCH]
+
+    def agregar(self, texto: str, prioridad: int):
+        nodo = 0
+        for c in texto:
+            sig = self.goto[nodo].get(c)
+            if sig is None:
+                sig = len(self.goto)
+                self.goto[nodo][c] = sig
+                self.goto.append({})
+                self.fail.append(0)
+                self.mejor.append(_SIN_MATCH)
+            nodo = sig
+        self.mejor[nodo] = min(self.mejor[nodo], prioridad)
+
+    def construir(self):
+        cola = deque(self.goto[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for c, sig in self.goto[nodo].items():
+                f = self.fail[nodo]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                destino = self.goto[f].get(c, 0)
+                self.fail[sig] = destino if destino != sig else 0
+                self.mejor[sig] = min(self.mejor[sig], self.mejor[self.fail[sig]])
+                cola.append(sig)
+
+    def buscar(self, texto: str):
+        goto, fail, mejor = self.goto, self.fail, self.mejor
+        nodo = 0
+        best = _SIN_MATCH
+        for c in texto:
+            while nodo and c not in goto[nodo]:
+                nodo = fail[nodo]
+            nodo = goto[nodo].get(c, 0)
+            if mejor[nodo] < best:
+                best = mejor[nodo]
+        return best
+
+
+class MatcherPatrones:
+    __slots__ = ("_datos", "_ac", "_regex", "total", "literales")
+
+    def __init__(self, patrones: List[Tuple[str, int, str]]):
+        """patrones: [(patron, categoria_id, categoria_nombre)] en orden de prioridad."""
+        self._datos = []     # prioridad -> (categoria_id, categoria_nombre, patron)
+        self._ac = _AhoCorasick()
+        self._regex = []     # [(prioridad, regex)] ordenado
+        self.literales = 0
+
+        for patron, categoria_id, nombre in patrones:
+            literal = _como_literal(patron)
+            if literal is None:
+                try:
+                    rex = re.compile(patron, re.IGNORECASE)
+                except re.error as e:
+                    print(f"[PATRON][ERROR] Regex inválida '{patron}': {e}")
+                    continue
+            prioridad = len(self._datos)
+            self._datos.append((categoria_id, nombre, patron))
+            if literal is None:
+                self._regex.append((prioridad, rex))
+            else:
+                self._ac.agregar(literal, prioridad)
+                self.literales += 1
+
+        self._ac.construir()
+        self.total = len(self._datos)
+
+    def buscar(self, texto: str) -> Optional[Tuple[int, str, str]]:
+        """Primer patrón (por prioridad) presente en `texto` → (categoria_id, nombre, patron)."""
+        if not texto or not self.total:
+            return None
+        best = self._ac.buscar(texto.lower()) if self.literales else _SIN_MATCH
+        for prioridad, rex in self._regex:
+            if prioridad >= best:
+                break
+            if rex.search(texto):
+                return self._datos[prioridad]
+        return self._datos[best] if best != _SIN_MATCH else None
+
+    def __len__(self):
+        return self.total
+
+    def __bool__(self):
+        return self.total > 0
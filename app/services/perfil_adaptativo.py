@@ -26,7 +26,7 @@ def inferir_perfil_usuario(usuario_id: int, dias_minimos: int = 7):
     
     registros = Registro.query.filter(
         Registro.usuario_id == usuario_id,
-        func.date(Registro.fecha_hora) >= fecha_inicio
+        Registro.dia >= fecha_inicio
     ).all()
     
     if len(registros) < dias_minimos:
@@ -13,7 +13,7 @@ def actualizar_rachas(usuario_id: int, fecha: date = None):
 
         cursor.execute("""
             SELECT COUNT(*) AS total FROM registro
-            WHERE usuario_id = %s AND DATE(fecha) = %s
+            WHERE usuario_id = %s AND dia = %s
         """, (usuario_id, dia))
         hubo_uso = cursor.fetchone()['total'] > 0
         cursor.fetchall()
@@ -62,7 +62,7 @@ def actualizar_rachas(usuario_id: int, fecha: date = None):
             FROM limite_categoria l
             JOIN dominio_categoria dc ON l.categoria_id = dc.categoria_id
             JOIN registro r ON r.dominio = dc.dominio AND r.usuario_id = l.usuario_id
-            WHERE l.usuario_id = %s AND DATE(r.fecha) = %s
+            WHERE l.usuario_id = %s AND r.dia = %s
             GROUP BY dc.categoria_id
             HAVING usado > limite
         """, (usuario_id, dia))
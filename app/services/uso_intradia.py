@@ -0,0 +1,176 @@
+"""
+Totales intradía por (usuario_id, dia, categoria_id, hora) en la tabla uso_intradia.
+
+- Escritura: la ingesta llama a `acumular` con la misma conexión y transacción que
+  el INSERT en `registro`, así ambos quedan confirmados (o revertidos) juntos.
+- Lectura: los chequeos de límite suman <= 24 filas por prefijo de la PK.
+- Reconciliación: `reconciliar_dia` recalcula desde `registro` + dominio_categoria
+  (mapeo vigente) y aplica solo la diferencia, de modo que no pisa lo que la
+  ingesta confirme mientras corre.
+
+categoria_id = 0 agrupa los dominios sin categoría.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SIN_CATEGORIA = 0
+_LOCK_RECONCILIAR = "tiempocheck:uso_intradia:reconciliar"
+
+_SQL_ACUMULAR = """
+    INSERT INTO uso_intradia (usuario_id, dia, categoria_id, hora, segundos)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE segundos = segundos + VALUES(segundos)
+"""
+
+
+def agrupar(usuario_id: int, filas: Iterable[Tuple[str, int, datetime]],
+            categorias: Dict[str, Optional[int]]) -> List[tuple]:
+    """[(dominio, tiempo, fecha_hora)] → [(usuario_id, dia, categoria_id, hora, segundos)]."""
+    celdas = defaultdict(int)
+    for dominio, tiempo, fh in filas:
+        cat_id = categorias.get(dominio) or SIN_CATEGORIA
+        celdas[(fh.date(), cat_id, fh.hour)] += int(tiempo)
+    return [(int(usuario_id), d, c, h, s) for (d, c, h), s in celdas.items()]
+
+
+def acumular(conexion, usuario_id: int, filas: Iterable[Tuple[str, int, datetime]],
+             categorias: Dict[str, Optional[int]]) -> int:
+    """
+    Suma las filas en uso_intradia con la conexión mysql.connector del llamador.
+    No hace commit: queda en la transacción del INSERT en `registro`.
+    """
+    valores = agrupar(usuario_id, filas, categorias)
+    if not valores:
+        return 0
+    with conexion.cursor() as cursor:
+        cursor.executemany(_SQL_ACUMULAR, valores)
+    return len(valores)
+
+
+def acumular_sesion(usuario_id: int, filas: Iterable[Tuple[str, int, datetime]],
+                    categorias: Dict[str, Optional[int]]):
+    """Igual que `acumular` pero sobre db.session (el commit lo hace el llamador)."""
+    from sqlalchemy import text
+    from app.extensions import db
+
+    valores = agrupar(usuario_id, filas, categorias)
+    if not valores:
+        return
+    db.session.execute(text("""
+        INSERT INTO uso_intradia (usuario_id, dia, categoria_id, hora, segundos)
+        VALUES (:u, :d, :c, :h, :s)
+        ON DUPLICATE KEY UPDATE segundos = segundos + VALUES(segundos)
+    """), [{"u": u, "d": d, "c": c, "h": h, "s": s} for u, d, c, h, s in valores])
+
+
+# ----------------------------------------------------------------------
+# Lecturas
+# ----------------------------------------------------------------------
+def segundos_categoria(usuario_id: int, categoria_id: int, dia: date = None) -> int:
+    """Segundos usados en la categoría durante `dia` (hoy por defecto)."""
+    from sqlalchemy import text
+    from app.extensions import db
+
+    total = db.session.execute(text("""
+        SELECT SUM(segundos) FROM uso_intradia
+        WHERE usuario_id = :u AND dia = :d AND categoria_id = :c
+    """), {"u": usuario_id, "d": dia or date.today(), "c": categoria_id}).scalar()
+    return int(total or 0)
+
+
+def segundos_usuario(usuario_id: int, dia: date = None) -> int:
+    """Segundos totales del usuario durante `dia` (hoy por defecto)."""
+    from sqlalchemy import text
+    from app.extensions import db
+
+    total = db.session.execute(text("""
+        SELECT SUM(segundos) FROM uso_intradia
+        WHERE usuario_id = :u AND dia = :d
+    """), {"u": usuario_id, "d": dia or date.today()}).scalar()
+    return int(total or 0)
+
+
+# ----------------------------------------------------------------------
+# Reconciliación
+# ----------------------------------------------------------------------
+def reconciliar_dia(dia: date = None, usuario_id: int = None) -> dict:
+    """
+    Compara uso_intradia con `registro` para `dia` y corrige las celdas desviadas.
+
+    Ambas lecturas salen del mismo snapshot consistente y la corrección se aplica
+    como incremento (segundos + delta), así los lotes que la ingesta confirme
+    durante la reconciliación no se pierden. Requiere app_context.
+    """
+    from app.mysql_conn import get_mysql
+
+    dia = dia or date.today()
+    filtro_u = " AND r.usuario_id = %s" if usuario_id is not None else ""
+    filtro_ui = " AND usuario_id = %s" if usuario_id is not None else ""
+    extra = (int(usuario_id),) if usuario_id is not None else ()
+
+    conexion = get_mysql()
+    with conexion.cursor() as cursor:
+        # Un solo reconciliador a la vez: dos deltas simultáneos se sumarían dos veces
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (_LOCK_RECONCILIAR,))
+        (obtenido,) = cursor.fetchone()
+    if not obtenido:
+        print(f"[INTRADIA] Reconciliación {dia} en curso en otro proceso, se omite")
+        return {"dia": dia.isoformat(), "omitido": True}
+
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+            # Sin usuario: rango sobre ix_registro_dia_usuario (04_migracion_registro_dia.sql)
+            cursor.execute(f"""
+                SELECT r.usuario_id, COALESCE(dc.categoria_id, 0) AS cat,
+                       HOUR(COALESCE(r.fecha_hora, r.fecha)) AS hora, SUM(r.tiempo)
+                FROM registro r
+                LEFT JOIN dominio_categoria dc
+                  ON dc.usuario_id = r.usuario_id AND dc.dominio = r.dominio
+                WHERE r.dia = %s{filtro_u}
+                GROUP BY r.usuario_id, cat, hora
+            """, (dia,) + extra)
+            esperado = {(int(u), int(c), int(h)): int(s or 0) for u, c, h, s in cursor.fetchall()}
+
+            cursor.execute(f"""
+                SELECT usuario_id, categoria_id, hora, segundos
+                FROM uso_intradia
+                WHERE dia = %s{filtro_ui}
+            """, (dia,) + extra)
+            actual = {(int(u), int(c), int(h)): int(s or 0) for u, c, h, s in cursor.fetchall()}
+
+            deltas = []
+            for clave in esperado.keys() | actual.keys():
+                delta = esperado.get(clave, 0) - actual.get(clave, 0)
+                if delta:
+                    u, c, h = clave
+                    deltas.append((u, dia, c, h, delta))
+
+            if deltas:
+                cursor.executemany(_SQL_ACUMULAR, deltas)
+                cursor.execute(f"DELETE FROM uso_intradia WHERE dia = %s AND segundos = 0{filtro_ui}",
+                               (dia,) + extra)
+        conexion.commit()
+    except Exception:
+        try:
+            conexion.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (_LOCK_RECONCILIAR,))
+            cursor.fetchall()
+
+    resumen = {
+        "dia": dia.isoformat(),
+        "celdas": len(esperado),
+        "corregidas": len(deltas),
+        "desvio_segundos": sum(abs(d[-1]) for d in deltas),
+        "usuarios_afectados": len({d[0] for d in deltas}),
+    }
+    if deltas:
+        print(f"[INTRADIA] Reconciliación {resumen['dia']}: {resumen['corregidas']} celdas corregidas "
+              f"({resumen['desvio_segundos']}s, {resumen['usuarios_afectados']} usuarios)")
+    return resumen
@@ -298,6 +298,9 @@ def restaurar_backup_completo(data, usuario_id):
         
         # PASO 6: Commit final
         db.session.commit()
+        from app.services import categoria_cache, cubo_features
+        categoria_cache.invalidar_usuario(usuario_id)
+        cubo_features.publicar_cambio(usuario_id)
         print(f"[DEBUG] ✅ Backup restaurado exitosamente")
         
         return {"success": True, "mensaje": "Backup restaurado exitosamente"}
@@ -358,6 +361,8 @@ def resetear_datos_usuario(usuario_id):
         # NO tocamos: logros_dinamicos, dominio_categoria, categorias (son globales)
         
         db.session.commit()
+        from app.services import cubo_features
+        cubo_features.publicar_cambio(usuario_id)
         return {"success": True, "mensaje": "Todos los datos del usuario han sido eliminados"}
         
     except Exception as e:
@@ -452,7 +457,7 @@ def verificar_logros_dinamicos(usuario_id: int):
                         SELECT SUM(r.tiempo) AS total
                         FROM registro r
                         JOIN dominio_categoria dc ON r.dominio = dc.dominio
-                        WHERE r.usuario_id = %s AND dc.categoria_id = %s AND DATE(r.fecha) = %s
+                        WHERE r.usuario_id = %s AND dc.categoria_id = %s AND r.dia = %s
                     """, (usuario_id, categoria_id, hoy))
                     minutos = cursor.fetchone()['total'] or 0
                     cumple = minutos >= valor if valor >= 0 else minutos <= abs(valor)
@@ -485,7 +490,7 @@ def verificar_logros_dinamicos(usuario_id: int):
                         cursor.execute("""
                             SELECT COUNT(*) AS total
                             FROM registro
-                            WHERE usuario_id = %s AND DATE(fecha) = %s
+                            WHERE usuario_id = %s AND dia = %s
                         """, (usuario_id, dia))
                         hubo_uso = cursor.fetchone()['total'] > 0
                         if not hubo_uso:
@@ -496,7 +501,7 @@ def verificar_logros_dinamicos(usuario_id: int):
                             FROM limite_categoria l
                             JOIN dominio_categoria dc ON l.categoria_id = dc.categoria_id
                             JOIN registro r ON r.dominio = dc.dominio AND r.usuario_id = l.usuario_id
-                            WHERE l.usuario_id = %s AND DATE(r.fecha) = %s
+                            WHERE l.usuario_id = %s AND r.dia = %s
                             GROUP BY dc.categoria_id
                             HAVING SUM(r.tiempo) > MAX(l.limite_minutos)
                             LIMIT 1
@@ -528,7 +533,7 @@ def verificar_logros_dinamicos(usuario_id: int):
                             FROM limite_categoria l
                             JOIN dominio_categoria dc ON l.categoria_id = dc.categoria_id
                             JOIN registro r ON r.dominio = dc.dominio AND r.usuario_id = l.usuario_id
-                            WHERE l.usuario_id = %s AND DATE(r.fecha) = %s
+                            WHERE l.usuario_id = %s AND r.dia = %s
                             GROUP BY dc.categoria_id
                             HAVING SUM(r.tiempo) > MAX(l.limite_minutos)
                             LIMIT 1
@@ -582,8 +587,8 @@ def obtener_promedio_categoria(usuario_id, categoria_id, dias=5):
         JOIN dominio_categoria dc ON r.dominio = dc.dominio
         WHERE r.usuario_id = :usuario_id
           AND dc.categoria_id = :categoria_id
-          AND DATE(r.fecha) BETWEEN :inicio AND :hoy
-        GROUP BY DATE(r.fecha)
+          AND r.dia BETWEEN :inicio AND :hoy
+        GROUP BY r.dia
     """), {
         "usuario_id": usuario_id,
         "categoria_id": categoria_id,
@@ -652,7 +657,7 @@ def obtener_dias_uso(usuario_id: int) -> int:
     Cuenta los días distintos en los que el usuario tuvo registros.
     """
     dias_uso = db.session.query(
-        func.count(func.distinct(func.date(Registro.fecha)))
+        func.count(func.distinct(Registro.dia))
     ).filter(
         Registro.usuario_id == usuario_id
     ).scalar()
@@ -31,6 +31,63 @@ class Config:
     SQLALCHEMY_POOL_RECYCLE = 3600
     SQLALCHEMY_POOL_PRE_PING = True
     
+    # Pool mysql.connector para get_mysql() (app/mysql_conn.py)
+    MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE', '10'))
+    MYSQL_POOL_MAX_OVERFLOW = int(os.environ.get('MYSQL_POOL_MAX_OVERFLOW', '10'))
+    MYSQL_POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT', '30'))
+    MYSQL_POOL_PRE_PING = True
+    
+    # Ingesta write-behind (app/services/ingest_buffer.py)
+    INGEST_BUFFER_ENABLED = os.environ.get('INGEST_BUFFER_ENABLED', '1') == '1'
+    INGEST_FLUSH_MS = int(os.environ.get('INGEST_FLUSH_MS', '2000'))
+    INGEST_FLUSH_ROWS = int(os.environ.get('INGEST_FLUSH_ROWS', '500'))
+    INGEST_MAX_PENDIENTES = int(os.environ.get('INGEST_MAX_PENDIENTES', '20000'))
+    INGEST_BACKPRESSURE_TIMEOUT_S = float(os.environ.get('INGEST_BACKPRESSURE_TIMEOUT_S', '2'))
+    INGEST_MAX_REINTENTOS = int(os.environ.get('INGEST_MAX_REINTENTOS', '5'))
+    INGEST_DEAD_LETTER_PATH = os.environ.get('INGEST_DEAD_LETTER_PATH', 'logs/ingesta_dead_letter.jsonl')
+    
+    # Totales intradía (app/services/uso_intradia.py)
+    USO_INTRADIA_RECONCILIAR_MIN = int(os.environ.get('USO_INTRADIA_RECONCILIAR_MIN', '30'))
+    
+    # Agregados: cada cuántos días el cierre recalcula KPIs mes/total completos (0 = nunca)
+    AGG_KPI_VERIFICAR_DIAS = int(os.environ.get('AGG_KPI_VERIFICAR_DIAS', '7'))
+    
+    # Cubo de features en memoria por worker (app/services/cubo_features.py)
+    CUBO_FEATURES_MEMORIA_MB = float(os.environ.get('CUBO_FEATURES_MEMORIA_MB', '64'))
+    CUBO_FEATURES_TTL_S = float(os.environ.get('CUBO_FEATURES_TTL_S', '300'))
+    
+    # Scheduler por etapas (app/schedule/lotes.py): un job por tipo de tarea
+    SCHED_POOL_WORKERS = int(os.environ.get('SCHED_POOL_WORKERS', '8'))
+    SCHED_PAGINA_USUARIOS = int(os.environ.get('SCHED_PAGINA_USUARIOS', '200'))
+    SCHED_JITTER_S = float(os.environ.get('SCHED_JITTER_S', '30'))
+    SCHED_CONCURRENCIA = {
+        "perfil": 2,
+        "rachas": 4,
+        "ml_train_weekly": 1,   # cada página ya se reparte en el pool ML
+    }
+    
+    # DAG nocturno (app/schedule/nocturno.py): nodos en vuelo por etapa (0 = ML_POOL_WORKERS)
+    SCHED_NOCHE_CONCURRENCIA = {
+        "features_diarias": 4,
+        "agg_close": 4,
+        "ml_predict_multi": 0,
+        "coach_alertas": 4,
+        "coach_autometas": 2,
+        "detectar_anomalias": 2,
+    }
+    # Al arrancar, relanzar la noche de ayer (solo corre lo que no tenga marca)
+    SCHED_NOCHE_REANUDAR = os.environ.get('SCHED_NOCHE_REANUDAR', '1') == '1'
+    
+    # Varios workers de gunicorn: cada disparo lo ejecuta solo el que lo reclama (app/schedule/candados.py)
+    SCHED_CANDADOS = os.environ.get('SCHED_CANDADOS', '1') == '1'
+    SCHED_RECLAMOS_DIAS = int(os.environ.get('SCHED_RECLAMOS_DIAS', '14'))
+    
+    # Boot catchup en segundo plano (app/schedule/boot_catchup.py)
+    BOOT_CATCHUP_RETRASO_S = float(os.environ.get('BOOT_CATCHUP_RETRASO_S', '15'))
+    BOOT_CATCHUP_LOOKBACK_DIAS = int(os.environ.get('BOOT_CATCHUP_LOOKBACK_DIAS', '7'))
+    BOOT_CATCHUP_WORKERS = int(os.environ.get('BOOT_CATCHUP_WORKERS', '4'))
+    BOOT_CATCHUP_LOTE = int(os.environ.get('BOOT_CATCHUP_LOTE', '50'))
+    
     # Session
     SESSION_TYPE = 'filesystem'
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
@@ -49,6 +106,15 @@ class Config:
     # ML Configuration
     ML_ARTIFACTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml', 'artifacts')
     ML_MODELS_PATH = os.path.join(ML_ARTIFACTS_PATH, 'models')
+    # Caché de artefactos por worker (ml/model_cache.py)
+    ML_MODEL_CACHE_MB = float(os.environ.get('ML_MODEL_CACHE_MB', '512'))
+    ML_MODEL_CACHE_MMAP = os.environ.get('ML_MODEL_CACHE_MMAP', '1') == '1'
+    # Workers ML persistentes para los jobs (app/services/ml_runner.py); 0 = en el hilo del job
+    ML_POOL_WORKERS = int(os.environ.get('ML_POOL_WORKERS', '1'))
+    # Procesos para fits (usuario, categoría) en paralelo (ml/train_pool.py); 0 = núm. de cores
+    ML_TRAIN_WORKERS = int(os.environ.get('ML_TRAIN_WORKERS', '0'))
+    # Artefacto compacto (.npz, ml/models/compact.py) en lugar del RF joblib de 400 árboles
+    ML_MODELO_COMPACTO = os.environ.get('ML_MODELO_COMPACTO', '0') == '1'
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -0,0 +1,17 @@
+"""
+Configuración de gunicorn (se carga automáticamente desde el directorio de trabajo).
+Garantiza que cada worker drene el buffer de ingesta y apague su pool de ML antes de salir.
+"""
+
+
+def worker_exit(server, worker):
+    try:
+        from app.services.ingest_buffer import detener_buffer_ingesta
+        detener_buffer_ingesta()
+    except Exception as e:
+        print(f"[INGESTA][ERROR] Drenado en worker_exit: {e}")
+    try:
+        from app.services import ml_runner
+        ml_runner.cerrar()
+    except Exception as e:
+        print(f"[ML-POOL][ERROR] Cierre en worker_exit: {e}")
@@ -3,31 +3,107 @@ import numpy as np
 from app.models.models import FeaturesCategoriaDiaria
 from app.extensions import db
 
-def _calendar_feats(df: pd.DataFrame) -> pd.DataFrame:
-    d = df.copy()
-    dt = pd.to_datetime(d["fecha"])
-    d["dow"] = dt.dt.weekday
-    d["is_weekend"] = (d["dow"] >= 5).astype(int)
-    d["day"] = dt.dt.day
-    d["days_to_eom"] = dt.dt.daysinmonth - d["day"]
-    return d
+CALENDAR_COLS = ["dow", "is_weekend", "day", "days_to_eom"]
 
-def make_lagged(df: pd.DataFrame, lags=(1,2,3,7), ma_windows=(7,)) -> pd.DataFrame:
+
+def _calendar_feats(dias: np.ndarray) -> np.ndarray:
     """
-    Construye features por usuario-categoría con índice alineado (sin MultiIndex).
-    Requiere al menos min_t-1; MA7 se calcula como rolling(7) del shift(1).
+    dias: datetime64[D] → matriz (n, 4) con dow, is_weekend, day, days_to_eom.
+    Aritmética de fechas en NumPy, sin copiar el frame ni pasar por .dt.
+    """
+    meses = dias.astype("M8[M]")
+    inicio_mes = meses.astype("M8[D]")
+    day = (dias - inicio_mes).astype(np.int64) + 1
+    dias_mes = ((meses + 1).astype("M8[D]") - inicio_mes).astype(np.int64)
+    dow = (dias.astype(np.int64) + 3) % 7  # 1970-01-01 fue jueves
+    return np.column_stack([dow, dow >= 5, day, dias_mes - day])
+
+
+def build_lagged_matrix(df: pd.DataFrame, lags=(1,2,3,7), ma_windows=(7,)):
     """
-    d = df.sort_values(["usuario_id","categoria","fecha"]).copy()
-    d = _calendar_feats(d)
-    g = d.groupby(["usuario_id","categoria"], group_keys=False)
+    Reindexa cada serie (usuario_id, categoria) sobre un calendario denso (días sin
+    fila = 0 minutos) desde su primer hasta su último día, y calcula lags y medias
+    móviles en bloque: los lags son desplazamientos del arreglo denso y MA{W} sale
+    de una suma acumulada (ventana de W días previos, min_periods=1).
+
+    Devuelve (X, index, cols):
+      - X: matriz float32 contigua (n, len(cols)), sin el primer día de cada serie
+      - index: DataFrame alineado con X (usuario_id, categoria, fecha, minutos)
+      - cols: nombres de columna de X (mismo orden que get_feature_cols)
+    """
+    lags, ma_windows = tuple(lags), tuple(ma_windows)
+    cols = [f"min_t-{L}" for L in lags] + [f"MA{W}" for W in ma_windows] + CALENDAR_COLS
+    vacio = pd.DataFrame({"usuario_id": pd.Series(dtype=np.int64), "categoria": pd.Series(dtype=object),
+                          "fecha": pd.Series(dtype="datetime64[ns]"), "minutos": pd.Series(dtype=np.float64)})
+    if df is None or df.empty:
+        return np.empty((0, len(cols)), dtype=np.float32), vacio, cols
+
+    base = pd.DataFrame({
+        "usuario_id": df["usuario_id"].to_numpy(),
+        "categoria": df["categoria"].fillna("Sin categoría").astype(str).to_numpy(),
+        "fecha": pd.to_datetime(df["fecha"]).to_numpy().astype("M8[D]"),
+        "minutos": pd.to_numeric(df["minutos"], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64),
+    })
+    # Una fila por (usuario, categoria, día); grupos y días ordenados
+    base = base.groupby(["usuario_id", "categoria", "fecha"], sort=True, as_index=False)["minutos"].sum()
 
-    for L in lags:
-        d[f"min_t-{L}"] = g["minutos"].shift(L)
+    grupo = base.groupby(["usuario_id", "categoria"], sort=False).ngroup().to_numpy()
+    dia = base["fecha"].to_numpy().astype("M8[D]").astype(np.int64)
+    es_inicio = np.r_[True, grupo[1:] != grupo[:-1]]
+    es_fin = np.r_[grupo[1:] != grupo[:-1], True]
+    primero, ultimo = dia[es_inicio], dia[es_fin]
+    largo = ultimo - primero + 1
 
-    for W in ma_windows:
-        d[f"MA{W}"] = g["minutos"].transform(lambda s: s.shift(1).rolling(W, min_periods=1).mean())
+    # Calendario denso: posición global de cada día dentro de su serie
+    inicio = np.r_[0, np.cumsum(largo)[:-1]]
+    n = int(largo.sum())
+    g_denso = np.repeat(np.arange(len(largo)), largo)
+    pos = np.arange(n) - inicio[g_denso]
+    minutos = np.zeros(n, dtype=np.float64)
+    minutos[inicio[grupo] + (dia - primero[grupo])] = base["minutos"].to_numpy()
 
-    d = d.dropna(subset=["min_t-1"])
+    X = np.empty((n, len(cols)), dtype=np.float32)
+    for j, L in enumerate(lags):
+        col = np.full(n, np.nan)
+        col[L:] = minutos[:n - L] if L < n else []
+        col[pos < L] = np.nan
+        X[:, j] = col
+
+    acumulado = np.r_[0.0, np.cumsum(minutos)]
+    i = np.arange(n)
+    for k, W in enumerate(ma_windows):
+        desde = np.maximum(i - W, i - pos)
+        cuenta = i - desde
+        with np.errstate(invalid="ignore", divide="ignore"):
+            X[:, len(lags) + k] = np.where(cuenta > 0, (acumulado[i] - acumulado[desde]) / cuenta, np.nan)
+
+    fechas = (np.repeat(primero, largo) + pos).astype("M8[D]")
+    X[:, len(lags) + len(ma_windows):] = _calendar_feats(fechas)
+
+    # Sin min_t-1 no hay fila útil: se descarta el primer día de cada serie
+    util = pos > 0
+    X = np.ascontiguousarray(X[util])
+    ini_grupo = base.loc[es_inicio, ["usuario_id", "categoria"]].to_numpy()
+    index = pd.DataFrame({
+        "usuario_id": ini_grupo[g_denso[util], 0],
+        "categoria": ini_grupo[g_denso[util], 1],
+        "fecha": fechas[util].astype("M8[ns]"),
+        "minutos": minutos[util],
+    })
+    index["usuario_id"] = index["usuario_id"].astype(base["usuario_id"].dtype)
+    return X, index, cols
+
+
+def make_lagged(df: pd.DataFrame, lags=(1,2,3,7), ma_windows=(7,)) -> pd.DataFrame:
+    """
+    Construye features por usuario-categoría con índice alineado (sin MultiIndex).
+    Los lags son en días de calendario (min_t-7 = hace siete días, 0 si no hubo uso);
+    ver build_lagged_matrix. Se omite el primer día de cada serie (sin min_t-1).
+    """
+    X, index, cols = build_lagged_matrix(df, lags=lags, ma_windows=ma_windows)
+    d = index.copy()
+    for j, c in enumerate(cols):
+        d[c] = X[:, j]
     return d
 
 def get_feature_cols(d: pd.DataFrame):
@@ -44,17 +120,12 @@ def split_train_holdout(d: pd.DataFrame, holdout_days=7):
 def latest_X_per_categoria(d: pd.DataFrame):
     """
     Devuelve el registro más reciente por usuario y categoría.
-    Corrige duplicados o categorías vacías ('Sin categoría').
+    `d` viene de make_lagged: ordenado por serie y fecha, un día por fila,
+    así que basta con la última fila de cada serie.
     """
-    d = d.copy()
-    d["categoria"] = d["categoria"].astype(str).fillna("Sin categoría")
-    d = d.sort_values(["usuario_id", "categoria", "fecha"], ascending=True)
-    d = d.drop_duplicates(subset=["usuario_id", "categoria", "fecha"], keep="last")
     feats = get_feature_cols(d)
-    idx = d.groupby(["usuario_id", "categoria"])["fecha"].idxmax()
-    latest = d.loc[idx, ["usuario_id", "categoria", "fecha"] + feats].reset_index(drop=True)
-    latest = latest.drop_duplicates(subset=["usuario_id", "categoria"], keep="last")
-
+    latest = d.loc[~d.duplicated(["usuario_id", "categoria"], keep="last"),
+                   ["usuario_id", "categoria", "fecha"] + feats].reset_index(drop=True)
     return latest, feats
 
 def build_features_for_day(usuario_id, fecha):
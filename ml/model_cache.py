@@ -0,0 +1,164 @@
+"""
+Caché de artefactos de modelo por proceso.
+
+- Clave (usuario_id, categoria, ruta, mtime_ns): si el archivo cambia (reentreno),
+  la siguiente lectura lo vuelve a cargar; no hace falta invalidar entre workers.
+- Presupuesto ML_MODEL_CACHE_MB con expulsión LRU (tamaño estimado = tamaño en disco).
+- ML_MODEL_CACHE_MMAP: carga con joblib mmap_mode='r', así los arreglos numpy del
+  artefacto quedan en el page cache compartido entre workers de gunicorn. Si el
+  artefacto no admite mmap (comprimido, etc.) se carga normal.
+- `guardar_atomico` / `copiar_atomico`: escriben a un temporal en el mismo
+  directorio y hacen os.replace, de modo que un lector nunca ve un archivo a medias.
+- Los .npz son modelos compactos (ml/models/compact.py) y no pasan por joblib.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import joblib
+
+_lock = threading.RLock()
+_modelos = OrderedDict()   # ruta -> (clave, modelo, bytes)
+_stats = {"hits": 0, "misses": 0, "recargas": 0, "expulsiones": 0, "mmap": 0}
+
+
+def _config(nombre, defecto):
+    try:
+        from flask import current_app
+        return current_app.config.get(nombre, defecto)
+    except Exception:
+        return os.environ.get(nombre, defecto)
+
+
+def _presupuesto_bytes() -> int:
+    return int(float(_config("ML_MODEL_CACHE_MB", 512)) * 1024 * 1024)
+
+
+def _usar_mmap() -> bool:
+    return str(_config("ML_MODEL_CACHE_MMAP", True)).lower() not in ("0", "false", "no")
+
+
+def _expulsar(presupuesto: int, conservar: str):
+    total = sum(b for _, _, b in _modelos.values())
+    while total > presupuesto and len(_modelos) > 1:
+        ruta, (_, _, b) = next(iter(_modelos.items()))
+        if ruta == conservar:
+            _modelos.move_to_end(ruta)
+            ruta, (_, _, b) = next(iter(_modelos.items()))
+        del _modelos[ruta]
+        total -= b
+        _stats["expulsiones"] += 1
+
+
+def cargar(ruta, usuario_id: int = None, categoria: str = None):
+    """
+    Igual que joblib.load(ruta) pero servido desde la caché mientras el archivo
+    no cambie. Propaga las excepciones de carga (archivo ausente, corrupto…).
+    """
+    ruta = str(Path(ruta).resolve())
+    st = os.stat(ruta)
+    clave = (usuario_id, categoria, ruta, st.st_mtime_ns)
+    with _lock:
+        item = _modelos.get(ruta)
+        if item is not None and item[0] == clave:
+            _modelos.move_to_end(ruta)
+            _stats["hits"] += 1
+            return item[1]
+        _stats["misses"] += 1
+        if item is not None:
+            _stats["recargas"] += 1
+
+    modelo = None
+    if ruta.endswith(".npz"):
+        from ml.models import compact
+        modelo = compact.cargar(ruta)
+    elif _usar_mmap():
+        try:
+            modelo = joblib.load(ruta, mmap_mode="r")
+            _stats["mmap"] += 1
+        except Exception:
+            modelo = None
+    if modelo is None:
+        modelo = joblib.load(ruta)
+
+    with _lock:
+        _modelos[ruta] = (clave, modelo, st.st_size)
+        _modelos.move_to_end(ruta)
+        _expulsar(_presupuesto_bytes(), ruta)
+    return modelo
+
+
+def _temporal_junto_a(destino: Path) -> Path:
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{destino.name}.", suffix=".tmp", dir=destino.parent)
+    os.close(fd)
+    return Path(tmp)
+
+
+def guardar_atomico(obj, ruta) -> Path:
+    """joblib.dump (o compact.guardar para .npz) a un temporal del mismo directorio + os.replace."""
+    ruta = Path(ruta)
+    tmp = _temporal_junto_a(ruta)
+    try:
+        if ruta.suffix == ".npz":
+            from ml.models import compact
+            with open(tmp, "wb") as f:
+                compact.guardar(obj, f)
+        else:
+            joblib.dump(obj, tmp)
+        os.replace(tmp, ruta)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    invalidar(ruta)
+    return ruta
+
+
+def copiar_atomico(origen, destino) -> Path:
+    """shutil.copyfile atómico (p. ej. model_latest.joblib)."""
+    destino = Path(destino)
+    tmp = _temporal_junto_a(destino)
+    try:
+        shutil.copyfile(origen, tmp)
+        os.replace(tmp, destino)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    invalidar(destino)
+    return destino
+
+
+def escribir_json_atomico(data, ruta) -> Path:
+    """json.dump a un temporal del mismo directorio + os.replace (p. ej. metrics.json)."""
+    ruta = Path(ruta)
+    tmp = _temporal_junto_a(ruta)
+    try:
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, ruta)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    return ruta
+
+
+def invalidar(ruta=None):
+    with _lock:
+        if ruta is None:
+            _modelos.clear()
+        else:
+            _modelos.pop(str(Path(ruta).resolve()), None)
+
+
+def metricas() -> dict:
+    with _lock:
+        m = dict(_stats)
+        m["modelos"] = len(_modelos)
+        m["bytes"] = sum(b for _, _, b in _modelos.values())
+    total = m["hits"] + m["misses"]
+    m["hit_rate"] = round(m["hits"] / total, 4) if total else 0.0
+    return m
@@ -1,9 +1,26 @@
-from ml.models.baseline import BaselineHybrid
-from ml.models.random_forest import RandomForestWrapper
-
-import joblib
+import importlib
 import json
 from pathlib import Path
+from ml import model_cache
+
+# Reexportes perezosos: `from ml.models.compact import ...` en los workers de
+# entrenamiento (ml/train_pool.py) no debe arrastrar random_forest → ml.utils_ml → app.
+_REEXPORTES = {
+    "BaselineHybrid": "ml.models.baseline",
+    "RandomForestWrapper": "ml.models.random_forest",
+    "CompactForest": "ml.models.compact",
+    "CompactLinear": "ml.models.compact",
+}
+
+
+def __getattr__(nombre):
+    modulo = _REEXPORTES.get(nombre)
+    if modulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+    valor = getattr(importlib.import_module(modulo), nombre)
+    globals()[nombre] = valor
+    return valor
+
 
 ARTIFACTS_DIR = Path("ml/artifacts")
 MODELOS_JSON = ARTIFACTS_DIR / "model_selector.json"
@@ -29,13 +46,17 @@ def load_model_for_categoria(usuario_id: int, categoria: str):
     if entry:
         modelo_path = ARTIFACTS_DIR / f"usuario_{usuario_id}" / entry
         if modelo_path.exists():
-            return joblib.load(modelo_path)
+            return model_cache.cargar(modelo_path, usuario_id, categoria)
 
     # Buscar en directorio del usuario
     cat_path = ARTIFACTS_DIR / f"usuario_{usuario_id}" / categoria.lower().replace(" ", "_")
+    compact_path = cat_path / f"compact_{categoria.lower().replace(' ', '_')}.npz"
+    if compact_path.exists():
+        return model_cache.cargar(compact_path, usuario_id, categoria)
     rf_path = cat_path / f"rf_{categoria.lower().replace(' ', '_')}.joblib"
     if rf_path.exists():
-        return joblib.load(rf_path)
+        return model_cache.cargar(rf_path, usuario_id, categoria)
 
     print(f"[WARN][MODEL] No se encontró modelo para usuario {usuario_id}, {categoria}, usando BaselineHybrid()")
+    from ml.models.baseline import BaselineHybrid
     return BaselineHybrid()
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+Formato compacto de modelos por categoría (compact_<categoria>.npz).
+
+- CompactForest: bosque sklearn aplanado en arreglos (feature int16, threshold
+  float32, dirección de NaN por nodo, hijos int32, hojas float32 o float16).
+  Las hojas apuntan a sí mismas, así la predicción recorre todos los árboles y
+  filas a la vez en `profundidad` pasos vectorizados, sin objetos Tree.
+- CompactLinear: Ridge (coeficientes + intercepto), para series donde gana en validación.
+- ajustar_compacto: elige por MAE en la cola de validación entre Ridge y bosques
+  chicos (árboles × profundidad) y reentrena el ganador con todas las filas.
+
+Se guarda con np.savez (sin pickle) y carga en milisegundos.
+"""
+import json
+
+import numpy as np
+
+# (n_estimators, max_depth), de menor a mayor tamaño
+GRID_BOSQUE = [(25, 4), (50, 6), (100, 8), (200, None)]
+
+
+def _umbral_float32(t: np.ndarray) -> np.ndarray:
+    """Mayor float32 <= t: para x float32, x <= t64 ⇔ x <= t32 (igual que sklearn)."""
+    t32 = t.astype(np.float32)
+    arriba = t32.astype(np.float64) > t
+    t32[arriba] = np.nextafter(t32[arriba], np.float32(-np.inf))
+    return t32
+
+
+def _matriz(X, feature_names):
+    if hasattr(X, "columns") and feature_names:
+        X = X.reindex(columns=feature_names, fill_value=0.0)
+    return np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+
+
+class CompactForest:
+    tipo = "forest"
+
+    def __init__(self, feature, threshold, nan_izq, left, right, value, raices, profundidad, feature_names):
+        self.feature = feature
+        self.threshold = threshold
+        self.nan_izq = nan_izq
+        self.left = left
+        self.right = right
+        self.value = value
+        self.raices = raices
+        self.profundidad = int(profundidad)
+        self.feature_names_in_ = list(feature_names)
+
+    @classmethod
+    def from_sklearn(cls, forest, feature_names, cuantizar_hojas: bool = False):
+        """forest: RandomForestRegressor (o RFReg) ya entrenado."""
+        forest = getattr(forest, "model", forest)
+        partes, raices, offset, profundidad = [], [], 0, 0
+        for est in forest.estimators_:
+            t = est.tree_
+            n = t.node_count
+            idx = np.arange(n)
+            hoja = t.children_left == -1
+            left = np.where(hoja, idx, t.children_left) + offset
+            right = np.where(hoja, idx, t.children_right) + offset
+            feat = np.where(hoja, 0, t.feature)
+            thr = np.where(hoja, 0.0, t.threshold)
+            # sklearn >= 1.3 guarda a qué hijo van los NaN en cada split
+            nan_izq = getattr(t, "missing_go_to_left", np.zeros(n, dtype=np.uint8)).astype(bool)
+            partes.append((feat, thr, nan_izq, left, right, t.value.reshape(n, -1)[:, 0]))
+            raices.append(offset)
+            offset += n
+            profundidad = max(profundidad, int(t.max_depth))
+
+        feat, thr, nan_izq, left, right, value = (np.concatenate(c) for c in zip(*partes))
+        return cls(
+            feature=feat.astype(np.int16),
+            threshold=_umbral_float32(thr.astype(np.float64)),
+            nan_izq=nan_izq,
+            left=left.astype(np.int32),
+            right=right.astype(np.int32),
+            value=value.astype(np.float16 if cuantizar_hojas else np.float32),
+            raices=np.asarray(raices, dtype=np.int32),
+            profundidad=profundidad,
+            feature_names=feature_names,
+        )
+
+    def predict(self, X) -> np.ndarray:
+        X = _matriz(X, self.feature_names_in_)
+        filas = np.arange(len(X))[:, None]
+        nodo = np.broadcast_to(self.raices, (len(X), len(self.raices))).copy()
+        for _ in range(self.profundidad):
+            x = X[filas, self.feature[nodo]]
+            izq = (x <= self.threshold[nodo]) | (np.isnan(x) & self.nan_izq[nodo])
+            nodo = np.where(izq, self.left[nodo], self.right[nodo])
+        return self.value[nodo].astype(np.float64).mean(axis=1)
+
+    def arreglos(self) -> dict:
+        return {
+            "feature": self.feature, "threshold": self.threshold, "nan_izq": self.nan_izq, "left": self.left,
+            "right": self.right, "value": self.value, "raices": self.raices,
+            "profundidad": np.int32(self.profundidad),
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arreglos().values())
+
+
+class CompactLinear:
+    tipo = "linear"
+
+    def __init__(self, coef, intercept, feature_names):
+        self.coef = np.asarray(coef, dtype=np.float32)
+        self.intercept = float(intercept)
+        self.feature_names_in_ = list(feature_names)
+
+    @classmethod
+    def from_sklearn(cls, modelo, feature_names):
+        return cls(modelo.coef_, modelo.intercept_, feature_names)
+
+    def predict(self, X) -> np.ndarray:
+        X = np.nan_to_num(_matriz(X, self.feature_names_in_).astype(np.float64))
+        return X @ self.coef + self.intercept
+
+    def arreglos(self) -> dict:
+        return {"coef": self.coef, "intercept": np.float64(self.intercept)}
+
+    @property
+    def nbytes(self) -> int:
+        return self.coef.nbytes + 8
+
+
+def guardar(modelo, f):
+    """np.savez a un archivo abierto (el llamador se encarga de la escritura atómica)."""
+    meta = json.dumps({"tipo": modelo.tipo, "features": modelo.feature_names_in_})
+    np.savez(f, meta=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8), **modelo.arreglos())
+
+
+def cargar(ruta):
+    with np.load(ruta, allow_pickle=False) as z:
+        meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+        a = {k: z[k] for k in z.files if k != "meta"}
+    if meta["tipo"] == "linear":
+        return CompactLinear(a["coef"], a["intercept"], meta["features"])
+    return CompactForest(a["feature"], a["threshold"], a["nan_izq"], a["left"], a["right"], a["value"],
+                         a["raices"], a["profundidad"], meta["features"])
+
+
+def ajustar_compacto(X, y, feature_names, n_jobs: int = 1, n_val: int = 14, random_state: int = 42):
+    """
+    Selección por validación temporal (últimas n_val filas) entre Ridge y GRID_BOSQUE.
+    Solo se cambia a un candidato más grande si mejora el MAE más de 1 %.
+    Devuelve (modelo_compacto, resumen).
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.linear_model import Ridge
+
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=float)
+    n_val = min(n_val, max(3, len(y) // 4))
+    Xa, ya, Xv, yv = X[:-n_val], y[:-n_val], X[-n_val:], y[-n_val:]
+
+    # Ridge no admite NaN (lags antes del inicio de la serie): se imputan con 0, igual que CompactLinear.predict
+    candidatos = [("linear", lambda: Ridge(alpha=1.0))] + [
+        (f"forest_{n}x{d or 'full'}",
+         lambda n=n, d=d: RandomForestRegressor(n_estimators=n, max_depth=d, random_state=random_state, n_jobs=n_jobs))
+        for n, d in GRID_BOSQUE
+    ]
+
+    mejor, mejor_mae, maes = None, np.inf, {}
+    if len(ya) >= 5:
+        for nombre, crear in candidatos:
+            lineal = nombre == "linear"
+            m = crear().fit(np.nan_to_num(Xa) if lineal else Xa, ya)
+            mae = float(np.mean(np.abs(m.predict(np.nan_to_num(Xv) if lineal else Xv) - yv)))
+            maes[nombre] = round(mae, 4)
+            if mae < mejor_mae * 0.99:
+                mejor, mejor_mae = (nombre, crear), mae
+    if mejor is None:
+        mejor = candidatos[1]
+
+    nombre, crear = mejor
+    final = crear().fit(np.nan_to_num(X) if nombre == "linear" else X, y)
+    if nombre == "linear":
+        compacto = CompactLinear.from_sklearn(final, feature_names)
+    else:
+        compacto = CompactForest.from_sklearn(final, feature_names)
+    return compacto, {"elegido": nombre, "mae_validacion": maes}
@@ -1,5 +1,5 @@
-import joblib
 from pathlib import Path
+from ml import model_cache
 from ml.utils_ml import canon_cat_filename, ensure_dir 
 
 ARTIFACTS_DIR = Path("ml/artifacts")
@@ -20,7 +20,7 @@ class RandomForestWrapper:
         if not path.exists():
             raise FileNotFoundError(f"No existe modelo RF para {categoria}: {path}")
         wrapper = cls(categoria)
-        wrapper.model = joblib.load(path)
+        wrapper.model = model_cache.cargar(path, categoria=categoria)
         return wrapper
 
     @staticmethod
@@ -33,7 +33,7 @@ class RandomForestWrapper:
         outdir = ARTIFACTS_DIR / cat_name
         ensure_dir(outdir)
         path = outdir / f"rf_{cat_name}.joblib"
-        joblib.dump(model, path)
+        model_cache.guardar_atomico(model, path)
         print(f"[RF][SAVE] {path}")
         return path
 
@@ -1,17 +1,18 @@
-import argparse, json, glob, shutil
+import argparse, json, glob
+import calendar
 from datetime import date, timedelta, datetime
 from pathlib import Path
 
 import pandas as pd
-from joblib import dump, load
 import os
 import sys 
 from ml.data import load_fc_diaria
-from ml.features import make_lagged, get_feature_cols, split_train_holdout, latest_X_per_categoria, build_features_for_day
+from ml.features import make_lagged, get_feature_cols, split_train_holdout, latest_X_per_categoria
 from ml.estimators import NaiveLast, MA7, RFReg
 from ml.metrics import mae, rmse, smape, _best_baseline, log_metrics
-from ml.models import BaselineHybrid, RandomForestWrapper, load_model_for_categoria
-from ml.utils_ml import canon_cat_filename, ensure_dir, guardar_predicciones
+from ml.models import BaselineHybrid, RandomForestWrapper
+from ml.utils_ml import canon_cat_filename, guardar_predicciones
+from ml import model_cache
 from ml.scripts.build_model_selector import build_model_selector 
 import numpy as np
 import unicodedata
@@ -19,7 +20,6 @@ import re as _re
 import sqlalchemy as sa
 from app.extensions import db
 import json
-import joblib
 
 try:
     from app.services.contexto_ml_integration import ajustar_prediccion_con_contexto
@@ -129,8 +129,8 @@ def train(usuario_id: int, hist_days: int = 180, holdout_days: int = 7):
 
         bundle = {"model": BaselineHybrid(), "features": X_cols, "mode": "baseline"}
         model_path = ARTIF_DIR / f"model_{ts}_baseline.joblib"
-        dump(bundle, model_path)
-        shutil.copyfile(model_path, LATEST)
+        model_cache.guardar_atomico(bundle, model_path)
+        model_cache.copiar_atomico(model_path, LATEST)
 
         reason = "sin datos" if df.empty else f"hist_insuficiente: n_dias={n_dias} < threshold={threshold}"
         metrics = {
@@ -190,7 +190,7 @@ def train(usuario_id: int, hist_days: int = 180, holdout_days: int = 7):
     m_rf = {"MAE": mae(yte, yhat_rf), "RMSE": rmse(yte, yhat_rf), "sMAPE": smape_safe(yte, yhat_rf)}
 
     model_path = ARTIF_DIR / f"model_{ts}_rf.joblib"
-    dump({"model": rf, "features": X_cols, "mode": "rf"}, model_path)
+    model_cache.guardar_atomico({"model": rf, "features": X_cols, "mode": "rf"}, model_path)
 
     try:
         hyperparams = rf.get_params()
@@ -232,7 +232,7 @@ def train(usuario_id: int, hist_days: int = 180, holdout_days: int = 7):
 
     promote = (m_rf["MAE"] <= m_ma7["MAE"]) and (m_rf["RMSE"] <= m_ma7["RMSE"])
     if promote:
-        shutil.copyfile(model_path, LATEST)
+        model_cache.copiar_atomico(model_path, LATEST)
         _save_json(LATEST_METRICS, metrics)  
         log_metrics({
             "fecha": date.today(),
@@ -251,76 +251,86 @@ def train(usuario_id: int, hist_days: int = 180, holdout_days: int = 7):
 
     return {"model_path": str(model_path), "metrics": metrics, "promoted": promote}
 
-def train_por_categoria(usuario_id, hist_days=180):
-    """
-    Entrena modelos RF por categoría para UN USUARIO específico.
-    Guarda los artefactos en ml/artifacts/usuario_X/<categoria>/rf_<categoria>.joblib
-    """
+def _tareas_usuario(usuario_id, hist_days):
+    """Matrices de entrenamiento por categoría del usuario (para ml.train_pool)."""
     start = date.today() - timedelta(days=hist_days)
     end = date.today() - timedelta(days=1)
     df = load_fc_diaria(usuario_id, start=start, end=end)
-    
+
     if df.empty:
         print(f"No hay datos para entrenar (usuario={usuario_id})")
-        return
-
-    categorias = df["categoria"].unique()
-    print(f"[TRAIN] Entrenando {len(categorias)} categorías para usuario {usuario_id}...")
+        return []
 
-    for cat in categorias:
-        sub = df[df["categoria"] == cat].copy()
+    tareas = []
+    for cat, sub in df.groupby("categoria", sort=False):
         if len(sub) < 10:
             print(f"[SKIP] {cat}: insuficiente historial ({len(sub)} registros)")
             continue
 
         d = make_lagged(sub)
         X_cols = get_feature_cols(d)
-        train_df, test_df = split_train_holdout(d, holdout_days=7)
-        Xtr = train_df[X_cols].astype(float)
-        ytr = train_df["minutos"].astype(float)
-
-        rf = RFReg()
-        rf.fit(Xtr, ytr)
-        rf.feature_names_in_ = list(Xtr.columns)
+        train_df, _ = split_train_holdout(d, holdout_days=7)
+        if train_df.empty:
+            print(f"[SKIP] {cat}: sin filas fuera del holdout")
+            continue
 
-        #  Guardar POR USUARIO
         cat_name = canon_cat_filename(cat)
-        outdir = ARTIF_DIR / f"usuario_{usuario_id}" / cat_name
-        ensure_dir(outdir)
-        artifact_path = outdir / f"rf_{cat_name}.joblib"
-        dump(rf, artifact_path)
-        print(f"[OK] Guardado modelo RF para usuario {usuario_id}, {cat} → {artifact_path}")
-        
-        # Métricas
-        from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-        import numpy as np
+        tareas.append({
+            "usuario_id": usuario_id,
+            "categoria": cat,
+            "cat_name": cat_name,
+            "outdir": str(ARTIF_DIR / f"usuario_{usuario_id}" / cat_name),
+            "X": np.ascontiguousarray(train_df[X_cols].to_numpy(dtype=np.float32)),
+            "y": train_df["minutos"].to_numpy(dtype=float),
+            "cols": X_cols,
+        })
+    return tareas
+
+
+def entrenar_usuarios(usuario_ids, hist_days=180):
+    """
+    Entrena los modelos RF por categoría de varios usuarios en un solo lote:
+    todos los fits (usuario, categoria) se reparten juntos en ml.train_pool.
+    El model_selector de cada usuario se actualiza cuando terminan sus fits.
+    """
+    from ml.train_pool import entrenar
 
-        ypred = rf.predict(train_df[X_cols])
-        mae = float(mean_absolute_error(ytr, ypred))
-        mse = float(mean_squared_error(ytr, ypred))
-        rmse = float(np.sqrt(mse))
-        r2 = float(r2_score(ytr, ypred))
+    tareas, con_datos = [], []
+    for uid in usuario_ids:
+        t = _tareas_usuario(uid, hist_days)
+        if t:
+            print(f"[TRAIN] Entrenando {len(t)} categorías para usuario {uid}...")
+            tareas.extend(t)
+            con_datos.append(uid)
 
-        metrics = {"MAE": mae, "RMSE": rmse, "R2": r2}
-        with open(outdir / "metrics.json", "w") as f:
-            json.dump(metrics, f, indent=2)
+    def _al_terminar(res):
+        print(f"[METRICS] {res['categoria']} → {res['metrics']}")
 
-        print(f"[METRICS] {cat} → {metrics}")
+    resumen = entrenar(tareas, al_terminar=_al_terminar)
+
+    for uid in con_datos:
+        try:
+            build_model_selector(uid)
+            print(f"[ML-005] model_selector.json actualizado para usuario {uid}")
+        except Exception as e:
+            print(f"[WARN][ML-005] No se pudo actualizar model_selector.json: {e}")
+    return resumen
 
-    # Actualizar model_selector POR USUARIO
-    try:
-        build_model_selector(usuario_id)
-        print(f"[ML-005] model_selector.json actualizado para usuario {usuario_id}")
-    except Exception as e:
-        print(f"[WARN][ML-005] No se pudo actualizar model_selector.json: {e}")
+
+def train_por_categoria(usuario_id, hist_days=180):
+    """
+    Entrena modelos RF por categoría para UN USUARIO específico.
+    Guarda los artefactos en ml/artifacts/usuario_X/<categoria>/rf_<categoria>.joblib
+    """
+    return entrenar_usuarios([usuario_id], hist_days=hist_days)
 
 def _load_latest_model():
     if not LATEST.exists():
         cands = sorted(glob.glob(str(ARTIF_DIR / "model_*.joblib")))
         if not cands:
             raise FileNotFoundError("No hay modelo entrenado. Corre: python -m ml.pipeline train --usuario 1")
-        return load(cands[-1])
-    return load(LATEST)
+        return model_cache.cargar(cands[-1])
+    return model_cache.cargar(LATEST)
 
 print("[TEST] ml/pipeline.py cargado correctamente ")
 
@@ -358,21 +368,12 @@ def predict(usuario_id: int, fecha: date | None = None, save_csv: bool = False):
     if latest.empty:
         return {"usuario_id": usuario_id, "fecha_pred": fecha.isoformat(), "predicciones": []}
 
-    preds = []
-    for idx, row in latest.iterrows():
-        categoria = canon_cat(row["categoria"])
-        valid_feats = ['min_t-1', 'min_t-2', 'min_t-3', 'min_t-7', 'MA7', 'dow', 'is_weekend', 'day', 'days_to_eom']
-        feats_cat = row[valid_feats]
-        hist_cat = df[df["categoria"] == categoria]["minutos"]
-        yhat = predict_categoria(
-            usuario_id=usuario_id,
-            categoria=categoria,
-            features=feats_cat,
-            df_hist=hist_cat
-        )
-        preds.append({"categoria": categoria, "yhat_minutos": round(float(yhat), 2)})
+    yhat = np.round(predecir_lote(usuario_id, latest, df), 2)
+    preds = [
+        {"categoria": canon_cat(c), "yhat_minutos": float(y)}
+        for c, y in zip(latest["categoria"], yhat)
+    ]
 
-  
     print("[DEBUG] predicciones crudas →", preds)
 
     hist = df.copy()
@@ -385,8 +386,7 @@ def predict(usuario_id: int, fecha: date | None = None, save_csv: bool = False):
         hist["categoria"] = hist["categoria"].astype(str).map(canon_cat)
 
     dow = int(fecha.weekday())
-    hist_dow = hist.assign(dow=hist["fecha"].dt.weekday)
-    hist_dow = hist_dow[hist_dow["dow"] == dow]
+    hist_dow = hist[hist["fecha"].dt.weekday == dow]
 
     p95_cat = {}
     if not hist_dow.empty:
@@ -396,10 +396,10 @@ def predict(usuario_id: int, fecha: date | None = None, save_csv: bool = False):
     else:
         med_total = None
 
-    for p in preds:
-        cap = float(p95_cat.get(p["categoria"], p["yhat_minutos"]))
-        if p["yhat_minutos"] > cap:
-            p["yhat_minutos"] = cap
+    # Tope p95 por categoría (sin p95 → sin tope)
+    caps = np.array([p95_cat.get(p["categoria"], np.inf) for p in preds], dtype=float)
+    for p, y in zip(preds, np.minimum(yhat, caps)):
+        p["yhat_minutos"] = float(y)
 
     HIDE_SIN_CAT = True
     REDISTRIBUIR_SIN_CAT = False
@@ -484,98 +484,151 @@ def predict(usuario_id: int, fecha: date | None = None, save_csv: bool = False):
 
     return result
 
-def predict_multi_horizon(usuario_id, fecha_base, horizontes=[1, 2, 3]):
+def _historia_reciente(df: pd.DataFrame, fecha_base: date, ventana: int = 7):
+    """
+    Últimos `ventana` días (hasta fecha_base inclusive) de cada categoría sobre
+    calendario denso: día sin fila = 0, día anterior al inicio de la serie = NaN
+    (misma convención que make_lagged). Devuelve (categorias, matriz C × ventana).
+    """
+    d = df.assign(
+        categoria=df["categoria"].astype(str).map(canon_cat),
+        fecha=pd.to_datetime(df["fecha"]).values.astype("M8[D]"),
+        minutos=pd.to_numeric(df["minutos"], errors="coerce").fillna(0.0),
+    )
+    d = d[d["fecha"] <= np.datetime64(fecha_base, "D")]
+    d = d.groupby(["categoria", "fecha"], as_index=False)["minutos"].sum()
+    categorias = sorted(d["categoria"].unique())
+    if not categorias:
+        return [], np.empty((0, ventana))
+
+    fila = {c: i for i, c in enumerate(categorias)}
+    i = d["categoria"].map(fila).to_numpy()
+    atras = (np.datetime64(fecha_base, "D") - d["fecha"].to_numpy().astype("M8[D]")).astype(np.int64)
+    inicio = d.groupby("categoria")["fecha"].min().reindex(categorias).to_numpy().astype("M8[D]")
+
+    hist = np.zeros((len(categorias), ventana))
+    dentro = atras < ventana
+    hist[i[dentro], ventana - 1 - atras[dentro]] = d["minutos"].to_numpy()[dentro]
+    dias = np.datetime64(fecha_base, "D") - np.arange(ventana - 1, -1, -1)
+    hist[dias[None, :] < inicio[:, None]] = np.nan
+    return categorias, hist
+
+
+def _features_horizonte(hist: np.ndarray, fecha: date) -> np.ndarray:
+    """Matriz C × VALID_FEATS para predecir `fecha` a partir de los últimos 7 días de hist."""
+    C = hist.shape[0]
+    ult7 = hist[:, -7:]
+    n = np.sum(~np.isnan(ult7), axis=1)
+    ma7 = np.where(n > 0, np.nansum(ult7, axis=1) / np.maximum(n, 1), np.nan)
+    dow = fecha.weekday()
+    cal = [dow, int(dow >= 5), fecha.day, calendar.monthrange(fecha.year, fecha.month)[1] - fecha.day]
+    return np.column_stack([
+        hist[:, -1], hist[:, -2], hist[:, -3], hist[:, -7], ma7,
+        np.tile(np.asarray(cal, dtype=float), (C, 1)),
+    ])
+
+
+def predict_multi_horizon(usuario_id, fecha_base, horizontes=[1, 2, 3], hist_days: int = 180):
     """
     Genera predicciones para múltiples horizontes (T+1..T+N) y las guarda en ml/preds/
+
+    Motor recursivo: la historia se lee una vez, cada modelo se carga una vez y
+    para cada día T+1..T+max(horizontes) se arma la fila de features de todas las
+    categorías a la vez (lags/MA7 sobre calendario denso), se predice con un
+    .predict por modelo y la predicción se agrega a la historia para el día
+    siguiente. Horizontes largos (p. ej. 1..14) cuestan un paso vectorizado por día.
     """
-    all_preds = []
-    fecha_base = pd.to_datetime(fecha_base)
+    fecha_base = pd.to_datetime(fecha_base).date()
+    horizontes = sorted({int(h) for h in horizontes if int(h) >= 1})
+    if not horizontes:
+        return pd.DataFrame()
+
+    df = load_fc_diaria(usuario_id, start=fecha_base - timedelta(days=hist_days), end=fecha_base)
+    categorias, hist = _historia_reciente(df, fecha_base) if not df.empty else ([], None)
+    if not categorias:
+        print(f"[WARN][MULTI] Sin historia para usuario={usuario_id} hasta {fecha_base}")
+        print(f"[ML][MULTI] No se generaron predicciones para usuario={usuario_id}")
+        return pd.DataFrame()
+
+    # Un artefacto (o baseline) por grupo de categorías, cargado una sola vez
+    grupos = {}
+    for i, cat in enumerate(categorias):
+        grupos.setdefault(_rutas_modelo_categoria(usuario_id, cat), []).append(i)
+    modelos = []
+    for rutas, filas in grupos.items():
+        modelo = _cargar_modelo(rutas, usuario_id, categorias[filas[0]]) if rutas else None
+        modelos.append((modelo, np.asarray(filas)))
+    nombre_modelo = np.empty(len(categorias), dtype=object)
+    for modelo, filas in modelos:
+        nombre_modelo[filas] = modelo.__class__.__name__ if modelo is not None else "BaselineHybrid"
 
-    for h in horizontes:
+    all_preds = []
+    for h in range(1, horizontes[-1] + 1):
         fecha_pred = fecha_base + timedelta(days=h)
-        print(f"[ML][MULTI] Generando predicciones {fecha_pred.date()} (h={h})")
-        df_features = build_features_for_day(usuario_id, fecha_base)
-        if df_features.empty:
-            print(f"[WARN][MULTI] Sin features para usuario={usuario_id}, salto día {fecha_pred.date()}")
+        X = np.nan_to_num(_features_horizonte(hist, fecha_pred), nan=0.0, posinf=0.0, neginf=0.0)
+        yhat = np.zeros(len(categorias))
+
+        for modelo, filas in modelos:
+            if modelo is None:
+                # BaselineHybrid: media de los últimos 7 días + 0.5 * tendencia
+                ult = hist[filas, -7:]
+                n = np.sum(~np.isnan(ult), axis=1)
+                primero = np.array([r[~np.isnan(r)][0] if k else 0.0 for r, k in zip(ult, n)])
+                media = np.where(n > 0, np.nansum(ult, axis=1) / np.maximum(n, 1), 0.0)
+                trend = np.where(n > 1, (ult[:, -1] - primero) / np.maximum(n - 1, 1), 0.0)
+                yhat[filas] = media + 0.5 * trend
+                continue
+            Xg = pd.DataFrame(X[filas], columns=VALID_FEATS)
+            feature_cols = getattr(modelo, "feature_names_in_", None)
+            if feature_cols is not None:
+                Xg = Xg.reindex(columns=list(feature_cols), fill_value=0.0)
+            try:
+                yhat[filas] = np.asarray(modelo.predict(Xg), dtype=float).reshape(-1)
+            except Exception as e:
+                print(f"[ERROR][MULTI] {[categorias[i] for i in filas]}: {e}")
+                yhat[filas] = np.nan
+
+        yhat_base = clamp_and_round(np.nan_to_num(yhat, nan=0.0), rnd=2)
+        # La historia avanza con la predicción base (sin ajuste de contexto)
+        hist = np.column_stack([hist, yhat_base])
+
+        if h not in horizontes:
             continue
 
-        for _, row in df_features.iterrows():
-            categoria = canon_cat(row["categoria"])
-            X = row.drop(labels=["categoria"]).to_frame().T
-            X = (
-                X.apply(pd.to_numeric, errors="coerce")
-                  .replace([np.inf, -np.inf], np.nan)
-                  .fillna(0.0)
-            )
+        yhat_final = yhat_base
+        if CONTEXTO_DISPONIBLE:
             try:
-                modelo = load_model_for_categoria(usuario_id, categoria)
-                
-                def _audit_X(X: pd.DataFrame | np.ndarray, feature_cols: list[str] | None = None, tag: str = "X"):
-                    import numpy as np, pandas as pd
-                    if isinstance(X, pd.DataFrame):
-                        print(f"[AUDIT][{tag}] DF shape={X.shape}")
-                        print(f"[AUDIT][{tag}] cols={list(X.columns)}")
-                        print(f"[AUDIT][{tag}] head(3)=\n{X.head(3)}")
-                        print(f"[AUDIT][{tag}] NaN total={int(X.isna().sum().sum())}")
-                        ninf = np.isinf(X.values).sum()
-                        print(f"[AUDIT][{tag}] Inf total={int(ninf)}")
-                        sample_cols = list(X.columns[:5])
-                        print(f"[AUDIT][{tag}] describe({sample_cols})=\n{X[sample_cols].describe()}")
-                    else:
-                        arr = np.asarray(X)
-                        print(f"[AUDIT][{tag}] ND shape={arr.shape}")
-                        print(f"[AUDIT][{tag}] NaN={int(np.isnan(arr).sum())} Inf={int(np.isinf(arr).sum())}")
-                        if feature_cols:
-                            print(f"[AUDIT][{tag}] feature_cols(len={len(feature_cols)}): {feature_cols[:10]}...")
-
-                feature_cols = getattr(modelo, "feature_names_in_", None)
-                if feature_cols is not None:
-                    X = X.reindex(columns=list(feature_cols), fill_value=0.0)
-                _audit_X(X, feature_cols, tag=f"{fecha_pred.date()}_X") # <--- CAMBIO de tag
-                
-                pred = modelo.predict(X)
-                yhat_raw = float(pred[0]) if isinstance(pred, (list, tuple, np.ndarray)) else float(pred)
-                yhat_base = float(clamp_and_round(max(yhat_raw, 0.0), rnd=2))
-                if CONTEXTO_DISPONIBLE and yhat_base > 0:
-                    try:
-                        dia_semana = fecha_pred.weekday()
-                        yhat_ajustada = ajustar_prediccion_con_contexto(
-                            prediccion_base=yhat_base,
-                            dia_semana=dia_semana,
-                            usuario_id=usuario_id,
-                            motivo_esperado=None
-                        )
-                        
-                        if abs(yhat_ajustada - yhat_base) > 1.0:  # Solo log si hay cambio significativo
-                            print(f"[CONTEXTO] {categoria}: {yhat_base:.0f} → {yhat_ajustada:.0f} min")
-                        
-                        yhat = yhat_ajustada
-                    except Exception as e:
-                        print(f"[CONTEXTO][ERROR] {categoria}: {e}")
-                        yhat = yhat_base
-                else:
-                    yhat = yhat_base
+                # El ajuste de contexto es multiplicativo: un factor por día para todas las categorías
+                factor = float(ajustar_prediccion_con_contexto(
+                    prediccion_base=1.0, dia_semana=fecha_pred.weekday(),
+                    usuario_id=usuario_id, motivo_esperado=None,
+                ))
+                yhat_final = yhat_base * factor
+                if abs(factor - 1.0) > 1e-9:
+                    print(f"[CONTEXTO] {fecha_pred}: factor {factor:.3f}")
             except Exception as e:
-                print(f"[ERROR][MULTI] {categoria}: {e}")
-                continue
+                print(f"[CONTEXTO][ERROR] {fecha_pred}: {e}")
 
-            all_preds.append({
-                "usuario_id": usuario_id,
-                "fecha_pred": fecha_pred.date().isoformat(),
-                "horizonte": f"T+{h}",
-                "categoria": categoria,
-                "yhat_minutos": yhat, 
-                "modelo": modelo.__class__.__name__,
-            })
-
-    if all_preds:
-        df_out = pd.DataFrame(all_preds)
-        guardar_predicciones(df_out, usuario_id=usuario_id, tipo="multi") 
-        return df_out
-    else:
+        valido = ~np.isnan(yhat)
+        all_preds.append(pd.DataFrame({
+            "usuario_id": usuario_id,
+            "fecha_pred": fecha_pred.isoformat(),
+            "horizonte": f"T+{h}",
+            "categoria": np.asarray(categorias, dtype=object)[valido],
+            "yhat_minutos": yhat_final[valido],
+            "modelo": nombre_modelo[valido],
+        }))
+
+    df_out = pd.concat(all_preds, ignore_index=True) if all_preds else pd.DataFrame()
+    if df_out.empty:
         print(f"[ML][MULTI] No se generaron predicciones para usuario={usuario_id}")
         return pd.DataFrame()
 
+    print(f"[ML][MULTI] user={usuario_id} base={fecha_base} horizontes={horizontes} "
+          f"categorias={len(categorias)} modelos={sum(m is not None for m, _ in modelos)} filas={len(df_out)}")
+    guardar_predicciones(df_out, usuario_id=usuario_id, tipo="multi")
+    return df_out
+
 def main():
     _bootstrap_flask_context()
     parser = argparse.ArgumentParser(description="Pipeline V3.1 (train/predict/train_cat)")
@@ -629,27 +682,44 @@ if SELECTOR_FILE.exists():
 else:
     MODEL_SELECTOR = {}
 
+def _rutas_modelo_categoria(usuario_id: int, categoria: str) -> tuple:
+    """
+    Artefactos candidatos (existentes) para la categoría, en orden de preferencia:
+    ml/artifacts/usuario_X/<categoria>/compact_<categoria>.npz o rf_<categoria>.joblib
+    (el entrenamiento deja solo uno de los dos) y luego el global.
+    Tupla vacía = BaselineHybrid.
+    """
+    categoria_norm = categoria.lower().replace(" ", "_")
+    candidatas = (
+        Path("ml/artifacts") / f"usuario_{usuario_id}" / categoria_norm / f"compact_{categoria_norm}.npz",
+        Path("ml/artifacts") / f"usuario_{usuario_id}" / categoria_norm / f"rf_{categoria_norm}.joblib",
+        Path("ml/artifacts") / categoria_norm / f"rf_{categoria_norm}.joblib",
+    )
+    return tuple(p for p in candidatas if p.is_file())
+
+
+def _cargar_modelo(rutas: tuple, usuario_id: int, etiqueta: str):
+    """Carga el primer artefacto legible de `rutas`; None si ninguno (→ baseline)."""
+    for i, file in enumerate(rutas):
+        try:
+            if i == 0 and f"usuario_{usuario_id}" in file.parts:
+                print(f"[MODEL][user={usuario_id}][{etiqueta}] Cargando desde {file}")
+            else:
+                print(f"[MODEL][{etiqueta}] ⚠️ Usando modelo GLOBAL (migrar a por usuario)")
+            return model_cache.cargar(file, usuario_id, etiqueta)
+        except Exception as e:
+            print(f"[MODEL][ERR] No se pudo cargar {file}: {e}")
+    return None
+
+
 def get_model_for_categoria(usuario_id: int, categoria: str):
     """
     Carga modelo POR USUARIO.
     Busca en: ml/artifacts/usuario_X/<categoria>/rf_<categoria>.joblib
     """
-    categoria_norm = categoria.lower().replace(" ", "_")
-    base_dir = Path("ml/artifacts") / f"usuario_{usuario_id}" / categoria_norm
-    
-    if base_dir.exists() and base_dir.is_dir():
-        for file in base_dir.glob(f"rf_{categoria_norm}.joblib"):
-            try:
-                print(f"[MODEL][user={usuario_id}][{categoria}] Cargando desde {file}")
-                return joblib.load(file)
-            except Exception as e:
-                print(f"[MODEL][ERR] No se pudo cargar {file}: {e}")
-
-    # Fallback a modelo global (solo para migración)
-    global_path = Path("ml/artifacts") / categoria_norm / f"rf_{categoria_norm}.joblib"
-    if global_path.exists():
-        print(f"[MODEL][{categoria}] ⚠️ Usando modelo GLOBAL (migrar a por usuario)")
-        return joblib.load(global_path)
+    modelo = _cargar_modelo(_rutas_modelo_categoria(usuario_id, categoria), usuario_id, categoria)
+    if modelo is not None:
+        return modelo
 
     print(f"[MODEL][user={usuario_id}][{categoria}] Usando BaselineHybrid (fallback)")
     return BaselineHybrid()
@@ -697,6 +767,69 @@ def predict_categoria(usuario_id: int, categoria: str, features, df_hist=None) -
 
     return float(yhat[0]) if hasattr(yhat, "__len__") else float(yhat)
 
+VALID_FEATS = ['min_t-1', 'min_t-2', 'min_t-3', 'min_t-7', 'MA7', 'dow', 'is_weekend', 'day', 'days_to_eom']
+
+
+def _baseline_por_categoria(df_hist: pd.DataFrame) -> dict:
+    """
+    BaselineHybrid para todas las categorías de una vez: media de los últimos 7
+    valores + 0.5 * tendencia ((último - primero) / (n - 1)), recortada a 0.
+    """
+    if df_hist is None or df_hist.empty:
+        return {}
+    h = pd.DataFrame({
+        "categoria": df_hist["categoria"].to_numpy(),
+        "minutos": pd.to_numeric(df_hist["minutos"], errors="coerce").to_numpy(dtype=float),
+    })
+    g = h.groupby("categoria", sort=False).tail(7).dropna().groupby("categoria", sort=False)["minutos"]
+    agg = g.agg(["mean", "first", "last", "count"])
+    trend = np.where(agg["count"] > 1, (agg["last"] - agg["first"]) / (agg["count"] - 1).clip(lower=1), 0.0)
+    yhat = np.maximum(agg["mean"].to_numpy() + 0.5 * trend, 0.0)
+    return dict(zip(agg.index, yhat))
+
+
+def predecir_lote(usuario_id: int, latest: pd.DataFrame, df_hist: pd.DataFrame | None = None) -> np.ndarray:
+    """
+    Predicción de todas las categorías de `latest` (una fila por categoría, ver
+    latest_X_per_categoria). Agrupa las categorías por artefacto, carga cada
+    modelo una vez y llama a .predict una vez por modelo sobre la matriz apilada;
+    las categorías sin artefacto usan BaselineHybrid calculado en bloque sobre
+    df_hist. Devuelve yhat alineado con las filas de `latest`.
+    """
+    n = len(latest)
+    yhat = np.zeros(n, dtype=float)
+    if n == 0:
+        return yhat
+
+    categorias = [canon_cat(c) for c in latest["categoria"]]
+    X = latest.reindex(columns=VALID_FEATS).to_numpy(dtype=float)
+
+    grupos = {}
+    for i, cat in enumerate(categorias):
+        grupos.setdefault(_rutas_modelo_categoria(usuario_id, cat), []).append(i)
+
+    sin_modelo, cargados = [], 0
+    for rutas, filas in grupos.items():
+        modelo = _cargar_modelo(rutas, usuario_id, categorias[filas[0]]) if rutas else None
+        if modelo is None:
+            sin_modelo.extend(filas)
+            continue
+
+        cargados += 1
+        Xg = pd.DataFrame(X[filas], columns=VALID_FEATS)
+        if hasattr(modelo, "feature_names_in_"):
+            Xg = Xg.reindex(columns=list(modelo.feature_names_in_), fill_value=0.0)
+        yhat[filas] = np.asarray(modelo.predict(Xg), dtype=float).reshape(-1)
+
+    if sin_modelo:
+        base = _baseline_por_categoria(df_hist)
+        yhat[sin_modelo] = [base.get(categorias[i], 0.0) for i in sin_modelo]
+        print(f"[BASELINE] user={usuario_id}: {len(sin_modelo)} categorías sin artefacto → BaselineHybrid")
+
+    print(f"[PREDICT][user={usuario_id}] {n} categorías, {cargados} modelos cargados")
+    return yhat
+
+
 def build_model_selector(usuario_id: int):
     """
     Construye model_selector.json POR USUARIO
@@ -713,7 +846,7 @@ def build_model_selector(usuario_id: int):
     for cat_dir in base_dir.iterdir():
         if cat_dir.is_dir():
             categoria = cat_dir.name
-            for model_file in cat_dir.glob("rf_*.joblib"):
+            for model_file in [*cat_dir.glob("compact_*.npz"), *cat_dir.glob("rf_*.joblib")]:
                 selector[categoria] = str(model_file.relative_to(ARTIF_DIR))
                 break
     
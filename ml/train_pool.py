@@ -0,0 +1,190 @@
+"""
+Entrenamiento RF por (usuario, categoría) repartido en un pool de procesos.
+
+- El proceso llamador lee la BD y arma las matrices (make_lagged); a los workers
+  solo viajan arreglos, así no crean la app ni abren conexiones.
+- Cada fit recibe n_estimators según sus filas y n_jobs según cuántos fits haya
+  en paralelo: con muchos fits pequeños, 1 hilo por fit y un fit por core.
+- Los fits se envían de mayor a menor y cada worker escribe su artefacto y su
+  metrics.json al terminar (escritura atómica vía ml.model_cache).
+- ML_MODELO_COMPACTO: en lugar del RFReg de 400 árboles se guarda
+  compact_<cat>.npz elegido por validación (ml/models/compact.py).
+- Resumen: tiempo de pared, CPU total de los fits y utilización de cores.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import numpy as np
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+def _cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _config(nombre, defecto):
+    try:
+        from flask import current_app
+        return current_app.config.get(nombre, defecto)
+    except Exception:
+        return os.environ.get(nombre, defecto)
+
+
+def _workers() -> int:
+    return int(_config("ML_TRAIN_WORKERS", 0) or 0) or _cores()
+
+
+def arboles_por_filas(n_filas: int) -> int:
+    """Series cortas no ganan nada con 400 árboles."""
+    if n_filas >= 120:
+        return 400
+    if n_filas >= 45:
+        return 200
+    return 100
+
+
+# ----------------------------------------------------------------------
+# Worker
+# ----------------------------------------------------------------------
+def _fit_categoria(tarea: dict) -> dict:
+    """Entrena, guarda rf_<cat>.joblib (o compact_<cat>.npz) + metrics.json y devuelve métricas y tiempos."""
+    import pandas as pd
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    from ml.estimators import RFReg
+    from ml import model_cache
+
+    t0, c0 = time.perf_counter(), time.process_time()
+    Xtr = pd.DataFrame(tarea["X"], columns=tarea["cols"]).astype(float)
+    ytr = np.asarray(tarea["y"], dtype=float)
+
+    outdir = Path(tarea["outdir"])
+    outdir.mkdir(parents=True, exist_ok=True)
+    seleccion = None
+    if tarea.get("compacto"):
+        from ml.models.compact import ajustar_compacto
+        rf, seleccion = ajustar_compacto(tarea["X"], ytr, tarea["cols"], n_jobs=tarea["n_jobs"])
+        artifact_path = outdir / f"compact_{tarea['cat_name']}.npz"
+        obsoleto = outdir / f"rf_{tarea['cat_name']}.joblib"
+    else:
+        rf = RFReg(n_estimators=tarea["n_estimators"], n_jobs=tarea["n_jobs"])
+        rf.fit(Xtr, ytr)
+        rf.feature_names_in_ = list(Xtr.columns)
+        artifact_path = outdir / f"rf_{tarea['cat_name']}.joblib"
+        obsoleto = outdir / f"compact_{tarea['cat_name']}.npz"
+    model_cache.guardar_atomico(rf, artifact_path)
+    # Un solo formato por categoría: la predicción no debe tomar el artefacto viejo
+    obsoleto.unlink(missing_ok=True)
+    model_cache.invalidar(obsoleto)
+
+    ypred = rf.predict(Xtr)
+    mse = float(mean_squared_error(ytr, ypred))
+    metrics = {
+        "MAE": float(mean_absolute_error(ytr, ypred)),
+        "RMSE": float(np.sqrt(mse)),
+        "R2": float(r2_score(ytr, ypred)),
+    }
+    if seleccion is not None:
+        metrics["compacto"] = seleccion
+    model_cache.escribir_json_atomico(metrics, outdir / "metrics.json")
+
+    return {
+        "usuario_id": tarea["usuario_id"],
+        "categoria": tarea["categoria"],
+        "artifact_path": str(artifact_path),
+        "metrics": metrics,
+        "filas": int(len(ytr)),
+        "n_estimators": tarea["n_estimators"],
+        "n_jobs": tarea["n_jobs"],
+        "wall_s": time.perf_counter() - t0,
+        "cpu_s": time.process_time() - c0,
+    }
+
+
+# ----------------------------------------------------------------------
+# Pool
+# ----------------------------------------------------------------------
+def _obtener_pool(n: int):
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def entrenar(tareas: list, al_terminar=None) -> dict:
+    """
+    tareas: dicts con usuario_id, categoria, cat_name, outdir, X (float32), y, cols.
+    Completa n_estimators / n_jobs, reparte en el pool y llama a
+    al_terminar(resultado) a medida que cada fit termina.
+    """
+    workers = _workers()
+    cores = _cores()
+    n_paralelo = max(1, min(workers, len(tareas)))
+    hilos = max(1, cores // n_paralelo)
+    compacto = str(_config("ML_MODELO_COMPACTO", False)).lower() in ("1", "true", "yes")
+    for t in tareas:
+        t["n_estimators"] = arboles_por_filas(len(t["y"]))
+        t["n_jobs"] = hilos
+        t["compacto"] = compacto
+
+    # Los más grandes primero: el último fit en terminar no es uno largo que empezó tarde
+    tareas = sorted(tareas, key=lambda t: len(t["y"]) * t["n_estimators"], reverse=True)
+
+    t0 = time.perf_counter()
+    resultados, errores = [], []
+    if tareas:
+        pool = _obtener_pool(workers)
+        futuros = {pool.submit(_fit_categoria, t): t for t in tareas}
+        for fut in as_completed(futuros):
+            t = futuros[fut]
+            try:
+                res = fut.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _descartar_pool()
+                print(f"[TRAIN][ERR] user={t['usuario_id']} {t['categoria']} → {e}")
+                errores.append({"usuario_id": t["usuario_id"], "categoria": t["categoria"], "error": str(e)})
+                continue
+            resultados.append(res)
+            print(f"[TRAIN][OK] user={res['usuario_id']} {res['categoria']} filas={res['filas']} "
+                  f"árboles={res['n_estimators']} n_jobs={res['n_jobs']} {res['wall_s']:.2f}s → {res['artifact_path']}")
+            if al_terminar is not None:
+                al_terminar(res)
+
+    wall = time.perf_counter() - t0
+    cpu = sum(r["cpu_s"] for r in resultados)
+    resumen = {
+        "fits": len(resultados),
+        "errores": errores,
+        "workers": n_paralelo,
+        "n_jobs_por_fit": hilos,
+        "cores": cores,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "utilizacion": round(cpu / (wall * cores), 3) if wall > 0 else 0.0,
+        "resultados": resultados,
+    }
+    print(f"[TRAIN] lote: {resumen['fits']} fits ({len(errores)} errores) en {resumen['workers']} workers × "
+          f"{hilos} hilos, pared={resumen['wall_s']}s cpu={resumen['cpu_s']}s "
+          f"utilización={resumen['utilizacion']:.0%} de {cores} cores")
+    return resumen
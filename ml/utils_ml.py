@@ -116,9 +116,8 @@ def clasificar_dominio_automatico(dominio, usuario_id):
     """
     # Imports dentro de función para evitar circular imports
     from app import db
-    from app.models.models import Categoria, PatronCategoria, DominioCategoria
+    from app.models.models import Categoria, DominioCategoria
     from app.models.models_coach import NotificacionClasificacion
-    import re
     
     print(f"[CLASIFICACIÓN] Procesando: {dominio} (usuario {usuario_id})")
     
@@ -128,18 +127,15 @@ def clasificar_dominio_automatico(dominio, usuario_id):
     necesita_clasificacion_manual = False
     
     try:
-        patrones_usuario = PatronCategoria.query.filter_by(
-            usuario_id=usuario_id,
-            activo=True
-        ).all()
-        
-        for patron_obj in patrones_usuario:
-            if re.search(patron_obj.patron, dominio, re.IGNORECASE):
-                print(f"[PATRON] ✅ Match: '{patron_obj.patron}' → categoría {patron_obj.categoria_id}")
-                categoria_id = patron_obj.categoria_id
-                confianza = 0.85
-                metodo = 'patron'
-                break
+        from app.services.categoria_cache import matcher_patrones
+
+        match = matcher_patrones(usuario_id).buscar(dominio)
+        if match:
+            patron_cat_id, _, patron = match
+            print(f"[PATRON] ✅ Match: '{patron}' → categoría {patron_cat_id}")
+            categoria_id = patron_cat_id
+            confianza = 0.85
+            metodo = 'patron'
     except Exception as e:
         print(f"[PATRON][ERROR] {e}")
     
@@ -237,6 +233,8 @@ def clasificar_dominio_automatico(dominio, usuario_id):
                 print(f"[BD]  Creado: {dominio} → categoría {categoria_id} (usuario {usuario_id})")
             
             db.session.commit()
+            from app.services.categoria_cache import invalidar_dominio
+            invalidar_dominio(usuario_id, dominio)
             
         except Exception as e:
             db.session.rollback()
@@ -0,0 +1,88 @@
+"""
+Benchmark: agregación de features por fila (ruta anterior) vs set-based (pandas).
+
+Genera registros sintéticos de un usuario-día y compara:
+  - tiempo de categorización + agregación en memoria
+  - viajes a la BD estimados por cada ruta
+
+Uso:
+    python -m scripts.bench_features_engine --filas 20000 --dominios 300 --repeticiones 5
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from app.services.features_engine import agregar_registros, _categorizar, _canon_cat, dominio_base
+
+Fila = namedtuple("Fila", "dominio tiempo fecha_hora")
+CATEGORIAS = ["Productividad", "Ocio", "Redes sociales", "Estudio", "Herramientas", "Noticias"]
+
+
+def generar(filas, n_dominios, dia, semilla=7):
+    rnd = random.Random(semilla)
+    dominios = [f"sitio{i}.com" if i % 3 else f"https://www.blog.sitio{i}.com.mx/ruta" for i in range(n_dominios)]
+    # ~80 % de dominios conocidos, el resto cae en "Sin categoría"
+    mapa = {dominio_base(d): CATEGORIAS[i % len(CATEGORIAS)] for i, d in enumerate(dominios[: int(n_dominios * 0.8)])}
+    inicio = datetime.combine(dia, datetime.min.time())
+    registros = [
+        Fila(rnd.choice(dominios), rnd.randint(1, 600), inicio + timedelta(seconds=rnd.randint(0, 86399)))
+        for _ in range(filas)
+    ]
+    return registros, mapa
+
+
+def agregar_legacy(registros, mapa, patrones):
+    """Copia del bucle anterior de calcular_persistir_features (sin la parte ORM)."""
+    acc_diario, acc_hora = {}, {}
+    for r in registros:
+        cat = _canon_cat(_categorizar(r.dominio or "", mapa, patrones))
+        seg = max(0, int(r.tiempo or 0))
+        h = r.fecha_hora.hour if r.fecha_hora else 0
+        acc_diario[cat] = acc_diario.get(cat, 0) + seg
+        acc_hora[(h, cat)] = acc_hora.get((h, cat), 0) + seg
+    return acc_diario, acc_hora
+
+
+def cronometrar(fn, repeticiones):
+    mejores = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        res = fn()
+        mejores.append(time.perf_counter() - t0)
+    return min(mejores) * 1000.0, res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--filas", type=int, default=20000)
+    ap.add_argument("--dominios", type=int, default=300)
+    ap.add_argument("--repeticiones", type=int, default=5)
+    args = ap.parse_args()
+
+    dia = date.today()
+    registros, mapa = generar(args.filas, args.dominios, dia)
+    df = pd.DataFrame.from_records(registros, columns=Fila._fields)
+
+    ms_old, (diario, hora) = cronometrar(lambda: agregar_legacy(registros, mapa, []), args.repeticiones)
+    ms_new, (por_cat, por_hora) = cronometrar(lambda: agregar_registros(df, mapa, []), args.repeticiones)
+
+    assert diario == {k: int(v) for k, v in por_cat.items()}, "diario no coincide"
+    assert hora == {k: int(v) for k, v in por_hora.items()}, "horario no coincide"
+
+    # Viajes estimados: legacy = 1 SELECT + SELECT por (cat) x2 + SELECT por (hora,cat) + flush fila a fila
+    n_cat, n_hora = len(diario), len(hora)
+    viajes_old = 1 + 2 * n_cat + n_hora + (2 * n_cat + n_hora)
+    viajes_new = 1 + 3
+
+    print(f"[BENCH] filas={args.filas} dominios={args.dominios} categorias={n_cat} hora×cat={n_hora}")
+    print(f"[BENCH] agregación por fila : {ms_old:8.2f} ms")
+    print(f"[BENCH] agregación set-based: {ms_new:8.2f} ms  (x{ms_old / ms_new:.1f})")
+    print(f"[BENCH] viajes a BD estimados: {viajes_old} → {viajes_new}")
+
+
+if __name__ == "__main__":
+    main()
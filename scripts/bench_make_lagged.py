@@ -0,0 +1,98 @@
+"""
+Benchmark: make_lagged anterior (groupby + lambda por grupo) vs calendario denso vectorizado.
+
+Escenarios:
+  - 1 usuario con 50 categorías × 365 días
+  - 1,000 usuarios (categorías × días configurables)
+
+Con series sin huecos ambas rutas deben dar lo mismo (se verifica). Con huecos
+(--huecos > 0) la ruta nueva rellena con 0 los días faltantes, así que solo se
+cronometra.
+
+Uso:
+    python -m scripts.bench_make_lagged --usuarios 1000 --categorias 10 --dias 180 --repeticiones 3
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ml.features import make_lagged, build_lagged_matrix
+
+COLS = ["min_t-1", "min_t-2", "min_t-3", "min_t-7", "MA7", "dow", "is_weekend", "day", "days_to_eom"]
+
+
+def generar(usuarios, categorias, dias, huecos=0.0, semilla=7):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range(end=pd.Timestamp.today().normalize() - pd.Timedelta(days=1), periods=dias).date
+    n = usuarios * categorias * dias
+    df = pd.DataFrame({
+        "usuario_id": np.repeat(np.arange(1, usuarios + 1), categorias * dias),
+        "categoria": np.tile(np.repeat([f"Categoria {c}" for c in range(categorias)], dias), usuarios),
+        "fecha": np.tile(fechas, usuarios * categorias),
+        "minutos": rng.integers(0, 240, n).astype(float),
+    })
+    if huecos > 0:
+        df = df.loc[rng.random(n) >= huecos].reset_index(drop=True)
+    return df
+
+
+def make_lagged_legacy(df, lags=(1, 2, 3, 7), ma_windows=(7,)):
+    """Copia de la implementación anterior de ml.features.make_lagged."""
+    d = df.sort_values(["usuario_id", "categoria", "fecha"]).copy()
+    dt = pd.to_datetime(d["fecha"])
+    d["dow"] = dt.dt.weekday
+    d["is_weekend"] = (d["dow"] >= 5).astype(int)
+    d["day"] = dt.dt.day
+    d["days_to_eom"] = dt.dt.daysinmonth - d["day"]
+    g = d.groupby(["usuario_id", "categoria"], group_keys=False)
+    for L in lags:
+        d[f"min_t-{L}"] = g["minutos"].shift(L)
+    for W in ma_windows:
+        d[f"MA{W}"] = g["minutos"].transform(lambda s: s.shift(1).rolling(W, min_periods=1).mean())
+    return d.dropna(subset=["min_t-1"])
+
+
+def cronometrar(fn, repeticiones):
+    mejores = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        res = fn()
+        mejores.append(time.perf_counter() - t0)
+    return min(mejores) * 1000.0, res
+
+
+def escenario(nombre, usuarios, categorias, dias, huecos, repeticiones):
+    df = generar(usuarios, categorias, dias, huecos)
+    ms_old, viejo = cronometrar(lambda: make_lagged_legacy(df), repeticiones)
+    ms_df, nuevo = cronometrar(lambda: make_lagged(df), repeticiones)
+    ms_mat, (X, index, _) = cronometrar(lambda: build_lagged_matrix(df), repeticiones)
+
+    if huecos == 0:
+        assert len(viejo) == len(nuevo), "número de filas no coincide"
+        np.testing.assert_allclose(nuevo[COLS].to_numpy(float), viejo[COLS].to_numpy(float),
+                                   rtol=1e-5, equal_nan=True, err_msg="features no coinciden")
+
+    print(f"[BENCH] {nombre}: usuarios={usuarios} categorias={categorias} dias={dias} "
+          f"huecos={huecos:.0%} filas={len(df)} → X={X.shape} ({X.nbytes / 1e6:.1f} MB float32)")
+    print(f"[BENCH]   groupby + lambda   : {ms_old:9.1f} ms")
+    print(f"[BENCH]   make_lagged (df)   : {ms_df:9.1f} ms  (x{ms_old / ms_df:.1f})")
+    print(f"[BENCH]   build_lagged_matrix: {ms_mat:9.1f} ms  (x{ms_old / ms_mat:.1f})")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--usuarios", type=int, default=1000)
+    ap.add_argument("--categorias", type=int, default=10)
+    ap.add_argument("--dias", type=int, default=180)
+    ap.add_argument("--huecos", type=float, default=0.0, help="fracción de días sin fila (0-1)")
+    ap.add_argument("--repeticiones", type=int, default=3)
+    args = ap.parse_args()
+
+    escenario("1 usuario", 1, 50, 365, args.huecos, args.repeticiones)
+    escenario("multiusuario", args.usuarios, args.categorias, args.dias, args.huecos, args.repeticiones)
+
+
+if __name__ == "__main__":
+    main()
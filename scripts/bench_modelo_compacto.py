@@ -0,0 +1,104 @@
+"""
+Benchmark: RF joblib actual (RFReg, 400 árboles) vs artefacto compacto (.npz).
+
+Genera series diarias sintéticas por categoría (~180 días), arma features con
+make_lagged y compara por categoría:
+  - tamaño en disco
+  - tiempo de carga (joblib.load vs ml.models.compact.cargar)
+  - latencia de inferencia (1 fila y lote)
+  - MAE en los últimos 7 días (holdout)
+
+Uso:
+    python -m scripts.bench_modelo_compacto --categorias 10 --dias 180 --repeticiones 20
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from ml.estimators import RFReg
+from ml.features import make_lagged, get_feature_cols, split_train_holdout
+from ml.models import compact
+
+
+def generar(categorias, dias, semilla=7):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range(end=pd.Timestamp.today().normalize() - pd.Timedelta(days=1), periods=dias)
+    filas = []
+    for c in range(categorias):
+        base = rng.uniform(10, 180)
+        semanal = base * rng.uniform(0.1, 0.6) * np.sin(2 * np.pi * fechas.dayofweek / 7)
+        y = np.clip(base + semanal + rng.normal(0, base * 0.25, dias), 0, None)
+        filas.append(pd.DataFrame({"usuario_id": 1, "categoria": f"Categoria {c}", "fecha": fechas.date, "minutos": y}))
+    return pd.concat(filas, ignore_index=True)
+
+
+def cronometrar(fn, repeticiones):
+    mejores = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        res = fn()
+        mejores.append(time.perf_counter() - t0)
+    return min(mejores) * 1000.0, res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--categorias", type=int, default=10)
+    ap.add_argument("--dias", type=int, default=180)
+    ap.add_argument("--repeticiones", type=int, default=20)
+    args = ap.parse_args()
+
+    df = generar(args.categorias, args.dias)
+    tot = {k: [] for k in ("disco_rf", "disco_c", "carga_rf", "carga_c", "uno_rf", "uno_c", "lote_rf", "lote_c", "mae_rf", "mae_c")}
+    elegidos = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for cat, sub in df.groupby("categoria"):
+            d = make_lagged(sub)
+            cols = get_feature_cols(d)
+            tr, te = split_train_holdout(d, holdout_days=7)
+            Xtr, ytr, Xte, yte = tr[cols].astype(float), tr["minutos"].to_numpy(), te[cols].astype(float), te["minutos"].to_numpy()
+
+            rf = RFReg(n_jobs=1).fit(Xtr, ytr)
+            rf.feature_names_in_ = cols
+            p_rf = Path(tmp) / f"rf_{cat}.joblib"
+            joblib.dump(rf, p_rf)
+
+            modelo_c, sel = compact.ajustar_compacto(Xtr.to_numpy(np.float32), ytr, cols)
+            elegidos[sel["elegido"]] = elegidos.get(sel["elegido"], 0) + 1
+            p_c = Path(tmp) / f"compact_{cat}.npz"
+            with open(p_c, "wb") as f:
+                compact.guardar(modelo_c, f)
+
+            ms, rf_l = cronometrar(lambda: joblib.load(p_rf), args.repeticiones)
+            tot["carga_rf"].append(ms)
+            ms, c_l = cronometrar(lambda: compact.cargar(p_c), args.repeticiones)
+            tot["carga_c"].append(ms)
+
+            uno = Xte.iloc[[-1]]
+            tot["uno_rf"].append(cronometrar(lambda: rf_l.predict(uno), args.repeticiones)[0])
+            tot["uno_c"].append(cronometrar(lambda: c_l.predict(uno), args.repeticiones)[0])
+            tot["lote_rf"].append(cronometrar(lambda: rf_l.predict(Xte), args.repeticiones)[0])
+            tot["lote_c"].append(cronometrar(lambda: c_l.predict(Xte), args.repeticiones)[0])
+
+            tot["disco_rf"].append(p_rf.stat().st_size)
+            tot["disco_c"].append(p_c.stat().st_size)
+            tot["mae_rf"].append(float(np.mean(np.abs(rf_l.predict(Xte) - yte))))
+            tot["mae_c"].append(float(np.mean(np.abs(c_l.predict(Xte) - yte))))
+
+    m = {k: float(np.mean(v)) for k, v in tot.items()}
+    print(f"[BENCH] categorias={args.categorias} dias={args.dias} elegidos={elegidos}")
+    print(f"[BENCH] disco/categoría   : RF {m['disco_rf'] / 1024:9.1f} KB | compacto {m['disco_c'] / 1024:8.1f} KB  (x{m['disco_rf'] / m['disco_c']:.0f})")
+    print(f"[BENCH] carga             : RF {m['carga_rf']:9.2f} ms | compacto {m['carga_c']:8.2f} ms  (x{m['carga_rf'] / m['carga_c']:.0f})")
+    print(f"[BENCH] predicción 1 fila : RF {m['uno_rf']:9.2f} ms | compacto {m['uno_c']:8.2f} ms")
+    print(f"[BENCH] predicción holdout: RF {m['lote_rf']:9.2f} ms | compacto {m['lote_c']:8.2f} ms")
+    print(f"[BENCH] MAE holdout (7d)  : RF {m['mae_rf']:9.2f}    | compacto {m['mae_c']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
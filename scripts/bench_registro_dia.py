@@ -0,0 +1,166 @@
+"""
+Benchmark: filtros por día con DATE(fecha) vs columna generada `dia` + índices.
+
+Crea dos tablas de prueba con el mismo contenido sembrado:
+  - registro_bench_antes  : esquema actual (solo KEY usuario_id)
+  - registro_bench_despues: con `dia` STORED + índices de 04_migracion_registro_dia.sql
+y ejecuta las consultas calientes en su forma anterior y en la nueva.
+
+No toca la tabla `registro`. Usa las mismas variables de entorno que get_mysql().
+
+Uso:
+    python -m scripts.bench_registro_dia --usuarios 50 --dias 120 --filas-dia 400
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+
+T_ANTES = "registro_bench_antes"
+T_DESPUES = "registro_bench_despues"
+
+DDL_ANTES = f"""
+CREATE TABLE {T_ANTES} (
+  id int NOT NULL AUTO_INCREMENT,
+  dominio varchar(255) DEFAULT NULL,
+  tiempo int DEFAULT NULL,
+  fecha datetime DEFAULT NULL,
+  fecha_hora datetime DEFAULT NULL,
+  usuario_id int DEFAULT NULL,
+  PRIMARY KEY (id),
+  KEY usuario_id (usuario_id)
+) ENGINE=InnoDB
+"""
+
+DDL_DESPUES = f"""
+CREATE TABLE {T_DESPUES} (
+  id int NOT NULL AUTO_INCREMENT,
+  dominio varchar(255) DEFAULT NULL,
+  tiempo int DEFAULT NULL,
+  fecha datetime DEFAULT NULL,
+  fecha_hora datetime DEFAULT NULL,
+  usuario_id int DEFAULT NULL,
+  dia DATE GENERATED ALWAYS AS (DATE(COALESCE(fecha_hora, fecha))) STORED,
+  PRIMARY KEY (id),
+  KEY usuario_id (usuario_id),
+  KEY ix_registro_usuario_dia_dominio (usuario_id, dia, dominio),
+  KEY ix_registro_usuario_fecha_hora (usuario_id, fecha_hora)
+) ENGINE=InnoDB
+"""
+
+# (nombre, sql_antes, sql_despues) — parámetros: usuario_id, hoy, inicio
+CONSULTAS = [
+    ("uso_hoy",
+     "SELECT SUM(tiempo) FROM {t} WHERE usuario_id = %(u)s AND DATE(fecha) = %(hoy)s",
+     "SELECT SUM(tiempo) FROM {t} WHERE usuario_id = %(u)s AND dia = %(hoy)s"),
+    ("uso_hoy_por_dominio",
+     "SELECT dominio, SUM(tiempo) FROM {t} WHERE usuario_id = %(u)s AND DATE(fecha) = %(hoy)s GROUP BY dominio",
+     "SELECT dominio, SUM(tiempo) FROM {t} WHERE usuario_id = %(u)s AND dia = %(hoy)s GROUP BY dominio"),
+    ("hubo_uso_dia",
+     "SELECT COUNT(*) FROM {t} WHERE usuario_id = %(u)s AND DATE(fecha) = %(hoy)s",
+     "SELECT COUNT(*) FROM {t} WHERE usuario_id = %(u)s AND dia = %(hoy)s"),
+    ("serie_30_dias",
+     "SELECT DATE(fecha) d, SUM(tiempo) FROM {t} WHERE usuario_id = %(u)s "
+     "AND DATE(fecha) >= %(inicio)s AND DATE(fecha) < %(hoy)s GROUP BY DATE(fecha)",
+     "SELECT dia, SUM(tiempo) FROM {t} WHERE usuario_id = %(u)s "
+     "AND dia >= %(inicio)s AND dia < %(hoy)s GROUP BY dia"),
+    ("dias_distintos",
+     "SELECT COUNT(DISTINCT DATE(fecha)) FROM {t} WHERE usuario_id = %(u)s",
+     "SELECT COUNT(DISTINCT dia) FROM {t} WHERE usuario_id = %(u)s"),
+]
+
+
+def conectar():
+    return mysql.connector.connect(
+        host=os.environ.get('MYSQLHOST', 'localhost'),
+        port=int(os.environ.get('MYSQLPORT', '3306')),
+        user=os.environ.get('MYSQLUSER', 'angel'),
+        password=os.environ.get('MYSQLPASSWORD', 'base'),
+        database=os.environ.get('MYSQLDATABASE', 'tiempocheck_db')
+    )
+
+
+def sembrar(cnx, usuarios, dias, filas_dia, semilla=7):
+    rnd = random.Random(semilla)
+    hoy = date.today()
+    dominios = [f"sitio{i}.com" for i in range(400)]
+    cur = cnx.cursor()
+    for t, ddl in ((T_ANTES, DDL_ANTES), (T_DESPUES, DDL_DESPUES)):
+        cur.execute(f"DROP TABLE IF EXISTS {t}")
+        cur.execute(ddl)
+
+    sql = "INSERT INTO {t} (usuario_id, dominio, tiempo, fecha, fecha_hora) VALUES (%s, %s, %s, %s, %s)"
+    total = 0
+    for u in range(1, usuarios + 1):
+        filas = []
+        for d in range(dias):
+            dia = hoy - timedelta(days=d)
+            base = datetime.combine(dia, datetime.min.time())
+            for _ in range(filas_dia):
+                fh = base + timedelta(seconds=rnd.randint(0, 86399))
+                filas.append((u, rnd.choice(dominios), rnd.randint(5, 600), dia, fh))
+        for t in (T_ANTES, T_DESPUES):
+            cur.executemany(sql.format(t=t), filas)
+        cnx.commit()
+        total += len(filas)
+    for t in (T_ANTES, T_DESPUES):
+        cur.execute(f"ANALYZE TABLE {t}")
+        cur.fetchall()
+    cur.close()
+    return total
+
+
+def medir(cnx, sql, params, repeticiones):
+    cur = cnx.cursor()
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+    cur.execute("EXPLAIN " + sql, params)
+    cols = [c[0] for c in cur.description]
+    plan = dict(zip(cols, cur.fetchone()))
+    cur.fetchall()
+    cur.close()
+    return statistics.median(tiempos), plan.get("key"), plan.get("rows")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--usuarios", type=int, default=50)
+    ap.add_argument("--dias", type=int, default=120)
+    ap.add_argument("--filas-dia", type=int, default=400)
+    ap.add_argument("--repeticiones", type=int, default=20)
+    ap.add_argument("--conservar", action="store_true", help="No borrar las tablas de prueba al final")
+    args = ap.parse_args()
+
+    cnx = conectar()
+    t0 = time.perf_counter()
+    total = sembrar(cnx, args.usuarios, args.dias, args.filas_dia)
+    print(f"[BENCH] Sembradas {total} filas por tabla en {time.perf_counter() - t0:.1f}s")
+
+    hoy = date.today()
+    params = {"u": max(1, args.usuarios // 2), "hoy": hoy, "inicio": hoy - timedelta(days=30)}
+
+    print(f"{'consulta':<22} {'antes ms':>10} {'después ms':>11} {'x':>6}  índice antes → después (filas examinadas)")
+    for nombre, sql_antes, sql_despues in CONSULTAS:
+        ms_a, key_a, rows_a = medir(cnx, sql_antes.format(t=T_ANTES), params, args.repeticiones)
+        ms_d, key_d, rows_d = medir(cnx, sql_despues.format(t=T_DESPUES), params, args.repeticiones)
+        print(f"{nombre:<22} {ms_a:>10.2f} {ms_d:>11.2f} {ms_a / ms_d if ms_d else 0:>6.1f}  "
+              f"{key_a}({rows_a}) → {key_d}({rows_d})")
+
+    if not args.conservar:
+        cur = cnx.cursor()
+        for t in (T_ANTES, T_DESPUES):
+            cur.execute(f"DROP TABLE IF EXISTS {t}")
+        cur.close()
+    cnx.close()
+
+
+if __name__ == "__main__":
+    main()
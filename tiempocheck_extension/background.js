@@ -54,22 +54,68 @@ function guardarTiempo(forzarEnvio = false) {
     }
   });
 
-  fetch("https://tiempo-check-production.up.railway.app/admin/guardar", {
-    method: "POST",
-    headers: { "Content-Type": "application/x-www-form-urlencoded" },
-    credentials: "include",
-    body: new URLSearchParams({
-      dominio: dominioActual,
-      tiempo: String(delta),
-      fecha_hora: new Date(ahora).toISOString(),
-      timezone_offset_min: String(new Date().getTimezoneOffset())
-    })
+  encolarEvento({
+    dominio: dominioActual,
+    tiempo: delta,
+    fecha_hora: new Date(ahora).toISOString()
   });
 
   tiempoAcumulado = 0;
   inicioSesion = Date.now();
 }
 
+// === COLA DE EVENTOS (envío en lote) ===
+// Los deltas se acumulan localmente y se mandan juntos a /admin/guardar_lote,
+// así el backend hace un solo INSERT y un solo commit por lote.
+const LOTE_MAX_EVENTOS = 30;
+const LOTE_INTERVALO_MS = 60000;
+let colaEventos = [];
+let envioEnCurso = false;
+
+chrome.storage.local.get("colaEventos", (result) => {
+  colaEventos = (result.colaEventos || []).concat(colaEventos);
+});
+
+function persistirCola() {
+  chrome.storage.local.set({ colaEventos });
+}
+
+function encolarEvento(evento) {
+  colaEventos.push(evento);
+  persistirCola();
+  if (colaEventos.length >= LOTE_MAX_EVENTOS) {
+    enviarLote();
+  }
+}
+
+async function enviarLote() {
+  if (envioEnCurso || colaEventos.length === 0) return;
+  envioEnCurso = true;
+
+  const lote = colaEventos.splice(0, LOTE_MAX_EVENTOS);
+  persistirCola();
+
+  try {
+    const resp = await fetch("https://tiempo-check-production.up.railway.app/admin/guardar_lote", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      credentials: "include",
+      body: JSON.stringify({
+        eventos: lote,
+        timezone_offset_min: new Date().getTimezoneOffset()
+      })
+    });
+    if (!resp.ok && resp.status >= 500) throw new Error(`HTTP ${resp.status}`);
+  } catch (err) {
+    // Se reintenta en el siguiente ciclo sin perder el orden
+    console.warn("[LOTE] Error enviando, se reintentará:", err);
+    colaEventos = lote.concat(colaEventos);
+    persistirCola();
+  } finally {
+    envioEnCurso = false;
+  }
+}
+
 // === EVENTOS DEL NAVEGADOR ===
 
 chrome.tabs.onActivated.addListener(() => {
@@ -89,13 +135,16 @@ chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
 });
 
 chrome.runtime.onSuspend.addListener(() => {
-  guardarTiempo();
+  guardarTiempo(true);
+  enviarLote();
 });
 
 setInterval(() => {
   guardarTiempo(true);
 }, 20000);
 
+setInterval(enviarLote, LOTE_INTERVALO_MS);
+
 function mostrarNotificacion(titulo, mensaje) {
   if (Notification.permission === 'granted') {
     new Notification(titulo, {